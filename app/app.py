@@ -34,18 +34,58 @@ def create_app(config_overrides: Optional[dict[str, str]] = None) -> Flask:
     db.init_app(app)
     logger.info("Database initialized")
 
+    from app.migrations import run_migrations
+    from app.models import NightlineChange
+    from app.models.status import status_registry
     from app.setup import preinitialize_statuses
 
     with app.app_context():
         try:
             db.create_all()
+            if not run_migrations():
+                # The models don't match an outdated schema, so the app must not serve requests
+                raise RuntimeError("Migrating the database schema failed")
             preinitialize_statuses()
+            NightlineChange.initialize()
+            status_registry.load()
         except OperationalError as e:
             if "table statuses already exists" in str(e):
                 pass
             else:
                 raise  # If it's another error, re-raise it
 
+    # Derive the master key for Instagram passwords once, before the worker processes are forked
+    from app.models.instagram import derive_master_key
+
+    derive_master_key(Config.ENCRYPTION_PASSWORD)
+
+    # Share the public snapshot between all worker processes and CLI commands. Otherwise a process would keep
+    # serving its cached state after another one changed the database
+    from app.sharedstate import SharedMemoryState
+    from app.snapshot import public_snapshot
+
+    with app.app_context():
+        public_snapshot.attach(SharedMemoryState(app.config["SHARED_STATE_PATH"]))
+
+    # Optionally publish the public state as static files for the reverse proxy
+    if Config.STATIC_SNAPSHOT_DIR:
+        from app.publisher import static_publisher
+
+        with app.app_context():
+            static_publisher.init_app(Config.STATIC_SNAPSHOT_DIR)
+
+    # Post and delete Instagram stories in the background
+    if app.config["INSTAGRAM_JOB_WORKER"]:
+        from app.jobs import instagram_job_worker
+
+        instagram_job_worker.init_app(app)
+
+    # Register the CLI commands
+    from app.commands import import_nightlines_command, reset_all_command
+
+    app.cli.add_command(reset_all_command)
+    app.cli.add_command(import_nightlines_command)
+
     # Create a single API instance
     api_bp = Blueprint("api", __name__)
     api = Api(
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated failures of a remote service
+
+    After 'threshold' consecutive failures the breaker opens and rejects calls for a cooldown. Once it passed,
+    a single trial call is let through (half open). Its success closes the breaker, its failure opens it again
+    with the cooldown doubled, up to 'max_cooldown' seconds. A trial call without a result is abandoned after
+    another cooldown, so the next call becomes the trial.
+
+    Breakers are kept per process, so every worker process trips its own.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown: float, max_cooldown: float) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._failures = 0
+        self._opened = 0  # Consecutive times the breaker opened, for the exponential backoff
+        self._open_until: Optional[float] = None
+        self._trial_until: Optional[float] = None  # Set while a trial call of a half open breaker is running
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """The current state of the breaker"""
+        if self._open_until is None:
+            return CLOSED
+        return OPEN if time.monotonic() < self._open_until else HALF_OPEN
+
+    def allow(self) -> bool:
+        """Check if a call may be made. In the half open state, only the first caller may make its trial call"""
+        with self._lock:
+            if self._open_until is None:
+                return True
+
+            now = time.monotonic()
+            if now < self._open_until or (self._trial_until is not None and now < self._trial_until):
+                return False
+            self._trial_until = now + self.cooldown
+            return True
+
+    def abandon(self) -> None:
+        """Give up a trial call that was allowed but not made, so the next caller can make it"""
+        with self._lock:
+            self._trial_until = None
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call"""
+        with self._lock:
+            if self._open_until is not None:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self._failures = 0
+            self._opened = 0
+            self._open_until = None
+            self._trial_until = None
+
+    def record_failure(self) -> None:
+        """Count a failed call and open the breaker if the threshold is reached or a trial call failed"""
+        with self._lock:
+            self._failures += 1
+            if self._open_until is None and self._failures < self.threshold:
+                return
+
+            cooldown = min(self.cooldown * 2**self._opened, self.max_cooldown)
+            self._opened += 1
+            self._open_until = time.monotonic() + cooldown
+            self._trial_until = None
+            logger.warning(f"Circuit breaker '{self.name}' opened for {cooldown:.0f} seconds after {self._failures} failures")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """State of the breaker for monitoring"""
+        open_until = self._open_until
+        return {
+            "worker": os.getpid(),
+            "name": self.name,
+            "state": self.state,
+            "failures": self._failures,
+            "retry_in": max(0.0, round(open_until - time.monotonic(), 1)) if open_until is not None else None,
+        }
@@ -0,0 +1,68 @@
+import csv
+from typing import IO
+
+import click
+from flask.cli import with_appcontext
+
+from app.config import Config
+from app.db import db
+from app.jobs import instagram_job_worker
+from app.models import Nightline
+from app.models.instagramjob import FAILED, PENDING, RUNNING
+from app.nightlineimport import check_nightline_names, import_nightlines, parse_nightline_names
+
+
+@click.command("reset-all")
+@with_appcontext
+def reset_all_command() -> None:
+    """Reset the status of all nightlines and delete their instagram stories"""
+    # The reset reaches the API workers through the database and the shared public snapshot: they serve the new
+    # state right away and their event streams read the changes from the change log
+    nightlines = Nightline.reset_all_statuses()
+    if nightlines is None:
+        raise click.ClickException("Resetting the statuses failed")
+    click.echo(f"Reset the status of {len(nightlines)} nightlines")
+
+    # The command processes the jobs itself. A background worker would compete for them and be killed mid-job on exit
+    jobs = Nightline.enqueue_instagram_story_deletions(notify=False)
+    if jobs is None:
+        raise click.ClickException("Queueing the deletion of the instagram stories failed")
+
+    # Delete the stories right away. Jobs claimed by an API worker process are reported with their current state
+    instagram_job_worker.process_pending()
+    failed = unfinished = 0
+    for name, job in jobs:
+        db.session.refresh(job)
+        failed += job.state == FAILED
+        unfinished += job.state in (PENDING, RUNNING)
+        click.echo(f"{name}: {job.state}" + (f" ({job.error})" if job.error else ""))
+
+    if failed:
+        raise click.ClickException(f"Deleting the instagram stories of {failed} nightlines failed")
+    if unfinished:
+        raise click.ClickException(f"Deleting the instagram stories of {unfinished} nightlines didn't finish, they are processed by another process")
+
+
+@click.command("import-nightlines")
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-", help="CSV file to write the API keys to. Defaults to stdout")
+@with_appcontext
+def import_nightlines_command(file: IO[str], output: IO[str]) -> None:
+    """Create the nightlines listed in a CSV or JSON FILE and write their API keys as CSV"""
+    names = parse_nightline_names(file.read(), file.name)
+    error = check_nightline_names(names)
+    if error:
+        raise click.ClickException(error)
+
+    writer = csv.writer(output)
+    writer.writerow(["nightline", "api_key"])
+    imported = 0
+    for result in import_nightlines(names, Config.NIGHTLINE_IMPORT_BATCH_SIZE):
+        if "error" in result:
+            raise click.ClickException(result["error"])
+        if "skipped" in result:
+            click.echo(f"{result['nightline']}: skipped, {result['skipped']}", err=True)
+        else:
+            writer.writerow([result["nightline"], result["api_key"]])
+            imported += 1
+    click.echo(f"Imported {imported} of {len(names)} nightlines", err=True)
@@ -33,6 +33,11 @@ class Config:
     # Admin Api Key
     ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 
+    # Secret to sign nightline tokens with. Leave empty to disable tokens
+    API_TOKEN_SECRET = os.getenv("API_TOKEN_SECRET", "")
+    # Seconds a worker trusts its cached key generations, so renewing a key revokes tokens in all workers after at most this time
+    API_TOKEN_CACHE_SECONDS = int(os.getenv("API_TOKEN_CACHE_SECONDS", 60))
+
     # Instagram encryption settings
     password = os.getenv("ENCRYPTION_PASSWORD")
     if not password:
@@ -48,6 +53,40 @@ class Config:
 
     # File management
     UPLOAD_FOLDER = "./instance/nightlines"
+    # Largest request body in bytes, e.g. of a story slide upload. Larger requests are rejected before they are read
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 * 1024))
+
+    # File shared by all processes serving the API, and the reset command, to keep their public snapshots consistent
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH") or "./instance/public-state"
+
+    # Seconds a call to Instagram may take before it's abandoned
+    INSTAGRAM_CALL_TIMEOUT = float(os.getenv("INSTAGRAM_CALL_TIMEOUT", 30))
+    # Consecutive failures of an account, or of all accounts, after which calls to Instagram are suspended
+    INSTAGRAM_BREAKER_THRESHOLD = int(os.getenv("INSTAGRAM_BREAKER_THRESHOLD", 3))
+    INSTAGRAM_GLOBAL_BREAKER_THRESHOLD = int(os.getenv("INSTAGRAM_GLOBAL_BREAKER_THRESHOLD", 10))
+    # Seconds calls are suspended, doubled every time the breaker opens again up to the maximum
+    INSTAGRAM_BREAKER_COOLDOWN = float(os.getenv("INSTAGRAM_BREAKER_COOLDOWN", 30))
+    INSTAGRAM_BREAKER_MAX_COOLDOWN = float(os.getenv("INSTAGRAM_BREAKER_MAX_COOLDOWN", 900))
+
+    # Process queued Instagram story posts and deletions in a background thread of every worker process
+    INSTAGRAM_JOB_WORKER = os.getenv("INSTAGRAM_JOB_WORKER", "true").lower() == "true"
+    # Threads of a worker process processing jobs of different nightlines at the same time
+    INSTAGRAM_JOB_CONCURRENCY = int(os.getenv("INSTAGRAM_JOB_CONCURRENCY", 4))
+
+    # Processes preparing uploaded story slides for Instagram. With 0, slides are prepared in the request thread
+    STORY_SLIDE_WORKERS = int(os.getenv("STORY_SLIDE_WORKERS", 2))
+    # Seconds preparing a story slide may take before the upload fails
+    STORY_SLIDE_TIMEOUT = float(os.getenv("STORY_SLIDE_TIMEOUT", 30))
+
+    # Nightlines created per transaction by a bulk import, and the most nightlines a single import request may contain
+    NIGHTLINE_IMPORT_BATCH_SIZE = int(os.getenv("NIGHTLINE_IMPORT_BATCH_SIZE", 500))
+    NIGHTLINE_IMPORT_LIMIT = int(os.getenv("NIGHTLINE_IMPORT_LIMIT", 10000))
+
+    # Event streams a worker process serves at the same time. Each one holds a request thread, so keep it below the threads per worker
+    EVENT_STREAM_LIMIT = int(os.getenv("EVENT_STREAM_LIMIT", 10))
+
+    # Directory to publish the public state to as static JSON files. Leave empty to disable
+    STATIC_SNAPSHOT_DIR = os.getenv("STATIC_SNAPSHOT_DIR", "")
 
     @classmethod
     def configure_cors(cls, app: Flask) -> None:
@@ -0,0 +1,49 @@
+import threading
+from typing import Optional
+
+from app.logger import logger
+
+
+def format_event_id(version: int) -> str:
+    """Format a change version for the 'id' field of a server-sent event"""
+    return str(version)
+
+
+def parse_event_id(last_event_id: Optional[str]) -> Optional[int]:
+    """Parse a 'Last-Event-ID' header. Returns None if it is not a change version"""
+    if not last_event_id or not last_event_id.isdigit():
+        return None
+    return int(last_event_id)
+
+
+class StreamLimiter:
+    """Limits the event streams a worker process serves at the same time
+
+    Every open stream holds a request thread of the worker, so without a limit, subscribers could starve the API.
+    """
+
+    def __init__(self) -> None:
+        self._open = 0
+        self._lock = threading.Lock()
+
+    @property
+    def open(self) -> int:
+        """Number of open event streams"""
+        return self._open
+
+    def acquire(self, limit: int) -> bool:
+        """Reserve a stream. Returns False if the limit is reached"""
+        with self._lock:
+            if self._open >= limit:
+                logger.warning(f"Rejected an event stream, {self._open} of {limit} streams are open")
+                return False
+            self._open += 1
+            return True
+
+    def release(self) -> None:
+        """Release a stream after it was closed"""
+        with self._lock:
+            self._open -= 1
+
+
+stream_limiter = StreamLimiter()
@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 from pathlib import Path
 from typing import Optional
 
@@ -46,14 +48,63 @@ def check_file_already_exists(base_file_path: Path) -> Optional[Path]:
     return None
 
 
-def save_file(file: FileStorage, file_path: Path) -> bool:
-    """Save the file to the specified path."""
+def ingest_file(file: FileStorage, file_path: Path, max_bytes: int, chunk_size: int = 64 * 1024) -> Optional[str]:
+    """Stream an uploaded file to a temporary file and rename it into place. Returns the SHA-256 digest of its content
+
+    The content is hashed while it's written and only one chunk is held in memory. Returns None if the file is larger
+    than 'max_bytes' or can't be written, in which case an existing file at the path is kept.
+    """
+    digest = hashlib.sha256()
+    size = 0
     try:
-        file.save(file_path)
+        fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                while chunk := file.stream.read(chunk_size):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ValueError(f"File exceeds the maximum size of {max_bytes} bytes")
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+            os.chmod(tmp_path, 0o644)  # mkstemp creates files only readable by the owner
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
         logger.info(f"File saved successfully: {file_path}")
-        return True
+        return digest.hexdigest()
     except Exception as e:
         logger.error(f"Error saving file '{file_path}': {e}")
+        return None
+
+
+def write_file_atomic(file_path: Path, data: bytes) -> bool:
+    """Write data to a temporary file and rename it into place, so readers never see a partial file"""
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.chmod(tmp_path, 0o644)  # mkstemp creates files only readable by the owner
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        logger.debug(f"File written atomically: {file_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error writing file '{file_path}': {e}")
+        return False
+
+
+def replace_file(source: Path, target: Path) -> bool:
+    """Rename a file into place, replacing an existing file at the target"""
+    try:
+        os.replace(source, target)
+        logger.debug(f"File '{source}' moved to: '{target}'")
+        return True
+    except OSError as e:
+        logger.error(f"Error moving file '{source}' to '{target}': {e}")
         return False
 
 
@@ -0,0 +1,136 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+from flask import current_app
+
+from app.logger import logger
+
+if TYPE_CHECKING:  # pragma: no cover
+    from flask import Flask
+
+    from app.models.instagramjob import InstagramJob
+
+
+class InstagramJobWorker:
+    """Processes the Instagram job queue in a background thread of each worker process
+
+    Jobs are stored in the database, so they survive restarts and every worker process can process them.
+    The thread is woken up when a job is enqueued in its process and polls for jobs of other processes.
+    """
+
+    def __init__(self, poll_seconds: float = 5.0, lease_seconds: float = 600.0) -> None:
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds  # A running job is requeued if it didn't finish within this time
+        self._app: Optional["Flask"] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app: "Flask") -> None:
+        """Process the jobs of an app. The thread is started on the first request, so it runs in every forked worker"""
+        self._app = app
+        app.before_request(self.ensure_started)
+        logger.info("Instagram job worker enabled")
+
+    def ensure_started(self) -> None:
+        """Start the thread in this process if it's not running"""
+        if self._app is None:
+            return
+
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="instagram-jobs", daemon=True)
+            self._thread.start()
+            logger.debug(f"Started instagram job worker in process: '{self._pid}'")
+
+    def notify(self) -> None:
+        """Wake up the thread to process a new job"""
+        self.ensure_started()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        app = self._app
+        if app is None:  # pragma: no cover
+            return
+
+        while True:
+            self._wakeup.clear()
+            try:
+                with app.app_context():
+                    self.process_pending()
+            except Exception as e:
+                logger.error(f"Error in the instagram job worker: {e}")
+            self._wakeup.wait(self.poll_seconds)
+
+    def process_pending(self) -> int:
+        """Process jobs until the queue is empty. Must be called in an app context
+
+        Up to INSTAGRAM_JOB_CONCURRENCY threads process jobs at the same time. Jobs of a nightline still run in order,
+        since a job is only claimed once all earlier jobs of its nightline finished.
+        """
+        from app.models.instagramjob import InstagramJob
+
+        InstagramJob.requeue_stale(self.lease_seconds)
+
+        concurrency = int(current_app.config.get("INSTAGRAM_JOB_CONCURRENCY", 1))
+        if concurrency <= 1:
+            return self._process_until_empty()
+
+        app = current_app._get_current_object()  # type: ignore[attr-defined]
+
+        def process(_: int) -> int:
+            with app.app_context():  # Every thread needs its own database session
+                return self._process_until_empty()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="instagram-jobs") as executor:
+            return sum(executor.map(process, range(concurrency)))
+
+    def _process_until_empty(self) -> int:
+        processed = 0
+        while self.process_next():
+            processed += 1
+        return processed
+
+    def process_next(self) -> bool:
+        """Claim and process the next job. Returns False if there is no job to process"""
+        from app.models.instagramjob import InstagramJob
+
+        job = InstagramJob.claim_next()
+        if not job:
+            return False
+
+        self.run_job(job)
+        return True
+
+    @staticmethod
+    def run_job(job: "InstagramJob") -> None:
+        """Run a claimed job and store its result"""
+        from app.db import db
+        from app.models import Nightline
+        from app.models.instagramjob import DELETE_STORY, POST_STORY
+
+        logger.debug(f"Running instagram job '{job.id}': '{job.action}'")
+        try:
+            nightline = db.session.get(Nightline, job.nightline_id)
+            if not nightline:
+                job.finish(False, "Nightline not found")
+            elif job.action == POST_STORY:
+                posted = nightline.post_instagram_story(job.status_name)
+                job.finish(posted, None if posted else "Uploading the instagram story failed")
+            elif job.action == DELETE_STORY:
+                deleted = nightline.delete_instagram_story()
+                job.finish(deleted, None if deleted else "Deleting the instagram story failed")
+            else:
+                job.finish(False, f"Unknown action: '{job.action}'")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error while running instagram job '{job.id}': {e}")
+            job.finish(False, str(e))
+
+
+instagram_job_worker = InstagramJobWorker()
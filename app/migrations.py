@@ -0,0 +1,161 @@
+import hashlib
+import os
+from typing import Any, Callable, List, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+
+from .db import db
+from .logger import logger
+from .models import SchemaMigration
+
+# Migrations use their own frozen table definitions, so changing a model later never changes what a migration does
+
+
+def _create_index(connection: Connection, table_name: str, name: str, *columns: "sa.Column[Any]", unique: bool = False, **kwargs: Any) -> None:
+    """Create an index if it doesn't exist yet"""
+    sa.Index(name, *sa.Table(table_name, sa.MetaData(), *columns).c, unique=unique, **kwargs).create(connection, checkfirst=True)
+
+
+def _remove_files(paths: List[str]) -> None:
+    """Remove the files of deleted story slides"""
+    for path in paths:
+        try:
+            os.remove(path)
+            logger.info(f"Removed file of deleted story slide: '{path}'")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Couldn't remove file of deleted story slide '{path}': {e}")
+
+
+def _add_status_languages(connection: Connection) -> None:
+    """Add the language bitmask to statuses and set it for the default statuses"""
+    columns = {column["name"] for column in inspect(connection).get_columns("statuses")}
+    if "languages" not in columns:
+        connection.execute(text("ALTER TABLE statuses ADD COLUMN languages INTEGER NOT NULL DEFAULT 0"))
+
+        default_languages = {"german": 0b01, "english": 0b10, "german-english": 0b11}  # Bits of 'de' and 'en'
+        statuses = sa.table("statuses", sa.column("name"), sa.column("languages"))
+        for name, languages in default_languages.items():
+            connection.execute(statuses.update().where(statuses.c.name == name).values(languages=languages))
+
+    _create_index(connection, "statuses", "ix_statuses_languages", sa.Column("languages"))
+
+
+def _add_lookup_indexes(connection: Connection) -> None:
+    """Index the columns nightline statuses, API keys and the public filters are looked up by"""
+    # Drop duplicate nightline statuses, which would violate the unique index. One with a story slide is preferred
+    connection.execute(
+        text(
+            "DELETE FROM nightline_statuses WHERE id NOT IN ("
+            " SELECT COALESCE(MIN(storyslides.nightline_status_id), MIN(nightline_statuses.id)) FROM nightline_statuses"
+            " LEFT JOIN storyslides ON storyslides.nightline_status_id = nightline_statuses.id"
+            " GROUP BY nightline_statuses.nightline_id, nightline_statuses.status_id)"
+        )
+    )
+    orphaned = "FROM storyslides WHERE nightline_status_id NOT IN (SELECT id FROM nightline_statuses)"
+    paths = set(connection.execute(text(f"SELECT path {orphaned} AND path IS NOT NULL")).scalars())
+    connection.execute(text(f"DELETE {orphaned}"))
+
+    _create_index(
+        connection, "nightline_statuses", "ix_nightline_statuses_nightline_id_status_id", sa.Column("nightline_id"), sa.Column("status_id"), unique=True
+    )
+    _create_index(connection, "api_keys", "ix_api_keys_nightline_id", sa.Column("nightline_id"))
+    _create_index(connection, "nightlines", "ix_nightlines_status_id", sa.Column("status_id"))
+    now = sa.Column("now", sa.Boolean)
+    _create_index(connection, "nightlines", "ix_nightlines_now", now, sqlite_where=now.is_(True), postgresql_where=now.is_(True))
+
+    # Duplicates of a nightline status share the file name, so only files no remaining story slide uses are removed
+    paths -= set(connection.execute(text("SELECT path FROM storyslides")).scalars())
+    _remove_files(sorted(paths))
+
+
+def _hash_api_keys(connection: Connection) -> None:
+    """Replace stored plaintext API keys by their SHA-256 digest. Existing keys stay valid"""
+    api_keys = sa.table("api_keys", sa.column("id"), sa.column("key"))
+    rows = connection.execute(sa.select(api_keys.c.id, api_keys.c.key)).all()
+    for id, key in rows:
+        if len(key) != 64:  # Generated keys are much longer than a hex digest
+            connection.execute(api_keys.update().where(api_keys.c.id == id).values(key=hashlib.sha256(key.encode()).hexdigest()))
+
+
+def _add_api_key_generation(connection: Connection) -> None:
+    """Add the key generation to API keys, which revokes tokens when it is bumped"""
+    columns = {column["name"] for column in inspect(connection).get_columns("api_keys")}
+    if "generation" not in columns:
+        connection.execute(text("ALTER TABLE api_keys ADD COLUMN generation INTEGER NOT NULL DEFAULT 0"))
+
+
+def _add_instagram_key_version(connection: Connection) -> None:
+    """Add the key version to Instagram accounts. Existing passwords are marked as legacy (1) and re-encrypted on first read"""
+    columns = {column["name"] for column in inspect(connection).get_columns("instagram_accounts")}
+    if "key_version" not in columns:
+        connection.execute(text("ALTER TABLE instagram_accounts ADD COLUMN key_version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _remove_default_nightline_statuses(connection: Connection) -> None:
+    """Drop nightline statuses holding the default configuration. Only configurations that differ from it are stored"""
+    nightline_statuses = sa.table("nightline_statuses", sa.column("id"), sa.column("instagram_story"))
+    storyslides = sa.table("storyslides", sa.column("nightline_status_id"))
+    connection.execute(
+        nightline_statuses.delete().where(
+            nightline_statuses.c.instagram_story.is_(False),
+            nightline_statuses.c.id.not_in(sa.select(storyslides.c.nightline_status_id)),
+        )
+    )
+
+
+def _add_story_slide_content_hash(connection: Connection) -> None:
+    """Add the digest of the uploaded file to story slides. Slides uploaded before have none and are prepared again when replaced"""
+    columns = {column["name"] for column in inspect(connection).get_columns("storyslides")}
+    if "content_hash" not in columns:
+        connection.execute(text("ALTER TABLE storyslides ADD COLUMN content_hash VARCHAR(64)"))
+
+
+
+def _drop_filter_indexes(connection: Connection) -> None:
+    """Drop the indexes of the database filters. The public filters are applied to the in-memory snapshot"""
+    now = sa.Column("now", sa.Boolean)
+    sa.Index("ix_nightlines_now", *sa.Table("nightlines", sa.MetaData(), now).c).drop(connection, checkfirst=True)
+    sa.Index("ix_statuses_languages", *sa.Table("statuses", sa.MetaData(), sa.Column("languages")).c).drop(connection, checkfirst=True)
+
+
+# Migrations are applied in order and must never be changed or reordered once released
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Add languages to statuses", _add_status_languages),
+    (2, "Add indexes for lookups and filters", _add_lookup_indexes),
+    (3, "Store API keys as SHA-256 digests", _hash_api_keys),
+    (4, "Add key generation to API keys", _add_api_key_generation),
+    (5, "Add key version to Instagram accounts", _add_instagram_key_version),
+    (6, "Store only non-default nightline statuses", _remove_default_nightline_statuses),
+    (7, "Add content hash to story slides", _add_story_slide_content_hash),
+    (8, "Drop indexes of the database filters", _drop_filter_indexes),
+]
+
+
+def run_migrations() -> bool:
+    """Apply all schema migrations that were not applied to the database yet"""
+    migrations = SchemaMigration.__table__
+
+    try:
+        with db.engine.connect() as connection:
+            applied = {version for (version,) in connection.execute(migrations.select().with_only_columns(migrations.c.version))}
+
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+
+            logger.info(f"Applying schema migration {version}: '{name}'")
+            with db.engine.begin() as connection:
+                migrate(connection)
+                connection.execute(migrations.insert().values(version=version, name=name))
+
+        logger.info("Database schema is up to date")
+        return True
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error while migrating the database schema: {e}")
+        return False
@@ -1,7 +1,10 @@
 from .apikey import ApiKey
+from .instagramjob import InstagramJob
 from .nightline import Nightline
+from .nightlinechange import NightlineChange
 from .nightlinestatus import NightlineStatus
+from .schemamigration import SchemaMigration
 from .status import Status
 from .storyslide import StorySlide
 
-__all__ = ["Nightline", "Status", "NightlineStatus", "StorySlide", "ApiKey"]
+__all__ = ["Nightline", "Status", "NightlineStatus", "NightlineChange", "StorySlide", "ApiKey", "SchemaMigration", "InstagramJob"]
@@ -1,15 +1,22 @@
+import hashlib
+import hmac
 import secrets
-from typing import Optional, cast
+from typing import TYPE_CHECKING, Optional, cast
 
 from app.db import db
 from app.logger import logger
 
+if TYPE_CHECKING:  # pragma: no cover
+    from app.models.nightline import Nightline
+
 
 class ApiKey(db.Model):  # type: ignore
     __tablename__ = "api_keys"
     id = db.Column(db.Integer, primary_key=True)
-    key = db.Column(db.String(512), nullable=False, unique=True)
-    nightline_id = db.Column(db.Integer, db.ForeignKey("nightlines.id"), nullable=False)
+    # Only the SHA-256 digest of a key is stored. The column keeps its name from when it held the plaintext
+    key_hash = db.Column("key", db.String(64), nullable=False, unique=True)
+    nightline_id = db.Column(db.Integer, db.ForeignKey("nightlines.id"), nullable=False, index=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every renewal to revoke tokens
     nightline = db.relationship("Nightline", backref="api_key", foreign_keys=[nightline_id])
 
     @staticmethod
@@ -18,6 +25,11 @@ class ApiKey(db.Model):  # type: ignore
         logger.debug(f"Generating api key of length: '{length}'")
         return secrets.token_urlsafe(length)
 
+    @staticmethod
+    def hash_key(key: str) -> str:
+        """Return the hex encoded SHA-256 digest of an API key"""
+        return hashlib.sha256(key.encode()).hexdigest()
+
     @classmethod
     def get_api_key(cls, id: int) -> Optional["ApiKey"]:
         """Fetch the API key for nightline"""
@@ -29,5 +41,28 @@ class ApiKey(db.Model):  # type: ignore
             logger.info(f"Api key for nightline with ID: {id} not found")
         return api_key
 
+    @classmethod
+    def get_nightline_by_key(cls, key: str) -> Optional["Nightline"]:
+        """Return the nightline an API key belongs to, by a single lookup of the key digest"""
+        from app.models.nightline import Nightline
+
+        key_hash = cls.hash_key(key)
+        row = db.session.query(cls.key_hash, Nightline).join(Nightline, Nightline.id == cls.nightline_id).filter(cls.key_hash == key_hash).first()
+        if not row or not hmac.compare_digest(row[0], key_hash):
+            logger.info("No nightline found for the given api key")
+            return None
+        return cast("Nightline", row[1])
+
+    def set_key(self) -> str:
+        """Assign a newly generated key and return it. The plaintext key is not stored and can't be retrieved later"""
+        key = self.generate_api_key()
+        self.key_hash = self.hash_key(key)
+        self.generation = self.generation + 1 if self.generation is not None else 0
+        return key
+
+    def verify(self, key: str) -> bool:
+        """Check a key against the stored digest in constant time"""
+        return hmac.compare_digest(self.key_hash, self.hash_key(key))
+
     def __repr__(self) -> str:
         return f"ApiKey('{self.id}')"
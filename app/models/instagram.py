@@ -1,16 +1,46 @@
 import base64
 import os
+from functools import lru_cache
 from typing import Optional
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.config import Config
 from app.db import db
 from app.logger import logger
+from app.story_post import instagram_clients
+
+# Passwords of version 1 are encrypted with a key derived by PBKDF2 per account, which is slow on every access.
+# Version 2 derives a master key once per process and a subkey per account with HKDF
+LEGACY_KEY_VERSION = 1
+KEY_VERSION = 2
+
+MASTER_KEY_SALT = b"nightlight-instagram-master-key"
+SUBKEY_INFO = b"nightlight-instagram-password"
+
+
+def _pbkdf2(password: str, salt: bytes) -> bytes:
+    """Derive a 256-bit key from a password using PBKDF2"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,  # 256-bit key for AES
+        salt=salt,
+        iterations=100_000,
+        backend=default_backend(),
+    )
+    return kdf.derive(password.encode())
+
+
+@lru_cache(maxsize=1)
+def derive_master_key(password: str) -> bytes:
+    """Derive the master key from the encryption password. Cached, so PBKDF2 only runs once per process"""
+    logger.debug("Deriving the master key for Instagram passwords")
+    return _pbkdf2(password, MASTER_KEY_SALT)
 
 
 class InstagramAccount(db.Model):  # type: ignore
@@ -26,25 +56,52 @@ class InstagramAccount(db.Model):  # type: ignore
     username = db.Column(db.String(50), nullable=False)
     encrypted_password = db.Column(db.String(100), nullable=False)
     salt = db.Column(db.String(255), nullable=False)
+    key_version = db.Column(db.Integer, nullable=False, default=KEY_VERSION)
     session_data = db.Column(db.Text, nullable=True)
 
     def derive_key(self) -> Fernet:
-        """Derives an encryption key using PBKDF2 with the stored salt."""
-        kdf = PBKDF2HMAC(
+        """Derives an encryption key from the master key using HKDF with the stored salt."""
+        hkdf = HKDF(
             algorithm=hashes.SHA256(),
-            length=32,  # 256-bit key for AES
+            length=32,
             salt=base64.urlsafe_b64decode(self.salt),
-            iterations=100_000,
+            info=SUBKEY_INFO,
             backend=default_backend(),
         )
-        key = base64.urlsafe_b64encode(kdf.derive(Config.ENCRYPTION_PASSWORD.encode()))
+        key = base64.urlsafe_b64encode(hkdf.derive(derive_master_key(Config.ENCRYPTION_PASSWORD)))
+        return Fernet(key)
+
+    def derive_legacy_key(self) -> Fernet:
+        """Derives the encryption key of legacy accounts using PBKDF2 with the stored salt."""
+        key = base64.urlsafe_b64encode(_pbkdf2(Config.ENCRYPTION_PASSWORD, base64.urlsafe_b64decode(self.salt)))
         return Fernet(key)
 
+    def _encrypt_password(self, password: str) -> None:
+        """Encrypt a password with a new salt and the current key version"""
+        self.salt = base64.urlsafe_b64encode(os.urandom(16)).decode()  # Generate a 16-byte salt
+        self.key_version = KEY_VERSION
+        cipher = self.derive_key()
+        self.encrypted_password = cipher.encrypt(password.encode()).decode()
+
+    def set_session_data(self, session_data: Optional[str]) -> bool:
+        """Store the session settings of the Instagram client. Returns True if successful, False otherwise."""
+        self.session_data = session_data
+        try:
+            db.session.commit()
+            return True
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Failed to set session data for user_id={self.id}: {e}")
+            return False
+
     def set_username(self, username: str) -> bool:
         """Set the username of an account. Returns True if successful, False otherwise."""
         self.username = username
+        self.session_data = None  # The session belongs to the old username
         try:
             db.session.commit()
+            if self.id is not None:
+                instagram_clients.discard(self.id)
             return True
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -54,10 +111,11 @@ class InstagramAccount(db.Model):  # type: ignore
     def set_password(self, password: str) -> bool:
         """Securely store the password of an account."""
         try:
-            self.salt = base64.urlsafe_b64encode(os.urandom(16)).decode()  # Generate a 16-byte salt
-            cipher = self.derive_key()
-            self.encrypted_password = cipher.encrypt(password.encode()).decode()
+            self._encrypt_password(password)
+            self.session_data = None  # Log in with the new password
             db.session.commit()
+            if self.id is not None:
+                instagram_clients.discard(self.id)
             return True
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -71,8 +129,23 @@ class InstagramAccount(db.Model):  # type: ignore
     def get_password(self) -> Optional[str]:
         """Decrypts and returns the stored password. Returns None if decryption fails."""
         try:
+            if self.key_version == LEGACY_KEY_VERSION:
+                password: str = self.derive_legacy_key().decrypt(self.encrypted_password.encode()).decode()
+                self._rewrap_password(password)
+                return password
+
             cipher = self.derive_key()
             return cipher.decrypt(self.encrypted_password.encode()).decode()
         except Exception:
             logger.exception(f"Failed to decrypt password for user_id={self.id}")
             return None
+
+    def _rewrap_password(self, password: str) -> None:
+        """Encrypt a legacy password with the current key version, so it's decrypted without PBKDF2 from now on"""
+        try:
+            self._encrypt_password(password)
+            db.session.commit()
+            logger.info(f"Re-encrypted legacy password for user_id={self.id}")
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error when re-encrypting password for user_id={self.id}: {e}")
@@ -0,0 +1,133 @@
+import time
+from typing import Any, Dict, Iterable, List, Optional, cast
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased
+
+from app.logger import logger
+
+from ..db import db
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+POST_STORY = "post_story"
+DELETE_STORY = "delete_story"
+
+
+class InstagramJob(db.Model):  # type: ignore
+    """Durable queue of Instagram story posts and deletions. Jobs of a nightline are processed in order"""
+
+    __tablename__ = "instagram_jobs"
+    __table_args__ = {"sqlite_autoincrement": True}  # Job ids are handed out and must never be reused
+    id = db.Column(db.Integer, primary_key=True)
+    nightline_id = db.Column(db.Integer, db.ForeignKey("nightlines.id"), nullable=False, index=True)
+    action = db.Column(db.String(20), nullable=False)
+    status_name = db.Column(db.String(15), nullable=True)  # Status to post the story slide of
+    state = db.Column(db.String(10), nullable=False, default=PENDING, index=True)
+    error = db.Column(db.String(200), nullable=True)
+    claimed_at = db.Column(db.Float, nullable=True)  # Unix time a worker started processing the job
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+    @classmethod
+    def enqueue(cls, nightline_id: int, action: str, status_name: Optional[str] = None) -> Optional["InstagramJob"]:
+        """Add a job to the queue. Returns None if it could not be stored"""
+        logger.debug(f"Enqueueing instagram job '{action}' for nightline with ID: '{nightline_id}'")
+        try:
+            job = cls(nightline_id=nightline_id, action=action, status_name=status_name, state=PENDING)
+            db.session.add(job)
+            db.session.commit()
+            logger.info(f"Enqueued instagram job '{job.id}': '{action}'")
+            return job
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error while enqueueing instagram job '{action}' for nightline with ID '{nightline_id}': {e}")
+            return None
+
+    @classmethod
+    def enqueue_many(cls, nightline_ids: Iterable[int], action: str, status_names: Optional[Dict[int, str]] = None) -> Optional[List["InstagramJob"]]:
+        """Add a job for each nightline to the queue in a single transaction. Returns None if they could not be stored"""
+        status_names = status_names or {}
+        try:
+            jobs = [cls(nightline_id=nightline_id, action=action, status_name=status_names.get(nightline_id), state=PENDING) for nightline_id in nightline_ids]
+            db.session.add_all(jobs)
+            db.session.commit()
+            logger.info(f"Enqueued {len(jobs)} instagram jobs: '{action}'")
+            return jobs
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error while enqueueing instagram jobs '{action}': {e}")
+            return None
+
+    @classmethod
+    def get_job(cls, nightline_id: int, job_id: int) -> Optional["InstagramJob"]:
+        """Query a job of a nightline by id"""
+        return cast(Optional[InstagramJob], cls.query.filter_by(id=job_id, nightline_id=nightline_id).first())
+
+    @classmethod
+    def requeue_stale(cls, lease_seconds: float) -> int:
+        """Return jobs to the queue whose worker didn't finish them in time, e.g. because it was killed"""
+        try:
+            count = int(cls.query.filter(cls.state == RUNNING, cls.claimed_at < time.time() - lease_seconds).update({"state": PENDING, "claimed_at": None}))
+            db.session.commit()
+            if count:
+                logger.warning(f"Requeued {count} stale instagram jobs")
+            return count
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error while requeueing stale instagram jobs: {e}")
+            return 0
+
+    @classmethod
+    def claim_next(cls) -> Optional["InstagramJob"]:
+        """Claim the oldest pending job whose nightline has no earlier unfinished job"""
+        earlier = aliased(cls)
+        try:
+            blocked = (
+                db.session.query(earlier.id)
+                .filter(earlier.nightline_id == cls.nightline_id, earlier.id < cls.id, earlier.state.in_((PENDING, RUNNING)))
+                .exists()
+            )
+            for (job_id,) in db.session.query(cls.id).filter(cls.state == PENDING, ~blocked).order_by(cls.id).limit(10):
+                # Only one worker process wins the claim of a job
+                claimed = cls.query.filter_by(id=job_id, state=PENDING).update({"state": RUNNING, "claimed_at": time.time()})
+                db.session.commit()
+                if claimed:
+                    return cast(Optional[InstagramJob], db.session.get(cls, job_id))
+            return None
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error while claiming an instagram job: {e}")
+            return None
+
+    def finish(self, succeeded: bool, error: Optional[str] = None) -> bool:
+        """Mark the job as done or failed"""
+        try:
+            self.state = DONE if succeeded else FAILED
+            self.error = error[:200] if error else None
+            db.session.commit()
+            logger.info(f"Instagram job '{self.id}' finished with state: '{self.state}'")
+            return True
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error while finishing instagram job '{self.id}': {e}")
+            return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public representation of the job"""
+        return {
+            "job_id": self.id,
+            "action": self.action,
+            "status_name": self.status_name,
+            "state": self.state,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self) -> str:
+        return f"InstagramJob('{self.id}')"
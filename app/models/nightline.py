@@ -1,23 +1,69 @@
-from typing import List, Optional, cast
+from typing import Any, Dict, Iterable, List, Optional, Tuple, cast
 
-from sqlalchemy import or_
+from sqlalchemy import and_, inspect, or_, update
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import InstanceState, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 
+from app.jobs import instagram_job_worker
 from app.logger import logger
-from app.story_post import delete_story_by_id, post_story
+from app.snapshot import public_snapshot
+from app.story_post import delete_story_by_id, instagram_clients, post_story
+from app.tokens import nightline_tokens
 
 from ..db import db
 from .apikey import ApiKey
 from .instagram import InstagramAccount
+from .instagramjob import DELETE_STORY, PENDING, POST_STORY, RUNNING, InstagramJob
+from .nightlinechange import NightlineChange
 from .nightlinestatus import NightlineStatus
-from .status import Status
+from .status import Status, StatusInfo, status_registry
+
+
+class NightlineRow:
+    """Lightweight, read-only public state of a nightline, loaded without the ORM"""
+
+    __slots__ = (
+        "nightline_name",
+        "status_name",
+        "description_de",
+        "description_en",
+        "description_now_de",
+        "description_now_en",
+        "now",
+    )
+
+    def __init__(
+        self,
+        nightline_name: str,
+        status_name: str,
+        description_de: str,
+        description_en: str,
+        description_now_de: str,
+        description_now_en: str,
+        now: bool,
+    ) -> None:
+        self.nightline_name = nightline_name
+        self.status_name = status_name
+        self.description_de = description_de
+        self.description_en = description_en
+        self.description_now_de = description_now_de
+        self.description_now_en = description_now_en
+        self.now = now
+
+    def public_state(self) -> Dict[str, Any]:
+        """Return the publicly visible state of the nightline"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"NightlineRow('{self.nightline_name}')"
 
 
 class Nightline(db.Model):  # type: ignore
     __tablename__ = "nightlines"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
-    status_id = db.Column(db.Integer, db.ForeignKey("statuses.id"), nullable=False)
+    status_id = db.Column(db.Integer, db.ForeignKey("statuses.id"), nullable=False, index=True)
     status = db.relationship("Status", backref="nightlines")
     nightline_statuses = db.relationship("NightlineStatus", back_populates="nightline", cascade="all, delete-orphan")
     now = db.Column(db.Boolean, nullable=False, default=False)
@@ -42,34 +88,62 @@ class Nightline(db.Model):  # type: ignore
         return nightline
 
     @classmethod
-    def add_nightline(cls, name: str) -> Optional["Nightline"]:
-        """Create a new nightline with the default status"""
-        logger.debug(f"Adding new nightline: '{name}'")
+    def get_nightlines(cls, names: List[str]) -> Dict[str, "Nightline"]:
+        """Query nightlines by name in a single query. Names that don't exist are missing in the result"""
+        logger.debug(f"Fetching {len(names)} nightlines by name")
+        return {nightline.name: nightline for nightline in cls.query.filter(cls.name.in_(names))}
+
+    @classmethod
+    def reference(cls, nightline_id: int, name: str) -> "Nightline":
+        """Return a nightline known by ID and name, e.g. from a verified token, without loading it
+
+        Other attributes are loaded on first access, so setting the status or 'now' value only updates the row by its ID.
+        If the nightline was removed in the meantime, these updates fail.
+        """
+        nightline = cast(Optional["Nightline"], db.session.identity_map.get(inspect(cls).identity_key_from_primary_key((nightline_id,))))
+        if nightline:
+            return nightline
+
+        nightline = cls(id=nightline_id, name=name)
+        make_transient_to_detached(nightline)  # Persistent with all other attributes expired, as if they weren't loaded yet
+        db.session.add(nightline)
+        return nightline
+
+    @classmethod
+    def add_nightlines(cls, names: List[str]) -> Optional[List[Tuple[str, str]]]:
+        """Create nightlines with the default status and their API keys in a single transaction. Existing nightlines are skipped
 
-        default_status = Status.get_status("default")
+        Returns the names of the created nightlines with their API keys. Only the hashes of the keys are stored, so this is the
+        only time they are available.
+        """
+        logger.debug(f"Adding {len(names)} new nightlines")
+
+        default_status = Status.get_status_info("default")
         if not default_status:
-            logger.error(f"Nightline was not added because the default status is missing")
+            logger.error(f"Nightlines were not added because the default status is missing")
             return None
 
         try:
-            new_nightline = cls(name=name, status=default_status)
-            db.session.add(new_nightline)
-            db.session.commit()
-            logger.debug(f"Created nightline: '{name}'")
-
-            new_api_key = ApiKey(key=ApiKey.generate_api_key(), nightline_id=new_nightline.id)
-            db.session.add(new_api_key)
+            existing = {name for (name,) in db.session.query(cls.name).filter(cls.name.in_(names))}
+            new_nightlines = [cls(name=name, status_id=default_status.id) for name in names if name not in existing]
+            db.session.add_all(new_nightlines)
+            db.session.flush()  # Assigns the ids of the nightlines for their API keys
+
+            keys = []
+            for nightline in new_nightlines:
+                new_api_key = ApiKey(nightline_id=nightline.id)
+                keys.append((nightline.name, new_api_key.set_key()))
+                db.session.add(new_api_key)
+            NightlineChange.record_many([name for name, _ in keys])
             db.session.commit()
-            logger.debug(f"Created API-Key for nightline: '{name}'")
-
-            # Create NightlineStatus entries for all Statuses
-            NightlineStatus.add_statuses_for_new_nightlines(new_nightline)
+            if keys:
+                public_snapshot.bump(*[name for name, _ in keys])
 
-            logger.info(f"Nightline '{name}' added successfully")
-            return new_nightline
+            logger.info(f"Added {len(keys)} nightlines, skipped {len(existing)} existing nightlines")
+            return keys
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Error adding nightline '{name}': {e}")
+            logger.error(f"Error adding {len(names)} nightlines: {e}")
             return None
 
     @classmethod
@@ -90,74 +164,200 @@ class Nightline(db.Model):  # type: ignore
         NightlineStatus.delete_statuses_for_nightline(nightline)
 
         try:
+            InstagramJob.query.filter_by(nightline_id=nightline.id).delete()
             db.session.delete(api_key)
             db.session.commit()
             logger.debug(f"Removed api key for nightline: '{name}'")
 
             db.session.delete(nightline)
+            NightlineChange.record(name, removed=True)
             db.session.commit()
+            public_snapshot.bump(name)
 
             logger.info(f"Nightline '{name}' removed successfully")
             return nightline
         except Exception as e:
-            NightlineStatus.add_statuses_for_new_nightlines(nightline)  # Re-add the statuses to prevent getting out of sync
             db.session.rollback()
             logger.error(f"Error removing nightline '{name}': {e}")
             return None
 
     @classmethod
-    def list_nightlines(
-        cls,
-        status_filter: Optional[str] = None,
-        language_filter: Optional[str] = None,
-        now_filter: Optional[bool] = None,
-    ) -> list["Nightline"]:
-        """List all nightlines with optional filters"""
-        logger.debug("Listing all nightlines with filters")
+    def public_columns(cls) -> Tuple[Any, ...]:
+        """Columns of the public state of a nightline, in the order expected by NightlineRow"""
+        return (
+            cls.name,
+            Status.name,
+            Status.description_de,
+            Status.description_en,
+            Status.description_now_de,
+            Status.description_now_en,
+            cls.now,
+        )
 
-        try:
-            query = cls.query.join(Status, Nightline.status)
+    @classmethod
+    def list_nightline_rows(cls) -> List[NightlineRow]:
+        """List the public state of all nightlines in a single query, without loading ORM objects"""
+        logger.debug("Listing public state of all nightlines")
+
+        query = db.session.query(*cls.public_columns()).join(Status, cls.status_id == Status.id)
+        rows = [NightlineRow(*row) for row in query.order_by(cls.id)]
+
+        logger.debug(f"Listed public state of {len(rows)} nightlines")
+        return rows
+
+    @classmethod
+    def get_nightline_rows(cls, names: Iterable[str]) -> Dict[str, NightlineRow]:
+        """Query the public state of nightlines by name in a single query. Names that don't exist are missing in the result"""
+        names = list(names)
+        logger.debug(f"Fetching public state of {len(names)} nightlines by name")
+
+        query = db.session.query(*cls.public_columns()).join(Status, cls.status_id == Status.id).filter(cls.name.in_(names))
+        return {row.nightline_name: row for row in (NightlineRow(*columns) for columns in query.order_by(cls.id))}
 
-            # Apply filters if provided
-            if status_filter:
-                query = query.filter(Nightline.status.has(name=status_filter))
+    @classmethod
+    def reset_all_statuses(cls) -> Optional[List[str]]:
+        """Reset the status of all nightlines to default and 'now' to false in a single statement. Returns the names of the changed nightlines"""
+        logger.debug("Resetting the status of all nightlines")
 
-            if language_filter:
-                if language_filter == "de":
-                    query = query.filter(or_(Status.name == "german", Status.name == "german-english"))
-                elif language_filter == "en":
-                    query = query.filter(or_(Status.name == "english", Status.name == "german-english"))
+        default_status = Status.get_status_info("default")
+        if not default_status:
+            logger.error("Statuses were not reset because the default status is missing")
+            return None
 
-            if isinstance(now_filter, bool):
-                query = query.filter(Nightline.now == now_filter)
+        try:
+            statement = (
+                update(cls)
+                .where(or_(cls.status_id != default_status.id, cls.now.is_(True)))
+                .values(status_id=default_status.id, now=False)
+                .returning(cls.name)
+            )
+            names = [name for (name,) in db.session.execute(statement)]
+            NightlineChange.record_many(names)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Error while resetting the status of all nightlines: {e}")
+            return None
 
-            # Fetch nightlines that match filter criteria
-            nightlines = cast(list[Nightline], query.all())
+        if names:
+            public_snapshot.bump()
 
-            logger.info(f"Listed {len(nightlines)} nightlines")
-            return nightlines
+        logger.info(f"Reset the status of {len(names)} nightlines")
+        return names
 
+    @classmethod
+    def _commit(cls, nightlines: List["Nightline"]) -> None:
+        """Commit the session, keeping the loaded attributes of the nightlines so using them afterwards doesn't load their rows again"""
+        loaded = []
+        for nightline in nightlines:
+            state: InstanceState[Nightline] = inspect(nightline)
+            loaded.append((nightline, {key: state.dict[key] for key in state.mapper.column_attrs.keys() if key in state.dict}))
+        db.session.commit()
+        for nightline, values in loaded:
+            for key, value in values.items():
+                set_committed_value(nightline, key, value)
+
+    @classmethod
+    def update_statuses(cls, updates: List[Tuple["Nightline", Optional[StatusInfo], Optional[bool]]]) -> bool:
+        """Set the status and/or 'now' value of several nightlines in a single transaction"""
+        logger.debug(f"Updating the status of {len(updates)} nightlines")
+
+        names = [nightline.name for nightline, _, _ in updates]
+        try:
+            for nightline, status, now in updates:
+                if status:
+                    nightline.status_id = status.id
+                if now is not None:
+                    nightline.now = now
+            NightlineChange.record_many(names)
+            cls._commit([nightline for nightline, _, _ in updates])  # So queueing their story posts doesn't load them again
         except Exception as e:
-            logger.error(f"Error while fetching the nightlines: {e}")
-            return []
+            db.session.rollback()
+            logger.error(f"Failed to update the status of {len(updates)} nightlines: {e}")
+            return False
+
+        public_snapshot.bump(*names)
+
+        logger.info(f"Updated the status of {len(updates)} nightlines")
+        return True
+
+    @classmethod
+    def enqueue_instagram_stories(cls, nightlines: List["Nightline"]) -> Optional[List[Tuple[str, InstagramJob]]]:
+        """Queue posting the story slide of the current status of nightlines that configured it. Returns the jobs by nightline name"""
+        by_id = {nightline.id: nightline for nightline in nightlines}
+        configured = (
+            db.session.query(NightlineStatus.nightline_id)
+            .join(cls, and_(cls.id == NightlineStatus.nightline_id, cls.status_id == NightlineStatus.status_id))
+            .filter(NightlineStatus.nightline_id.in_(by_id), NightlineStatus.instagram_story.is_(True))
+            .order_by(NightlineStatus.nightline_id)
+        )
+        nightline_ids = [nightline_id for (nightline_id,) in configured]
+        status_names = {nightline_id: by_id[nightline_id].public_state()["status_name"] for nightline_id in nightline_ids}
+
+        jobs = InstagramJob.enqueue_many(nightline_ids, POST_STORY, status_names)
+        if jobs is None:
+            return None
+        if jobs:
+            instagram_job_worker.notify()
+        return [(by_id[job.nightline_id].name, job) for job in jobs]
+
+    @classmethod
+    def enqueue_instagram_story_deletions(cls, notify: bool = True) -> Optional[List[Tuple[str, InstagramJob]]]:
+        """Queue deleting the stories of all nightlines that have or may get one. Returns the jobs by nightline name
+
+        With notify=False the job worker of this process isn't started, e.g. because the caller processes the jobs itself.
+        """
+        unfinished_jobs = (
+            db.session.query(InstagramJob.id).filter(InstagramJob.nightline_id == cls.id, InstagramJob.state.in_((PENDING, RUNNING))).exists()
+        )
+        rows = (
+            db.session.query(cls.id, cls.name)
+            .join(InstagramAccount, InstagramAccount.nightline_id == cls.id)
+            .filter(or_(and_(cls.instagram_media_id.isnot(None), cls.instagram_media_id != ""), unfinished_jobs))
+            .order_by(cls.id)
+            .all()
+        )
+
+        jobs = InstagramJob.enqueue_many([nightline_id for nightline_id, _ in rows], DELETE_STORY)
+        if jobs is None:
+            return None
+        if jobs and notify:
+            instagram_job_worker.notify()
+        return [(name, job) for (_, name), job in zip(rows, jobs)]
+
+    def public_state(self) -> Dict[str, Any]:
+        """Return the publicly visible state of the nightline"""
+        status = cast(StatusInfo, status_registry.get_by_id(self.status_id) or self.status)
+        return {
+            "nightline_name": self.name,
+            "status_name": status.name,
+            "description_de": status.description_de,
+            "description_en": status.description_en,
+            "description_now_de": status.description_now_de,
+            "description_now_en": status.description_now_en,
+            "now": self.now,
+        }
 
     def set_status(self, name: str) -> bool:
         """Set the status of a nightline by the status name"""
-        logger.debug(f"Set status of nightline '{self.name}' to: '{name}'")
+        nightline_name = self.name  # Still known if a failed update expired the nightline
+        logger.debug(f"Set status of nightline '{nightline_name}' to: '{name}'")
 
         try:
-            new_status = Status.get_status(name)
+            new_status = Status.get_status_info(name)
             if not new_status:
                 logger.info(f"Status '{name}' not found. Status not changed")
                 return False
 
-            self.status = new_status
-            db.session.commit()
+            self.status_id = new_status.id
+            NightlineChange.record(nightline_name)
+            self._commit([self])
+            public_snapshot.bump(nightline_name)
 
             logger.info(f"Status '{name}' set successfully")
             return True
         except Exception as e:
-            logger.error(f"Failed to set status '{name}' for nightline '{self.name}': {e}")
+            logger.error(f"Failed to set status '{name}' for nightline '{nightline_name}': {e}")
             db.session.rollback()
             return False
 
@@ -168,22 +368,23 @@ class Nightline(db.Model):  # type: ignore
 
     def set_now(self, now: bool) -> bool:
         """Set now value of a nightline"""
+        nightline_name = self.name  # Still known if a failed update expired the nightline
         try:
-            logger.info(f"Set the now value of nightline: '{self.name}' to: '{now}'")
+            logger.info(f"Set the now value of nightline: '{nightline_name}' to: '{now}'")
             self.now = now
-            db.session.commit()
+            NightlineChange.record(nightline_name)
+            self._commit([self])
+            public_snapshot.bump(nightline_name)
             return True
         except Exception as e:
-            logger.error(f"Failed to set now value for nightline '{self.name}' to '{now}': {e}")
+            logger.error(f"Failed to set now value for nightline '{nightline_name}' to '{now}': {e}")
             db.session.rollback()
             return False
 
     def get_instagram_story_config(self) -> bool:
         """Get the Instagram story config for the current status"""
-        nightline_status = NightlineStatus.get_nightline_status(nightline_id=self.id, status_id=self.status.id)
-        if nightline_status:
-            return cast(bool, nightline_status.instagram_story)
-        return False
+        nightline_status = NightlineStatus.get_nightline_status(nightline_id=self.id, status_id=self.status_id)
+        return cast(bool, nightline_status.instagram_story)
 
     def set_instagram_media_id(self, media_id: Optional[str]) -> bool:
         logger.debug(f"Setting media id for a status of nightline '{self.name}'")
@@ -200,25 +401,39 @@ class Nightline(db.Model):  # type: ignore
         """Get the API key"""
         return ApiKey.get_api_key(self.id)
 
-    def renew_api_key(self) -> bool:
-        """Generate and assign a new 256B API key to the nightline"""
+    def renew_api_key(self) -> Optional[str]:
+        """Generate and assign a new 256B API key to the nightline. Returns the new key, which is only available now"""
         logger.debug(f"Renew api key of nightline: '{self.name}'")
 
         api_key = ApiKey.get_api_key(self.id)
         if not api_key:
             logger.warning(f"No API key found for nightline: '{self.name}'")
-            return False
+            return None
 
         try:
-            api_key.key = ApiKey.generate_api_key()
+            key = api_key.set_key()
             db.session.commit()
+            nightline_tokens.update(self.id, api_key.generation, api_key.key_hash)
 
             logger.info(f"API key for nightline '{self.name}' renewed successfully")
-            return True
+            return key
         except SQLAlchemyError as e:
             logger.error(f"Database error while renewing API key for nightline '{self.name}': {e}")
             db.session.rollback()
-            return False
+            return None
+
+    def issue_token(self) -> Optional[str]:
+        """Issue a signed token for the current API key of the nightline. Returns None if tokens are disabled"""
+        if not nightline_tokens.enabled:
+            logger.warning(f"Token requested for nightline '{self.name}' but tokens are disabled")
+            return None
+
+        api_key = ApiKey.get_api_key(self.id)
+        if not api_key:
+            logger.warning(f"No API key found for nightline: '{self.name}'")
+            return None
+
+        return nightline_tokens.issue(self.id, self.name, api_key.generation, api_key.key_hash)
 
     def add_instagram_account(self, username: str, password: str) -> bool:
         """Creates an Instagram account for the Nightline and saves it."""
@@ -280,8 +495,10 @@ class Nightline(db.Model):  # type: ignore
             return False
 
         try:
+            account_id = self.instagram_account.id
             db.session.delete(self.instagram_account)
             db.session.commit()
+            instagram_clients.discard(account_id)
 
             logger.info(f"Instagram account deleted for Nightline '{self.name}'.")
             return True
@@ -290,22 +507,32 @@ class Nightline(db.Model):  # type: ignore
             db.session.rollback()
             return False
 
+    def enqueue_instagram_story(self, status_name: str) -> Optional[InstagramJob]:
+        """Queue posting the story slide of a status, which is done by the instagram job worker"""
+        job = InstagramJob.enqueue(self.id, POST_STORY, status_name)
+        if job:
+            instagram_job_worker.notify()
+        return job
+
+    def enqueue_instagram_story_deletion(self) -> Optional[InstagramJob]:
+        """Queue deleting the current story, which is done by the instagram job worker after all earlier jobs"""
+        job = InstagramJob.enqueue(self.id, DELETE_STORY)
+        if job:
+            instagram_job_worker.notify()
+        return job
+
     def post_instagram_story(self, status_name: str) -> bool:
         if not self.instagram_account:
             logger.warning(f"No Instagram account configured for nightline '{self.name}'.")
             return False
 
-        status = Status.get_status(status_name)
+        status = Status.get_status_info(status_name)
         if not status:
             logger.warning(f"No status with name '{status_name}' found.")
             return False
 
         nightline_status = NightlineStatus.get_nightline_status(nightline_id=self.id, status_id=status.id)
 
-        if not nightline_status:
-            logger.warning(f"NightlineStatus not found for status '{status_name}' and nightline '{self.name}'.")
-            return False
-
         # Check if posting an Instagram story is configured
         if not nightline_status.instagram_story:
             logger.info(f"Posting an Instagram story is not configured for status '{status_name}' of nightline '{self.name}'.")
@@ -317,10 +544,8 @@ class Nightline(db.Model):  # type: ignore
             return False
 
         # Post the story
-        instagram_username = self.instagram_account.username
-        instagram_password = self.instagram_account.get_password()
-        story_slide_path = nightline_status.instagram_story_slide.path
-        media_id = post_story(story_slide_path, instagram_username, instagram_password)
+        story_slide_path = nightline_status.instagram_story_slide.story_path
+        media_id = post_story(story_slide_path, cast(InstagramAccount, self.instagram_account))
         if media_id and self.set_instagram_media_id(media_id):
             logger.info(f"Successfully posted Instagram story for status '{status_name}' of nightline '{self.name}'.")
             return True
@@ -337,10 +562,7 @@ class Nightline(db.Model):  # type: ignore
             logger.warning(f"No Instagram account configured for nightline '{self.name}'.")
             return False
 
-        username = self.instagram_account.username
-        password = self.instagram_account.get_password()
-
-        if not delete_story_by_id(self.instagram_media_id, username, password):
+        if not delete_story_by_id(self.instagram_media_id, cast(InstagramAccount, self.instagram_account)):
             logger.error(f"Failed to delete Instagram story with media ID '{self.instagram_media_id}' for nightline '{self.name}'.")
             return False
 
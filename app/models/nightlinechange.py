@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Tuple, cast
+
+from sqlalchemy import func
+
+from app.logger import logger
+
+from ..db import db
+
+
+class NightlineChange(db.Model):  # type: ignore
+    """Change log of the public state of nightlines. Only the latest change per nightline is kept"""
+
+    __tablename__ = "nightline_changes"
+    __table_args__ = {"sqlite_autoincrement": True}  # Change versions must never be reused
+    id = db.Column(db.Integer, primary_key=True)
+    nightline_name = db.Column(db.String(50), nullable=False, unique=True)
+    removed = db.Column(db.Boolean, nullable=False, default=False)
+
+    @classmethod
+    def record(cls, nightline_name: str, removed: bool = False) -> None:
+        """Record a change of a nightline in the current transaction. The caller commits"""
+        logger.debug(f"Recording change of nightline: '{nightline_name}'")
+
+        # Don't flush the caller's pending changes early, they are flushed on commit
+        with db.session.no_autoflush:
+            cls.query.filter_by(nightline_name=nightline_name).delete()
+        db.session.add(cls(nightline_name=nightline_name, removed=removed))
+
+    @classmethod
+    def record_many(cls, nightline_names: List[str]) -> None:
+        """Record a change of several nightlines in the current transaction. The caller commits"""
+        logger.debug(f"Recording changes of {len(nightline_names)} nightlines")
+
+        with db.session.no_autoflush:
+            cls.query.filter(cls.nightline_name.in_(nightline_names)).delete(synchronize_session=False)
+        db.session.add_all([cls(nightline_name=name) for name in nightline_names])
+
+    @classmethod
+    def get_version(cls) -> int:
+        """Return the version of the latest change"""
+        return cast(int, db.session.query(func.coalesce(func.max(cls.id), 0)).scalar())
+
+    @classmethod
+    def list_changes(cls, since: int) -> Tuple[int, List[Dict[str, Any]], List[str]]:
+        """List the current state of nightlines changed after a version and the names of removed nightlines"""
+        from .nightline import Nightline, NightlineRow
+        from .status import Status
+
+        logger.debug(f"Listing nightline changes since version: '{since}'")
+
+        # Only return changes up to a fixed version so no concurrent change is skipped by the client
+        version = cls.get_version()
+        rows = (
+            db.session.query(cls.nightline_name, cls.removed, Nightline.id, *Nightline.public_columns())
+            .outerjoin(Nightline, Nightline.name == cls.nightline_name)
+            .outerjoin(Status, Status.id == Nightline.status_id)
+            .filter(cls.id > since, cls.id <= version)
+            .order_by(cls.id)
+            .all()
+        )
+
+        changed = []
+        removed = []
+        for nightline_name, is_removed, nightline_id, *columns in rows:
+            if is_removed or nightline_id is None:
+                removed.append(nightline_name)
+            else:
+                changed.append(NightlineRow(*columns).public_state())
+
+        logger.info(f"Listed {len(changed)} changed and {len(removed)} removed nightlines since version: '{since}'")
+        return version, changed, removed
+
+    @classmethod
+    def initialize(cls) -> bool:
+        """Record a change for every nightline that has none, e.g. nightlines created before the change log existed"""
+        from .nightline import Nightline
+
+        try:
+            recorded = {name for (name,) in db.session.query(cls.nightline_name)}
+            missing = [name for (name,) in db.session.query(Nightline.name).order_by(Nightline.id) if name not in recorded]
+            for name in missing:
+                db.session.add(cls(nightline_name=name))
+            db.session.commit()
+
+            if missing:
+                logger.info(f"Recorded changes for {len(missing)} nightlines")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error while initializing the nightline change log: {e}")
+            return False
+
+    def __repr__(self) -> str:
+        return f"NightlineChange('{self.id}')"
@@ -9,10 +9,16 @@ from ..db import db
 
 if TYPE_CHECKING:  # pragma: no cover
     from app.models.nightline import Nightline
-    from app.models.status import Status
+    from app.models.status import Status, StatusInfo
 
 
 class NightlineStatus(db.Model):  # type: ignore
+    """Configuration of a status of a nightline
+
+    Only configurations that differ from the default (no instagram story, no story slide) are stored.
+    A missing entry resolves to the default configuration.
+    """
+
     __tablename__ = "nightline_statuses"
     id = db.Column(db.Integer, primary_key=True)
     nightline_id = db.Column(db.Integer, db.ForeignKey("nightlines.id"), nullable=False)
@@ -22,59 +28,52 @@ class NightlineStatus(db.Model):  # type: ignore
     instagram_story = db.Column(db.Boolean, nullable=False, default=False)
     instagram_story_slide = db.relationship(StorySlide, back_populates="nightline_status", uselist=False)
 
+    # A nightline has at most one entry per status
+    __table_args__ = (db.Index("ix_nightline_statuses_nightline_id_status_id", nightline_id, status_id, unique=True),)
+
     @classmethod
-    def get_nightline_status(cls, nightline_id: int, status_id: int) -> Optional["NightlineStatus"]:
+    def get_nightline_status(cls, nightline_id: int, status_id: int) -> "NightlineStatus":
+        """Return the configuration of a status of a nightline. Without a stored entry an unsaved default one is returned"""
         nightline_status = cast(Optional["NightlineStatus"], NightlineStatus.query.filter_by(nightline_id=nightline_id, status_id=status_id).first())
-        return nightline_status
+        if nightline_status:
+            return nightline_status
+        return cls(nightline_id=nightline_id, status_id=status_id, instagram_story=False)
 
     @classmethod
-    def add_new_status_for_all_nightlines(cls, status: "Status") -> bool:
-        from .nightline import Nightline
+    def store_nightline_status(cls, nightline_id: int, status_id: int) -> Optional["NightlineStatus"]:
+        """Return the stored configuration of a status of a nightline, storing the default one if there is none"""
+        nightline_status = cls.get_nightline_status(nightline_id, status_id)
+        if nightline_status.id is not None:
+            return nightline_status
 
-        """Create NightlineStatus entries for all Nightlines for a given Status"""
-        logger.debug(f"Creating NightlineStatus entries for all nightlines with status '{status.name}'")
-
-        nightlines = Nightline.list_nightlines()
         try:
-            for nightline in nightlines:
-                new_nightline_status = NightlineStatus(
-                    nightline_id=nightline.id,
-                    status_id=status.id,
-                    instagram_story=False,  # Default to False for instagram story
-                )
-                db.session.add(new_nightline_status)
+            db.session.add(nightline_status)
             db.session.commit()
-
-            logger.info(f"NightlineStatus entries created successfully for status '{status.name}'")
-            return True
+            logger.debug(f"Stored NightlineStatus entry for nightline with ID: '{nightline_id}' and status with ID: '{status_id}'")
+            return nightline_status
         except SQLAlchemyError as e:
             db.session.rollback()
-            logger.error(f"Error creating NightlineStatus entries for status '{status.name}': {e}")
-            return False
+            logger.error(f"Error storing NightlineStatus entry for nightline with ID: '{nightline_id}' and status with ID: '{status_id}': {e}")
+            return None
 
-    @classmethod
-    def add_statuses_for_new_nightlines(cls, nightline: "Nightline") -> bool:
-        from .status import Status
+    @property
+    def is_default(self) -> bool:
+        """Check if the entry holds the default configuration, which doesn't need to be stored"""
+        return not self.instagram_story and not self.instagram_story_slide
 
-        """Create NightlineStatus entries for all Statuses for a nightline"""
-        logger.debug(f"Creating NightlineStatus entries for all statuses for nightline '{nightline.name}'")
+    def prune(self) -> bool:
+        """Delete the stored entry if it holds the default configuration"""
+        if self.id is None or not self.is_default:
+            return True
 
-        statuses = Status.list_statuses()
         try:
-            for status in statuses:
-                new_nightline_status = NightlineStatus(
-                    nightline_id=nightline.id,
-                    status_id=status.id,
-                    instagram_story=False,  # Default to False for instagram story
-                )
-                db.session.add(new_nightline_status)
+            db.session.delete(self)
             db.session.commit()
-
-            logger.info(f"NightlineStatus entries created successfully for nightline '{nightline.name}'")
+            logger.debug(f"Removed default NightlineStatus entry for nightline with ID: '{self.nightline_id}' and status with ID: '{self.status_id}'")
             return True
         except SQLAlchemyError as e:
             db.session.rollback()
-            logger.error(f"Error creating NightlineStatus entries for nightline '{nightline.name}': {e}")
+            logger.error(f"Error removing default NightlineStatus entry with ID: '{self.id}': {e}")
             return False
 
     @classmethod
@@ -86,13 +85,9 @@ class NightlineStatus(db.Model):  # type: ignore
             # Delete all NightlineStatus entries that reference the given status
             rows_deleted = NightlineStatus.query.filter_by(status_id=status.id).delete()
 
-            if rows_deleted > 0:
-                db.session.commit()
-                logger.info(f"Successfully deleted '{rows_deleted}' NightlineStatus entries for status: '{status.name}'")
-                return True
-            else:  # This would be an out of sync state as we have a status object but no nightline status objects for it
-                logger.warning(f"No NightlineStatus entries found for status: '{status.name}'")
-                return False
+            db.session.commit()
+            logger.info(f"Successfully deleted '{rows_deleted}' NightlineStatus entries for status: '{status.name}'")
+            return True
         except SQLAlchemyError as e:
             db.session.rollback()
             logger.error(f"Error deleting NightlineStatus entries for status: '{status.name}': {e}")
@@ -107,34 +102,32 @@ class NightlineStatus(db.Model):  # type: ignore
             # Delete all NightlineStatus entries that reference the given nightline_id
             rows_deleted = NightlineStatus.query.filter_by(nightline_id=nightline.id).delete()
 
-            if rows_deleted > 0:
-                db.session.commit()
-                logger.info(f"Successfully deleted '{rows_deleted}' NightlineStatus entries for nightline: '{nightline.name}'")
-                return True
-            else:  # This would be an out of sync state as we have a status object but no nightline status objects for it
-                logger.warning(f"No NightlineStatus entries found for nightline: '{nightline.name}'")
-                return False
+            db.session.commit()
+            logger.info(f"Successfully deleted '{rows_deleted}' NightlineStatus entries for nightline: '{nightline.name}'")
+            return True
         except SQLAlchemyError as e:
             db.session.rollback()
             logger.error(f"Error deleting NightlineStatus entries for nightline: '{nightline.name}': {e}")
             return False
 
     @classmethod
-    def update_instagram_story(cls, nightline: "Nightline", status: "Status", instagram_story: bool) -> bool:
+    def update_instagram_story(cls, nightline: "Nightline", status: "StatusInfo", instagram_story: bool) -> bool:
         """Update the instagram_story value for a specific nightline and status."""
         logger.debug(f"Updating instagram_story for nightline: '{nightline.name}' and status: '{status.name}' to '{instagram_story}'")
 
         try:
-            nightline_status = NightlineStatus.query.filter_by(nightline_id=nightline.id, status_id=status.id).first()
-
-            if nightline_status:
-                nightline_status.instagram_story = instagram_story
-                db.session.commit()
-                logger.info(f"Updated instagram_story for nightline: '{nightline.name}', status: '{status.name}' to '{instagram_story}'")
-                return True
-            else:  # This would be an out of sync state as we have a status object but no nightline status objects for it
-                logger.warning(f"No NightlineStatus entry found for nightline: '{nightline.name}' and status: {status.name}")
-                return False
+            nightline_status = cls.get_nightline_status(nightline.id, status.id)
+            nightline_status.instagram_story = instagram_story
+
+            # Only store entries that differ from the default configuration
+            if not nightline_status.is_default:
+                db.session.add(nightline_status)
+            elif nightline_status.id is not None:
+                db.session.delete(nightline_status)
+            db.session.commit()
+
+            logger.info(f"Updated instagram_story for nightline: '{nightline.name}', status: '{status.name}' to '{instagram_story}'")
+            return True
         except SQLAlchemyError as e:
             db.session.rollback()
             logger.error(f"Error updating instagram_story for nightline: '{nightline.name}', status: '{status.name}': {e}")
@@ -0,0 +1,12 @@
+from ..db import db
+
+
+class SchemaMigration(db.Model):  # type: ignore
+    """Versions of the schema migrations applied to the database"""
+
+    __tablename__ = "schema_migrations"
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"SchemaMigration('{self.version}')"
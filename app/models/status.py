@@ -1,6 +1,11 @@
-from typing import List, Optional, cast
+from typing import Any, Dict, List, Optional, cast
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, object_session
 
 from app.logger import logger
+from app.snapshot import public_snapshot
 
 from ..db import db
 from .nightlinestatus import NightlineStatus
@@ -14,6 +19,7 @@ class Status(db.Model):  # type: ignore
     description_en = db.Column(db.String(200), nullable=False)
     description_now_de = db.Column(db.String(200), nullable=False)
     description_now_en = db.Column(db.String(200), nullable=False)
+    languages = db.Column(db.Integer, nullable=False, default=0)  # Bitmask of LANGUAGES
 
     @classmethod
     def get_status(cls, name: str) -> Optional["Status"]:
@@ -27,6 +33,11 @@ class Status(db.Model):  # type: ignore
             logger.info(f"Status '{name}' not found")
         return status
 
+    @classmethod
+    def get_status_info(cls, name: str) -> Optional["StatusInfo"]:
+        """Return a status by name from the status registry, without querying the database"""
+        return status_registry.get(name)
+
     @classmethod
     def add_status(
         cls,
@@ -35,6 +46,7 @@ class Status(db.Model):  # type: ignore
         description_en: str,
         description_now_de: str,
         description_now_en: str,
+        languages: int = 0,
     ) -> Optional["Status"]:
         """Add a new status to the db"""
         logger.debug(f"Adding new status: {name}")
@@ -50,12 +62,11 @@ class Status(db.Model):  # type: ignore
                 description_en=description_en,
                 description_now_de=description_now_de,
                 description_now_en=description_now_en,
+                languages=languages,
             )
             db.session.add(new_status)
             db.session.commit()
-
-            # Create NightlineStatus entries for all Nightlines
-            NightlineStatus.add_new_status_for_all_nightlines(new_status)
+            public_snapshot.bump()
 
             logger.info(f"Status '{name}' added successfully")
             return new_status
@@ -79,12 +90,12 @@ class Status(db.Model):  # type: ignore
         try:
             db.session.delete(status_to_remove)
             db.session.commit()
+            public_snapshot.bump()
 
             logger.info(f"Status '{name}' removed successfully")
             return status_to_remove
         except Exception as e:
             db.session.rollback()
-            NightlineStatus.add_new_status_for_all_nightlines(status_to_remove)  # Re-add status to nls to prevent an out of sync state
             logger.error(f"Error removing status '{name}': {e}")
             return None
 
@@ -102,5 +113,126 @@ class Status(db.Model):  # type: ignore
             logger.error(f"Error while fetching the statuses: {e}")
             return []
 
+    def set_languages(self, languages: int) -> bool:
+        """Set the bitmask of languages spoken by nightlines with this status"""
+        logger.debug(f"Set languages of status '{self.name}' to: '{languages}'")
+
+        try:
+            self.languages = languages
+            db.session.commit()
+            public_snapshot.bump()
+
+            logger.info(f"Languages of status '{self.name}' set successfully")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to set languages of status '{self.name}': {e}")
+            return False
+
     def __repr__(self) -> str:
         return f"Status('{self.name}')"
+
+
+class StatusInfo:
+    """Lightweight, read-only copy of a status, detached from the database session"""
+
+    __slots__ = (
+        "id",
+        "name",
+        "description_de",
+        "description_en",
+        "description_now_de",
+        "description_now_en",
+        "languages",
+    )
+
+    def __init__(self, status: Status) -> None:
+        self.id: int = status.id
+        self.name: str = status.name
+        self.description_de: str = status.description_de
+        self.description_en: str = status.description_en
+        self.description_now_de: str = status.description_now_de
+        self.description_now_en: str = status.description_now_en
+        self.languages: int = status.languages
+
+    def __repr__(self) -> str:
+        return f"StatusInfo('{self.name}')"
+
+
+class StatusRegistry:
+    """Process-wide catalog of all statuses, so resolving a status is a dict lookup
+
+    Statuses changed in this process invalidate the registry when the change is committed. Every change of the
+    statuses also bumps the version of all nightlines in the public snapshot, which is shared by all worker processes
+    if a shared state is attached. The registry reloads whenever that version changed.
+    """
+
+    def __init__(self) -> None:
+        self._version = -1
+        self._engine: Optional[Engine] = None
+        self._by_name: Dict[str, StatusInfo] = {}
+        self._by_id: Dict[int, StatusInfo] = {}
+
+    def load(self) -> None:
+        """Load all statuses from the database"""
+        version = public_snapshot.all_version  # Read before loading, so a concurrent change causes another reload
+        statuses = [StatusInfo(status) for status in Status.query.order_by(Status.id)]
+
+        self._by_name = {status.name: status for status in statuses}
+        self._by_id = {status.id: status for status in statuses}
+        self._version = version
+        self._engine = db.engine
+        logger.debug(f"Loaded {len(statuses)} statuses into the status registry")
+
+    def invalidate(self) -> None:
+        """Reload the statuses on the next lookup"""
+        self._version = -1
+
+    def _refresh(self) -> None:
+        """Reload the statuses if they changed since they were loaded"""
+        if self._version != public_snapshot.all_version or self._engine is not db.engine:
+            self.load()
+
+    def get(self, name: str) -> Optional[StatusInfo]:
+        """Return a status by name"""
+        self._refresh()
+        status = self._by_name.get(name)
+        if status is None:  # Without a shared state, the status might have been added by another process
+            self.load()
+            status = self._by_name.get(name)
+        return status
+
+    def get_by_id(self, status_id: int) -> Optional[StatusInfo]:
+        """Return a status by id"""
+        self._refresh()
+        status = self._by_id.get(status_id)
+        if status is None:
+            self.load()
+            status = self._by_id.get(status_id)
+        return status
+
+    def list(self) -> List[StatusInfo]:
+        """List all statuses"""
+        self._refresh()
+        return list(self._by_name.values())
+
+
+status_registry = StatusRegistry()
+
+
+@event.listens_for(Status, "after_insert")
+@event.listens_for(Status, "after_update")
+@event.listens_for(Status, "after_delete")
+def _mark_statuses_changed(mapper: Any, connection: Any, status: Status) -> None:
+    """Remember that the statuses changed in the transaction of the session"""
+    session = object_session(status)
+    if session is not None:
+        session.info["statuses_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_status_registry(session: Session) -> None:
+    """Invalidate the status registry once a transaction that changed statuses ended"""
+    if session.info.pop("statuses_changed", False):
+        status_registry.invalidate()
@@ -1,6 +1,7 @@
 import os
+import uuid
 from pathlib import Path
-from typing import TYPE_CHECKING, Optional, cast
+from typing import TYPE_CHECKING, Optional, Tuple, cast
 
 from werkzeug.datastructures.file_storage import FileStorage
 
@@ -9,11 +10,13 @@ from app.db import db
 from app.filehandler import (
     check_file_already_exists,
     ensure_storage_path_exists,
+    ingest_file,
     remove_file,
-    save_file,
+    replace_file,
     validate_file_extension,
 )
 from app.logger import logger
+from app.slideprocessing import story_file_path, story_slide_renderer
 
 if TYPE_CHECKING:  # pragma: no cover
     from app.models.nightlinestatus import NightlineStatus
@@ -24,12 +27,13 @@ class StorySlide(db.Model):  # type: ignore
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(20))  # max length = max status name + . + file extension = 15 + 1 + 3
     path = db.Column(db.String(100))  # max length = ./instance/nightlines/[22] nl-xy[50] /[1] status[15] .png[4] = 92
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 digest of the uploaded file
     nightline_status_id = db.Column(db.Integer, db.ForeignKey("nightline_statuses.id"), unique=True, nullable=False)
     nightline_status = db.relationship("NightlineStatus", back_populates="instagram_story_slide")
 
     @classmethod
-    def _save_story_slide_file(cls, file: FileStorage, nightline_status: "NightlineStatus", overwrite: bool = False) -> Optional[Path]:
-        """Handles saving the file and checks if the file already exists."""
+    def _save_story_slide_file(cls, file: FileStorage, nightline_status: "NightlineStatus", overwrite: bool = False) -> Optional[Tuple[Path, str]]:
+        """Handles saving the file and checks if the file already exists. Returns the path and the SHA-256 digest of the file"""
 
         # Validate file type
         extension = validate_file_extension(file)
@@ -50,17 +54,40 @@ class StorySlide(db.Model):  # type: ignore
         if existing_file_path:
             if overwrite:
                 logger.debug(f"Replacing the already existing story slide: '{existing_file_path}' for status: '{nightline_status.status.name}'")
-                remove_file(existing_file_path)
             else:
                 logger.warning(f"Found an existing story slide for status: '{nightline_status.status.name}' of nightline: '{nightline_status.nightline.name}'")
                 return None
 
-        # Save the file to the storage path
+        # Stream the file next to the story slide and prepare it from there. The current story slide, and its version
+        # ready to post, are only replaced once the new one is prepared, so a failed upload keeps them
         filename = f"{base_filename}.{extension}"
         file_path = Path(os.path.join(storage_path, filename))
-        if save_file(file, file_path):
-            return file_path
-        return None
+        upload_path = file_path.with_name(f".{filename}.{uuid.uuid4().hex}.upload")
+        content_hash = ingest_file(file, upload_path, Config.MAX_CONTENT_LENGTH)
+        if not content_hash:
+            return None
+
+        # Normalize the slide for instagram now, so posting it is only an upload. An unchanged slide is already prepared
+        story_slide = nightline_status.instagram_story_slide
+        story_file = story_file_path(file_path)
+        if story_slide and story_slide.content_hash == content_hash and story_file.exists():
+            logger.debug(f"Story slide '{file_path}' is unchanged and already prepared for instagram")
+        elif not story_slide_renderer.render(upload_path, story_file):
+            remove_file(upload_path)
+            return None
+
+        if not replace_file(upload_path, file_path):
+            remove_file(upload_path)
+            return None
+        if existing_file_path and Path(existing_file_path) != file_path:
+            remove_file(existing_file_path)
+        return file_path, content_hash
+
+    @property
+    def story_path(self) -> Path:
+        """Path of the file to post. Slides uploaded before they were prepared for instagram are posted as they are"""
+        story_file = story_file_path(Path(self.path))
+        return story_file if story_file.exists() else Path(self.path)
 
     @classmethod
     def get_story_slide_by_nightline_status(cls, nightline_status: "NightlineStatus") -> Optional["StorySlide"]:
@@ -78,9 +105,10 @@ class StorySlide(db.Model):  # type: ignore
     def update_story_slide(cls, file: FileStorage, nightline_status: "NightlineStatus") -> Optional["StorySlide"]:
         """Create a story slide object, referencing the file and filepath"""
         # Save the file and get the file path
-        file_path = cls._save_story_slide_file(file, nightline_status, overwrite=True)
-        if not file_path:
+        saved_file = cls._save_story_slide_file(file, nightline_status, overwrite=True)
+        if not saved_file:
             return None
+        file_path, content_hash = saved_file
 
         # Create or update the StorySlide object and save it to the database
         try:
@@ -89,12 +117,14 @@ class StorySlide(db.Model):  # type: ignore
                 story_slide = cls(
                     filename=os.path.basename(file_path),
                     path=str(file_path),
+                    content_hash=content_hash,
                     nightline_status_id=nightline_status.id,
                 )
                 db.session.add(story_slide)
             else:
                 story_slide.filename = os.path.basename(file_path)
                 story_slide.path = str(file_path)
+                story_slide.content_hash = content_hash
             db.session.commit()
 
             logger.info(f"StorySlide for status: '{nightline_status.status.name}' of nightline: '{nightline_status.nightline.name}' updated successfully")
@@ -120,10 +150,16 @@ class StorySlide(db.Model):  # type: ignore
             logger.warning(f"Failed to remove file at path: '{slide_path}' for status: '{status_name}' of nightline: '{nightline_name}'")
             return False
 
+        story_file = story_file_path(Path(slide_path))
+        if story_file.exists():
+            remove_file(story_file)
+
         try:
             db.session.delete(nightline_status.instagram_story_slide)
             db.session.commit()
             logger.info(f"StorySlide for status: '{status_name}' of nightline: '{nightline_name}' removed successfully")
+
+            nightline_status.prune()  # The configuration may be the default again
             return True
         except Exception as e:
             db.session.rollback()
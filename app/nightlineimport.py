@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.logger import logger
+from app.models import Nightline
+
+
+def parse_nightline_names(content: str, filename: str = "") -> Any:
+    """Read the names of nightlines to import from a JSON list or the first column of a CSV file, chosen by the file extension
+
+    A CSV header row 'nightline' and empty rows are skipped. Returns None if the content can't be parsed.
+    """
+    if filename.lower().endswith(".json"):
+        try:
+            return json.loads(content)
+        except ValueError:
+            return None
+
+    try:
+        names = [row[0].strip() for row in csv.reader(io.StringIO(content)) if row and row[0].strip()]
+    except csv.Error:
+        return None
+    if names and names[0].lower() == "nightline":
+        names = names[1:]
+    return names
+
+
+def check_nightline_names(names: Any, limit: Optional[int] = None) -> Optional[str]:
+    """Check a list of nightline names to import. Returns the reason if they are invalid"""
+    if not isinstance(names, list) or not names or (limit is not None and len(names) > limit):
+        if limit is not None:
+            return f"'nightlines' must be a list of 1 to {limit} nightline names"
+        return "'nightlines' must be a non-empty list of nightline names"
+
+    seen = set()
+    for name in names:
+        if not isinstance(name, str) or not name.strip().lower().isalnum() or len(name.strip()) > 50:
+            return f"Invalid name format: '{name}'"
+        sanitized_name = name.strip().lower()
+        if sanitized_name in seen:
+            return f"Nightline '{sanitized_name}' is imported more than once"
+        seen.add(sanitized_name)
+    return None
+
+
+def import_nightlines(names: List[str], batch_size: int) -> Iterator[Dict[str, Any]]:
+    """Create nightlines in batches of one transaction each and yield the result of every nightline as soon as its batch is stored
+
+    A result is either {'nightline': name, 'api_key': key} or {'nightline': name, 'skipped': 'already exists'}. If a batch
+    fails, {'error': reason} is yielded and the remaining nightlines are not imported.
+    """
+    names = [name.strip().lower() for name in names]
+    logger.info(f"Importing {len(names)} nightlines in batches of {batch_size}")
+
+    for start in range(0, len(names), batch_size):
+        batch = names[start : start + batch_size]
+        created = Nightline.add_nightlines(batch)
+        if created is None:
+            yield {"error": f"Importing the nightlines failed after {start} of {len(names)} nightlines"}
+            return
+
+        keys = dict(created)
+        for name in batch:
+            if name in keys:
+                yield {"nightline": name, "api_key": keys[name]}
+            else:
+                yield {"nightline": name, "skipped": "already exists"}
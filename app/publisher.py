@@ -0,0 +1,83 @@
+import fcntl
+import gzip
+from pathlib import Path
+from typing import Optional
+
+from app.filehandler import ensure_storage_path_exists, remove_file, write_file_atomic
+from app.logger import logger
+from app.snapshot import public_snapshot
+
+ALL_NIGHTLINES_FILE = "all.json"
+
+
+class StaticPublisher:
+    """Publishes the public state as static JSON files, so a reverse proxy can serve public reads"""
+
+    def __init__(self) -> None:
+        self.directory: Optional[Path] = None
+
+    def init_app(self, directory: str) -> bool:
+        """Publish the public state to a directory and keep it up to date after every change"""
+        storage_path = Path(directory)
+        if not ensure_storage_path_exists(storage_path):
+            logger.error(f"Static snapshot publishing disabled, directory '{directory}' is not available")
+            return False
+
+        if self.directory is None:
+            public_snapshot.add_listener(self.publish)
+        self.directory = storage_path
+        logger.info(f"Publishing static snapshots to: '{directory}'")
+        return self.publish()
+
+    @staticmethod
+    def _write_json(directory: Path, filename: str, data: bytes) -> bool:
+        """Write a JSON file and its precompressed variant"""
+        written = write_file_atomic(directory / filename, data)
+        written &= write_file_atomic(directory / f"{filename}.gz", gzip.compress(data, mtime=0))
+        return written
+
+    @staticmethod
+    def _remove_json(directory: Path, filename: str) -> None:
+        """Remove a JSON file and its precompressed variant"""
+        for path in (directory / filename, directory / f"{filename}.gz"):
+            if path.exists():
+                remove_file(path)
+
+    def publish(self, *nightline_names: str) -> bool:
+        """Write the files of changed nightlines, or of all nightlines if no name is given, and the list of all nightlines"""
+        directory = self.directory
+        if directory is None:
+            return False
+
+        try:
+            # Serialize publishers of all workers. Each one takes the snapshot after acquiring the lock, and the snapshot
+            # follows the shared state, so the last one to write has seen every change
+            with open(directory / ".lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                # The snapshot is already encoded, so publishing neither queries the database nor encodes JSON
+                fragments, body = public_snapshot.get_fragments()
+
+                names = list(nightline_names) or list(fragments)
+                if not nightline_names:  # Remove files of nightlines that no longer exist
+                    names += [path.name[: -len(".json")] for path in directory.glob("*.json") if path.name != ALL_NIGHTLINES_FILE]
+
+                published = True
+                for name in set(names):
+                    if not name.isalnum():
+                        logger.warning(f"Not publishing nightline with a name unsafe as filename: '{name}'")
+                    elif name in fragments:
+                        published &= self._write_json(directory, f"{name}.json", fragments[name])
+                    else:
+                        self._remove_json(directory, f"{name}.json")
+
+                published &= self._write_json(directory, ALL_NIGHTLINES_FILE, body)
+
+            logger.debug(f"Published static snapshot with {len(fragments)} nightlines")
+            return published
+        except Exception as e:
+            logger.error(f"Error publishing static snapshot: {e}")
+            return False
+
+
+static_publisher = StaticPublisher()
@@ -1,25 +1,41 @@
-from typing import TYPE_CHECKING, Dict, Tuple, cast
+import json
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple, cast
 
+from flask import Response, request, stream_with_context
 from flask_restx import Namespace, Resource, abort
 
-from app.models import Nightline
+from app.config import Config
+from app.models import InstagramJob, Nightline, Status
+from app.nightlineimport import check_nightline_names, import_nightlines, parse_nightline_names
 from app.routes.api_models import (
     admin_nightline_model,
-    api_key_model,
+    circuit_breaker_model,
     error_model,
+    import_nightlines_model,
+    new_api_key_model,
+    reset_all_model,
+    status_updates_model,
+    status_updates_result_model,
     success_model,
 )
 from app.routes.decorators import require_admin_key, sanitize_nightline_name
+from app.story_post import instagram_clients
+from app.validation import validate_request_body, validate_status_updates
 
 if TYPE_CHECKING:  # pragma: no cover
-    from app.models.apikey import ApiKey
+    from app.models.status import StatusInfo
 
 admin_nightline_ns = Namespace("admin nightline", description="Admin routes for nightlines - API key required", security="apikey")
 
 ad_nl_error_model = admin_nightline_ns.model("Error", error_model)
 ad_nl_success_model = admin_nightline_ns.model("Success", success_model)
-ad_nl_api_key_model = admin_nightline_ns.model("API-Key", api_key_model)
+ad_nl_new_api_key_model = admin_nightline_ns.model("New API-Key", new_api_key_model)
 ad_nl_admin_nightline_model = admin_nightline_ns.model("Admin Nightline", admin_nightline_model)
+ad_nl_reset_all_model = admin_nightline_ns.model("Reset All", reset_all_model)
+ad_nl_status_updates_model = admin_nightline_ns.model("Status Updates", status_updates_model)
+ad_nl_status_updates_result_model = admin_nightline_ns.model("Status Updates Result", status_updates_result_model)
+ad_nl_circuit_breaker_model = admin_nightline_ns.model("Circuit Breaker", circuit_breaker_model)
+ad_nl_import_nightlines_model = admin_nightline_ns.model("Import Nightlines", import_nightlines_model)
 
 
 @admin_nightline_ns.route("/<string:nightline_name>")
@@ -48,22 +64,24 @@ class NightlineResource(Resource):  # type: ignore
 
     @sanitize_nightline_name
     @require_admin_key
-    @admin_nightline_ns.response(200, "Success", ad_nl_success_model)  # type: ignore[misc]
+    @admin_nightline_ns.response(200, "Success", ad_nl_new_api_key_model)  # type: ignore[misc]
     @admin_nightline_ns.response(400, "Bad Request", ad_nl_error_model)  # type: ignore[misc]
     def post(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
-        """Add a new nightline with the default status"""
+        """Add a new nightline with the default status. Only a hash of its API-Key is stored, so the returned key can't be retrieved again"""
 
         if Nightline.get_nightline(nightline_name):
             abort(400, message=f"Nightline '{nightline_name}' already exists")
 
-        nightline = Nightline.add_nightline(nightline_name)
-        if not nightline:
+        # Created like a bulk import of one nightline, which hands out the generated key
+        keys = Nightline.add_nightlines([nightline_name])
+        if not keys:
             abort(
                 400,
                 message=f"Nightline '{nightline_name}' could not be added due to invalid data or duplication",
             )
+        keys = cast(List[Tuple[str, str]], keys)  # For mypi to know the correct type
 
-        response = {"message": f"Nightline '{nightline_name}' added successfully"}
+        response = {"message": f"Nightline '{nightline_name}' added successfully", "API-Key": keys[0][1]}
         return response, 200
 
     @sanitize_nightline_name
@@ -85,38 +103,132 @@ class NightlineResource(Resource):  # type: ignore
 class ApiKeyResource(Resource):  # type: ignore
     @sanitize_nightline_name  # Can return 400 error
     @require_admin_key
-    @admin_nightline_ns.response(200, "Success", ad_nl_api_key_model)  # type: ignore[misc]
+    @admin_nightline_ns.response(200, "Success", ad_nl_new_api_key_model)  # type: ignore[misc]
     @admin_nightline_ns.response(400, "Bad Request", ad_nl_error_model)  # type: ignore[misc]
     @admin_nightline_ns.response(404, "Nightline Not Found", ad_nl_error_model)  # type: ignore[misc]
     @admin_nightline_ns.response(500, "API-Key Error", ad_nl_error_model)  # type: ignore[misc]
-    def get(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
-        """Get the API-Key of a nightline"""
+    def patch(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+        """Renew the API-Key of a nightline. Only a hash is stored, so the returned key can't be retrieved again"""
         nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
-        nightline = cast(Nightline, nightline)
+        nightline = cast(Nightline, nightline)  # For mypi to know the correct type
 
-        api_key = nightline.get_api_key()
+        api_key = nightline.renew_api_key()
         if not api_key:
             abort(500, f"No api key found for nightline: '{nightline_name}'")
-        api_key = cast("ApiKey", api_key)
 
-        return {"API-Key": f"{api_key.key}"}, 200
+        return {"message": "API key regenerated successfully", "API-Key": cast(str, api_key)}, 200
 
-    @sanitize_nightline_name  # Can return 400 error
+
+@admin_nightline_ns.route("/all/reset")
+@admin_nightline_ns.doc(security="apikey")
+class ResetAllResource(Resource):  # type: ignore
     @require_admin_key
-    @admin_nightline_ns.response(200, "Success", ad_nl_success_model)  # type: ignore[misc]
+    @admin_nightline_ns.response(200, "Success", ad_nl_reset_all_model)  # type: ignore[misc]
+    @admin_nightline_ns.response(500, "Reset Error", ad_nl_error_model)  # type: ignore[misc]
+    def post(self) -> Tuple[Dict[str, Any], int]:
+        """Reset the status of all nightlines. Their instagram stories are deleted in the background"""
+        nightlines = Nightline.reset_all_statuses()
+        if nightlines is None:
+            abort(500, "Resetting the statuses failed")
+
+        jobs = Nightline.enqueue_instagram_story_deletions()
+        if jobs is None:
+            abort(500, "Statuses successfully reset but queueing the deletion of the instagram stories failed")
+
+        response = {
+            "message": f"Reset the status of {len(cast(List[str], nightlines))} nightlines",
+            "nightlines": nightlines,
+            "jobs": {name: job.id for name, job in cast(List[Tuple[str, InstagramJob]], jobs)},
+        }
+        return response, 200
+
+
+@admin_nightline_ns.route("/all/status")
+@admin_nightline_ns.doc(security="apikey")
+class StatusUpdatesResource(Resource):  # type: ignore
+    @require_admin_key
+    @admin_nightline_ns.expect(ad_nl_status_updates_model)  # type: ignore[misc]
+    @admin_nightline_ns.response(200, "Success", ad_nl_status_updates_result_model)  # type: ignore[misc]
     @admin_nightline_ns.response(400, "Bad Request", ad_nl_error_model)  # type: ignore[misc]
-    @admin_nightline_ns.response(404, "Nightline Not Found", ad_nl_error_model)  # type: ignore[misc]
-    @admin_nightline_ns.response(500, "API-Key Error", ad_nl_error_model)  # type: ignore[misc]
-    def patch(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
-        """Renew the API-Key of a nightline"""
-        nightline = Nightline.get_nightline(nightline_name)
-        if not nightline:
-            abort(404, f"Nightline '{nightline_name}' not found")
-        nightline = cast(Nightline, nightline)  # For mypi to know the correct type
+    @admin_nightline_ns.response(404, "Nightline or Status Not Found", ad_nl_error_model)  # type: ignore[misc]
+    @admin_nightline_ns.response(500, "Status Error", ad_nl_error_model)  # type: ignore[misc]
+    def patch(self) -> Tuple[Dict[str, Any], int]:
+        """Set the status and/or 'now' value of several nightlines at once. Configured instagram stories are posted in the background"""
+        # Parse and validate request body
+        data = request.get_json(force=True, silent=True)
+        validate_request_body(data, ["updates"])
+        updates = data["updates"]  # type: ignore[index]
+        validate_status_updates(updates)
+
+        names = [update["nightline"].strip().lower() for update in updates]
+        nightlines = Nightline.get_nightlines(names)
+        missing = [name for name in names if name not in nightlines]
+        if missing:
+            abort(404, f"Nightlines not found: {', '.join(repr(name) for name in missing)}")
+
+        changes: List[Tuple[Nightline, Optional["StatusInfo"], Optional[bool]]] = []
+        for name, update in zip(names, updates):
+            status = None
+            if "status" in update:
+                status = Status.get_status_info(update["status"].strip())
+                if not status:
+                    abort(404, f"Status '{update['status'].strip()}' not found")
+            changes.append((nightlines[name], status, update.get("now")))
+
+        if not Nightline.update_statuses(changes):
+            abort(500, "Updating the statuses failed")
+
+        # Queue posting the instagram stories of nightlines with a new status, if configured
+        jobs = Nightline.enqueue_instagram_stories([nightline for nightline, status, _ in changes if status])
+        if jobs is None:
+            abort(500, "Statuses updated but queueing the instagram story posts failed")
+
+        response = {
+            "message": f"Updated {len(changes)} nightlines",
+            "jobs": {name: job.id for name, job in cast(List[Tuple[str, InstagramJob]], jobs)},
+        }
+        return response, 200
 
-        if not nightline.renew_api_key():
-            abort(500, f"No api key found for nightline: '{nightline_name}'")
 
-        return {"message": "API key regenerated successfully"}, 200
+@admin_nightline_ns.route("/all/import")
+@admin_nightline_ns.doc(security="apikey")
+class ImportResource(Resource):  # type: ignore
+    @require_admin_key
+    @admin_nightline_ns.expect(ad_nl_import_nightlines_model)  # type: ignore[misc]
+    @admin_nightline_ns.response(200, "Success, one JSON object per line and nightline")  # type: ignore[misc]
+    @admin_nightline_ns.response(400, "Bad Request", ad_nl_error_model)  # type: ignore[misc]
+    def post(self) -> Response:
+        """Import nightlines from a JSON body or an uploaded CSV or JSON 'file'. Their API keys are streamed back as they are created
+
+        Every line of the response is a JSON object, either {'nightline', 'api_key'}, {'nightline', 'skipped'} for existing
+        nightlines or {'error'} if the import stopped. The API keys can't be retrieved again.
+        """
+        upload = request.files.get("file")
+        if upload:
+            names = parse_nightline_names(upload.read().decode("utf-8", errors="replace"), upload.filename or "")
+        else:
+            data = request.get_json(force=True, silent=True)
+            validate_request_body(data, ["nightlines"])
+            names = data["nightlines"]  # type: ignore[index]
+
+        error = check_nightline_names(names, Config.NIGHTLINE_IMPORT_LIMIT)
+        if error:
+            abort(400, error)
+
+        def generate() -> Iterator[str]:
+            for result in import_nightlines(names, Config.NIGHTLINE_IMPORT_BATCH_SIZE):
+                yield json.dumps(result) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@admin_nightline_ns.route("/instagram/breakers")
+@admin_nightline_ns.doc(security="apikey")
+class InstagramBreakersResource(Resource):  # type: ignore
+    @require_admin_key
+    @admin_nightline_ns.response(200, "Success", [ad_nl_circuit_breaker_model])  # type: ignore[misc]
+    def get(self) -> Tuple[List[Dict[str, Any]], int]:
+        """List the circuit breakers of Instagram calls of the worker process handling the request"""
+        return [breaker.to_dict() for breaker in instagram_clients.breakers()], 200
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Tuple, Union, cast
 
 from flask import Response, request
 from flask_restx import Namespace, Resource, abort
@@ -6,12 +6,14 @@ from flask_restx import Namespace, Resource, abort
 from app.models import Status
 from app.routes.api_models import (
     error_model,
+    set_status_languages_model,
     set_status_model,
     status_model,
     success_model,
 )
 from app.routes.decorators import require_admin_key
-from app.validation import validate_request_body, validate_status_value
+from app.snapshot import language_codes, language_mask
+from app.validation import validate_languages, validate_request_body, validate_status_value
 
 admin_status_ns = Namespace("admin status", description="Admin routes for statuses - API key required", security="apikey")
 
@@ -20,6 +22,7 @@ ad_st_error_model = admin_status_ns.model("Error", error_model)
 ad_st_success_model = admin_status_ns.model("Success", success_model)
 ad_st_status_model = admin_status_ns.model("Status", status_model)
 ad_st_set_status_model = admin_status_ns.model("Set Status", set_status_model)
+ad_st_set_status_languages_model = admin_status_ns.model("Set Status Languages", set_status_languages_model)
 
 
 @admin_status_ns.route("/")
@@ -32,7 +35,7 @@ class StatusResource(Resource):  # type: ignore
     def post(self) -> Tuple[Dict[str, str], int]:
         """Add a new status"""
         # Dynamically get required fields from the model
-        required_fields = [field_name for field_name, _ in ad_st_status_model.items()]
+        required_fields = [field_name for field_name, field in ad_st_status_model.items() if field.required]
 
         data = request.get_json()
         validate_request_body(data, required_fields)
@@ -40,7 +43,10 @@ class StatusResource(Resource):  # type: ignore
         status_name = data["status_name"]
         data.pop("status_name")
 
-        status = Status.add_status(name=status_name, **data)
+        languages = data.pop("languages", [])
+        validate_languages(languages)
+
+        status = Status.add_status(name=status_name, languages=language_mask(languages), **data)
         if not status:
             abort(
                 400,
@@ -50,6 +56,32 @@ class StatusResource(Resource):  # type: ignore
         response = {"message": f"Status '{status_name}' added successfully"}
         return response, 200
 
+    # Route to set the languages of a status
+    @require_admin_key
+    @admin_status_ns.expect(ad_st_set_status_languages_model)  # type: ignore[misc]
+    @admin_status_ns.response(200, "Success", ad_st_success_model)  # type: ignore[misc]
+    @admin_status_ns.response(400, "Bad Request", ad_st_error_model)  # type: ignore[misc]
+    @admin_status_ns.response(404, "Status Not Found", ad_st_error_model)  # type: ignore[misc]
+    def patch(self) -> Tuple[Dict[str, str], int]:
+        """Set the languages spoken by nightlines with a status"""
+        data = request.get_json()
+        validate_request_body(data, ["status", "languages"])
+
+        status_value = data["status"]
+        validate_status_value(status_value)
+        validate_languages(data["languages"])
+
+        status = Status.get_status(status_value)
+        if not status:
+            abort(404, f"Status '{status_value}' not found")
+        status = cast(Status, status)  # Ensure mypi knows the type
+
+        if not status.set_languages(language_mask(data["languages"])):
+            abort(400, f"Languages of status '{status_value}' could not be set")
+
+        response = {"message": f"Languages of status '{status_value}' set successfully"}
+        return response, 200
+
     # Route to remove a status
     @require_admin_key
     @admin_status_ns.expect(ad_st_set_status_model)  # type: ignore[misc]
@@ -89,6 +121,7 @@ class StatusListResource(Resource):  # type: ignore
                 "description_en": status.description_en,
                 "description_now_de": status.description_now_de,
                 "description_now_en": status.description_now_en,
+                "languages": language_codes(status.languages),
             }
             for status in statuses
         ]
@@ -3,9 +3,19 @@ from app.routes.api_models.models import *
 __all__ = [
     "error_model",
     "success_model",
+    "queued_model",
+    "job_model",
     "api_key_model",
+    "status_updates_model",
+    "status_updates_result_model",
+    "import_nightlines_model",
+    "reset_all_model",
+    "circuit_breaker_model",
+    "new_api_key_model",
+    "token_model",
     "status_model",
     "set_status_model",
+    "set_status_languages_model",
     "set_status_config_model",
     "set_now_model",
     "nightline_model",
@@ -9,10 +9,66 @@ success_model = {
     "message": fields.String(required=True, description="Success message"),
 }
 
+queued_model = {
+    "message": fields.String(required=True, description="Success message"),
+    "job_id": fields.Integer(required=False, description="ID of the queued instagram job, if one was queued"),
+}
+
+job_model = {
+    "job_id": fields.Integer(required=True, description="ID of the job"),
+    "action": fields.String(required=True, description="Action of the job ('post_story', 'delete_story')"),
+    "status_name": fields.String(required=False, description="Status of the story slide to post"),
+    "state": fields.String(required=True, description="State of the job ('pending', 'running', 'done', 'failed')"),
+    "error": fields.String(required=False, description="Error message if the job failed"),
+    "created_at": fields.String(required=True, description="Time the job was queued"),
+    "updated_at": fields.String(required=True, description="Time the job was last updated"),
+}
+
+status_updates_model = {
+    "updates": fields.List(
+        fields.Raw,
+        required=True,
+        description="Up to 100 updates like {'nightline': 'name', 'status': 'canceled', 'now': false}. 'status' and 'now' are optional, but one is required",
+    ),
+}
+
+status_updates_result_model = {
+    "message": fields.String(required=True, description="Success message"),
+    "jobs": fields.Raw(required=True, description="IDs of the queued instagram story posts by nightline name"),
+}
+
+import_nightlines_model = {
+    "nightlines": fields.List(fields.String, required=True, description="Names of the nightlines to import. Alternatively upload a CSV or JSON 'file'"),
+}
+
+reset_all_model = {
+    "message": fields.String(required=True, description="Success message"),
+    "nightlines": fields.List(fields.String, required=True, description="Names of the nightlines whose status was reset"),
+    "jobs": fields.Raw(required=True, description="IDs of the queued instagram story deletions by nightline name"),
+}
+
+circuit_breaker_model = {
+    "worker": fields.Integer(required=True, description="Process id of the worker the breaker belongs to. Every worker process keeps its own breakers"),
+    "name": fields.String(required=True, description="Name of the circuit breaker ('global' or 'account <id>')"),
+    "state": fields.String(required=True, description="State of the circuit breaker ('closed', 'open', 'half_open')"),
+    "failures": fields.Integer(required=True, description="Consecutive failed calls"),
+    "retry_in": fields.Float(required=False, description="Seconds until calls are let through again, if open"),
+}
+
 api_key_model = {
     "API-Key": fields.String(required=True, description="API-Key for the requested nightline"),
 }
 
+token_model = {
+    "message": fields.String(required=True, description="Success message"),
+    "token": fields.String(required=True, description="Signed token for the nightline, valid until its API key is renewed"),
+}
+
+new_api_key_model = {
+    "message": fields.String(required=True, description="Success message"),
+    "API-Key": fields.String(required=True, description="New API-Key for the nightline, it can't be retrieved again"),
+}
+
 # API model for status objects
 status_model = {
     "status_name": fields.String(required=True, description="Name of the status"),
@@ -20,6 +76,12 @@ status_model = {
     "description_en": fields.String(required=True, description="English description"),
     "description_now_de": fields.String(required=True, description="German description for now"),
     "description_now_en": fields.String(required=True, description="English description for now"),
+    "languages": fields.List(fields.String, required=False, description="Languages spoken by nightlines with this status ('de', 'en')"),
+}
+
+set_status_languages_model = {
+    "status": fields.String(required=True, description="Name of the status"),
+    "languages": fields.List(fields.String, required=True, description="Languages spoken by nightlines with this status ('de', 'en')"),
 }
 
 set_status_model = {
@@ -1,3 +1,4 @@
+import hmac
 from functools import wraps
 from typing import Any, Callable, TypeVar, Union, cast
 
@@ -6,6 +7,7 @@ from flask import request
 from app.config import Config
 from app.logger import logger
 from app.models import ApiKey, Nightline
+from app.tokens import nightline_tokens
 
 R = TypeVar("R")
 
@@ -26,6 +28,11 @@ def sanitize_nightline_name(f: Callable[..., R]) -> Callable[..., R]:
     return decorated_function
 
 
+def is_admin_key(api_key: str) -> bool:
+    """Compare a key with the admin key in constant time"""
+    return bool(Config.ADMIN_API_KEY) and hmac.compare_digest(api_key.encode(), str(Config.ADMIN_API_KEY).encode())
+
+
 def require_admin_key(f: Callable[..., R]) -> Callable[..., Union[R, tuple[dict[str, str], int]]]:
     @wraps(f)
     def wrapper(*args: Any, **kwargs: Any) -> Union[R, tuple[dict[str, str], int]]:
@@ -33,7 +40,7 @@ def require_admin_key(f: Callable[..., R]) -> Callable[..., Union[R, tuple[dict[
         if not api_key:
             return {"message": "Missing Authorization header"}, 401
 
-        if api_key != Config.ADMIN_API_KEY:
+        if not is_admin_key(api_key):
             return {"message": "Admin API key required"}, 403
 
         return f(*args, **kwargs)
@@ -42,16 +49,20 @@ def require_admin_key(f: Callable[..., R]) -> Callable[..., Union[R, tuple[dict[
 
 
 def require_api_key(f: Callable[..., R]) -> Callable[..., Union[R, tuple[dict[str, str], int]]]:
+    """Authenticate the request for a nightline and pass the nightline to the route as 'nightline' keyword argument
+
+    The nightline is loaded once by the digest of the API key, so routes don't have to query the nightline again. Signed
+    tokens are verified without a query and pass a reference to the nightline of the token, which isn't loaded until the
+    route reads more than its ID and name. With the admin key the nightline is passed even if it doesn't exist (as None),
+    so the route decides how to respond.
+    """
+
     @wraps(f)
     def wrapper(*args: Any, **kwargs: Any) -> Union[R, tuple[dict[str, str], int]]:
         api_key = request.headers.get("Authorization")
         if not api_key:
             return {"message": "Missing Authorization header"}, 401
 
-        # Allow admin key to bypass nightline check
-        if api_key == Config.ADMIN_API_KEY:
-            return f(*args, **kwargs)
-
         # Attempt to extract nightline_name from keyword args
         nightline_name = kwargs.get("nightline_name")
 
@@ -62,16 +73,19 @@ def require_api_key(f: Callable[..., R]) -> Callable[..., Union[R, tuple[dict[st
         if not nightline_name:
             return {"message": "Nightline name not found in request"}, 400
 
-        nightline = Nightline.get_nightline(nightline_name)
-        if not nightline:
-            return {"message": f"Nightline '{nightline_name}' not found"}, 404
-
-        nl_api_key = nightline.get_api_key()
-        if not nl_api_key:
-            return {"message": "No Api Key found for requested nightline"}, 500
-
-        if api_key == nl_api_key.key:
-            return f(*args, **kwargs)
+        # Allow admin key to bypass nightline check
+        if is_admin_key(api_key):
+            return f(*args, nightline=Nightline.get_nightline(nightline_name), **kwargs)
+
+        if nightline_tokens.is_token(api_key):
+            nightline_id = nightline_tokens.verify(api_key, nightline_name)
+            if nightline_id is not None:
+                return f(*args, nightline=Nightline.reference(nightline_id, nightline_name), **kwargs)
+            return {"message": "Invalid token"}, 403
+
+        nightline = ApiKey.get_nightline_by_key(api_key)
+        if nightline and nightline.name == nightline_name:
+            return f(*args, nightline=nightline, **kwargs)
 
         return {"message": "Invalid API key"}, 403
 
@@ -1,17 +1,20 @@
-from typing import Any, Dict, Tuple, cast
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, cast
 
 from flask import request
 from flask_restx import Namespace, Resource, abort, reqparse
 from werkzeug.datastructures import FileStorage
 
-from app.models import Nightline, NightlineStatus, Status, StorySlide
+from app.models import InstagramJob, Nightline, NightlineStatus, Status, StorySlide
 from app.routes.api_models import (
     error_model,
     instagram_create_model,
+    job_model,
+    queued_model,
     set_now_model,
     set_status_config_model,
     set_status_model,
     success_model,
+    token_model,
 )
 from app.routes.decorators import require_api_key, sanitize_nightline_name
 from app.validation import (
@@ -21,6 +24,9 @@ from app.validation import (
     validate_status_value,
 )
 
+if TYPE_CHECKING:  # pragma: no cover
+    from app.models.status import StatusInfo
+
 nightline_ns = Namespace("nightline", description="Routes for nightlines - API key required", security="apikey")
 
 # Define the request model for the update status and now boolean
@@ -30,6 +36,9 @@ nl_set_status_model = nightline_ns.model("Set Status", set_status_model)
 nl_set_status_config_model = nightline_ns.model("Set Status Config", set_status_config_model)
 nl_set_now_model = nightline_ns.model("Set Now", set_now_model)
 nl_instagram_create_model = nightline_ns.model("Instagram Credentials", instagram_create_model)
+nl_token_model = nightline_ns.model("Token", token_model)
+nl_queued_model = nightline_ns.model("Queued", queued_model)
+nl_job_model = nightline_ns.model("Instagram Job", job_model)
 
 upload_parser = reqparse.RequestParser()
 upload_parser.add_argument("image", location="files", type=FileStorage, required=True, help="Image file")
@@ -42,12 +51,12 @@ class NightlineStatusResource(Resource):  # type: ignore
     @sanitize_nightline_name
     @require_api_key
     @nightline_ns.expect(nl_set_status_model)  # type: ignore[misc]
-    @nightline_ns.response(200, "Success", nl_success_model)  # type: ignore[misc]
+    @nightline_ns.response(200, "Success", nl_queued_model)  # type: ignore[misc]
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(500, "Status Error", nl_error_model)  # type: ignore[misc]
-    def patch(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
-        """Set the status of a nightline"""
+    def patch(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, Any], int]:
+        """Set the status of a nightline. A configured instagram story is posted in the background"""
         # Parse and validate request body
         data = request.get_json(force=True, silent=True)
         validate_request_body(data, ["status"])
@@ -56,7 +65,6 @@ class NightlineStatusResource(Resource):  # type: ignore
         validate_status_value(status_value)  # Validate status name format
         status_value = status_value.strip()
 
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
@@ -64,23 +72,25 @@ class NightlineStatusResource(Resource):  # type: ignore
         if not nightline.set_status(status_value):
             abort(500, f"Updating the status failed")
 
-        # If configured post an instagram story
+        response: Dict[str, Any] = {"message": f"Status successfully updated to: '{status_value}'"}
+
+        # If configured queue posting an instagram story
         if nightline.get_instagram_story_config():
-            if not nightline.post_instagram_story(status_value):
-                abort(500, f"Status updated but uploading an instagram story post failed")
+            job = nightline.enqueue_instagram_story(status_value)
+            if not job:
+                abort(500, f"Status updated but queueing the instagram story post failed")
+            response["job_id"] = cast(InstagramJob, job).id
 
-        response = {"message": f"Status successfully updated to: '{status_value}'"}
         return response, 200
 
     @sanitize_nightline_name
     @require_api_key
-    @nightline_ns.response(200, "Success", nl_set_status_model)  # type: ignore[misc]
+    @nightline_ns.response(200, "Success", nl_queued_model)  # type: ignore[misc]
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(500, "Status Error", nl_error_model)  # type: ignore[misc]
-    def delete(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
-        """Reset the status of a nightline"""
-        nightline = Nightline.get_nightline(nightline_name)
+    def delete(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, Any], int]:
+        """Reset the status of a nightline. The current instagram story is deleted in the background"""
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
@@ -89,14 +99,15 @@ class NightlineStatusResource(Resource):  # type: ignore
         if not status:
             abort(500, f"Resetting the status failed")
 
-        # Remove a story post
-        if not nightline.delete_instagram_story():
-            abort(
-                500,
-                f"Staus successfully reset but deleting the current instagram story failed",
-            )
+        response: Dict[str, Any] = {"message": "Status successfully reset to: 'default'"}
+
+        # Queue removing a story post, after a post that may still be queued
+        if nightline.instagram_account:
+            job = nightline.enqueue_instagram_story_deletion()
+            if not job:
+                abort(500, f"Status successfully reset but queueing the deletion of the current instagram story failed")
+            response["job_id"] = cast(InstagramJob, job).id
 
-        response = {"message": "Status successfully reset to: 'default'"}
         return response, 200
 
 
@@ -110,7 +121,7 @@ class NightlineStatusConfigResource(Resource):  # type: ignore
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(500, "Status Error", nl_error_model)  # type: ignore[misc]
-    def patch(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+    def patch(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
         """Configure a status of a nightline"""
         # Parse and validate request body
         data = request.get_json(force=True, silent=True)
@@ -124,20 +135,16 @@ class NightlineStatusConfigResource(Resource):  # type: ignore
         status_value = data["status"]  # type: ignore[index]
         validate_status_value(status_value)  # Validate status name format
 
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
 
-        status = Status.get_status(status_value)
+        status = Status.get_status_info(status_value)
         if not status:
             abort(404, message=f"Status '{status_value}' not found")
-        status = cast(Status, status)
+        status = cast("StatusInfo", status)
 
         nightline_status = NightlineStatus.get_nightline_status(nightline.id, status.id)
-        if not nightline_status:
-            abort(500, f"Status '{status.name}' for nightline '{nightline.name}' not found")
-        nightline_status = cast(NightlineStatus, nightline_status)
 
         # Validate a story slide is set if instagram_story is True
         if instagram_story and not nightline_status.instagram_story_slide:
@@ -159,7 +166,8 @@ class NightlineNowResource(Resource):  # type: ignore
     @nightline_ns.response(200, "Success", nl_success_model)  # type: ignore[misc]
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
-    def patch(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+    @nightline_ns.response(500, "Now Error", nl_error_model)  # type: ignore[misc]
+    def patch(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
         """Update the 'now' boolean of a nightline"""
         # Parse and validate request body
         data = request.get_json(force=True, silent=True)
@@ -169,13 +177,13 @@ class NightlineNowResource(Resource):  # type: ignore
         if not isinstance(now_value, bool):
             abort(400, "'now' must be a boolean")
 
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
 
         # Update and persist the change
-        nightline.set_now(now_value)
+        if not nightline.set_now(now_value):
+            abort(500, f"Updating the now value failed")
 
         response = {"message": f"Now value successfully set to '{now_value}'"}
         return response, 200
@@ -191,7 +199,7 @@ class NightlineInstagramResource(Resource):  # type: ignore
     @nightline_ns.response(201, "Created", nl_success_model)  # type: ignore[misc]
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
-    def post(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+    def post(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
         """Add an Instagram account for the given nightline"""
         # Parse and validate the request body
         data = request.get_json(force=True, silent=True)
@@ -201,8 +209,6 @@ class NightlineInstagramResource(Resource):  # type: ignore
         password = data["password"]  # type: ignore[index]
         validate_instagram_credentials(username, password)
 
-        # Fetch the nightline entry
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
@@ -220,7 +226,7 @@ class NightlineInstagramResource(Resource):  # type: ignore
     @nightline_ns.response(200, "Success", nl_success_model)  # type: ignore[misc]
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
-    def patch(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+    def patch(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
         """Update the Instagram credentials for the given nightline"""
         # Parse and validate the request body
         data = request.get_json(force=True, silent=True)
@@ -231,8 +237,6 @@ class NightlineInstagramResource(Resource):  # type: ignore
         password = data["password"]  # type: ignore[index]
         validate_instagram_credentials(username, password)
 
-        # Fetch the nightline entry
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
@@ -253,10 +257,8 @@ class NightlineInstagramResource(Resource):  # type: ignore
     @nightline_ns.response(200, "Success", nl_success_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Instagram Account Not Found", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
-    def delete(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+    def delete(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
         """Delete the Instagram account for the given nightline"""
-        # Fetch the nightline entry
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
@@ -284,7 +286,7 @@ class NightlineStoryResource(Resource):  # type: ignore
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(500, "Story Error", nl_error_model)  # type: ignore[misc]
-    def post(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+    def post(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
         """Add a story slide for the given nightline and status"""
         # Parse the request body
         args = upload_parser.parse_args()
@@ -296,22 +298,22 @@ class NightlineStoryResource(Resource):  # type: ignore
         image_file = args["image"]
         validate_image(image_file)  # Validate image file
 
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
 
-        status = Status.get_status(status_value)
+        status = Status.get_status_info(status_value)
         if not status:
             abort(404, f"Status '{status_value}' not found")
-        status = cast(Status, status)
+        status = cast("StatusInfo", status)
 
-        nightline_status = NightlineStatus.get_nightline_status(nightline.id, status.id)
+        nightline_status = NightlineStatus.store_nightline_status(nightline.id, status.id)
         if not nightline_status:
-            abort(404, f"Status '{status_value}' not found")
+            abort(500, f"Uploading a story slide for status '{status_value}' failed")
         nightline_status = cast(NightlineStatus, nightline_status)
 
         if not StorySlide.update_story_slide(image_file, nightline_status):
+            nightline_status.prune()
             abort(500, f"Uploading a story slide for status '{status_value}' failed")
 
         response = {"message": f"Story for status '{status_value}' added successfully"}
@@ -324,7 +326,7 @@ class NightlineStoryResource(Resource):  # type: ignore
     @nightline_ns.response(400, "Bad Request", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
     @nightline_ns.response(500, "Story Error", nl_error_model)  # type: ignore[misc]
-    def delete(self, nightline_name: str) -> Tuple[Dict[str, str], int]:
+    def delete(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
         """Remove a story slide for the given nightline and status"""
         # Parse and validate request body
         data = request.get_json(force=True, silent=True)
@@ -333,23 +335,63 @@ class NightlineStoryResource(Resource):  # type: ignore
         status_value = data["status"]  # type: ignore[index]
         validate_status_value(status_value)  # Validate status name format
 
-        nightline = Nightline.get_nightline(nightline_name)
         if not nightline:
             abort(404, f"Nightline '{nightline_name}' not found")
         nightline = cast(Nightline, nightline)  # For mypi to know the correct type
 
-        status = Status.get_status(status_value)
+        status = Status.get_status_info(status_value)
         if not status:
             abort(404, f"Status '{status_value}' not found")
-        status = cast(Status, status)
+        status = cast("StatusInfo", status)
 
         nightline_status = NightlineStatus.get_nightline_status(nightline.id, status.id)
-        if not nightline_status:
-            abort(404, f"Status '{status_value}' not found")
-        nightline_status = cast(NightlineStatus, nightline_status)
+        if not nightline_status.instagram_story_slide:
+            abort(404, f"No story slide set for status '{status_value}' of nightline '{nightline.name}'")
 
         if not StorySlide.remove_story_slide(nightline_status):
             abort(500, f"Deleting a story slide for status '{status_value}' failed")
 
         response = {"message": f"Story for status '{status_value}' removed successfully"}
         return response, 200
+
+
+@nightline_ns.route("/<string:nightline_name>/token")
+@nightline_ns.doc(security="apikey")
+class NightlineTokenResource(Resource):  # type: ignore
+    @sanitize_nightline_name
+    @require_api_key
+    @nightline_ns.response(201, "Created", nl_token_model)  # type: ignore[misc]
+    @nightline_ns.response(404, "Nightline Not Found", nl_error_model)  # type: ignore[misc]
+    @nightline_ns.response(501, "Tokens Disabled", nl_error_model)  # type: ignore[misc]
+    def post(self, nightline_name: str, nightline: Optional[Nightline]) -> Tuple[Dict[str, str], int]:
+        """Issue a signed token, which authenticates like the API key until the key is renewed"""
+        if not nightline:
+            abort(404, f"Nightline '{nightline_name}' not found")
+        nightline = cast(Nightline, nightline)  # For mypi to know the correct type
+
+        token = nightline.issue_token()
+        if not token:
+            abort(501, "Tokens are not enabled")
+
+        response = {"message": "Token issued successfully", "token": cast(str, token)}
+        return response, 201
+
+
+@nightline_ns.route("/<string:nightline_name>/jobs/<int:job_id>")
+@nightline_ns.doc(security="apikey")
+class NightlineJobResource(Resource):  # type: ignore
+    @sanitize_nightline_name
+    @require_api_key
+    @nightline_ns.response(200, "Success", nl_job_model)  # type: ignore[misc]
+    @nightline_ns.response(404, "Not Found", nl_error_model)  # type: ignore[misc]
+    def get(self, nightline_name: str, job_id: int, nightline: Optional[Nightline]) -> Tuple[Dict[str, Any], int]:
+        """Get the state of a queued instagram job"""
+        if not nightline:
+            abort(404, f"Nightline '{nightline_name}' not found")
+        nightline = cast(Nightline, nightline)  # For mypi to know the correct type
+
+        job = InstagramJob.get_job(nightline.id, job_id)
+        if not job:
+            abort(404, f"Job '{job_id}' not found")
+
+        return cast(InstagramJob, job).to_dict(), 200
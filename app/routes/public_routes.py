@@ -1,19 +1,127 @@
-from typing import Any, Dict, List, Optional, Tuple, Union, cast
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple, cast
 
-from flask import request
+from flask import Flask, current_app, request
 from flask.wrappers import Response
-from flask_restx import Namespace, Resource, abort
+from flask_restx import Namespace, Resource, abort, fields
+from werkzeug.http import quote_etag
 
-from app.models import Nightline, Status
 from app.routes.api_models import error_model, nightline_status_model
+from app.events import format_event_id, parse_event_id, stream_limiter
+from app.models import NightlineChange
 from app.routes.decorators import sanitize_nightline_name
-from app.validation import validate_filters
+from app.snapshot import encode_json, filter_entries, public_snapshot
+from app.validation import validate_change_version, validate_filters
 
 public_ns = Namespace("public", description="Public accessible routes")
 
+# Seconds between keep-alive comments on idle event streams
+STREAM_HEARTBEAT_SECONDS = 15
+# Seconds between checks of event streams for changes. A check reads the shared snapshot version, not the database
+STREAM_POLL_SECONDS = 1
+
 # Define the response model for nightline status
 pb_error_model = public_ns.model("Error", error_model)
 pb_nightline_status_model = public_ns.model("Nightline Status", nightline_status_model)
+pb_nightline_changes_model = public_ns.model(
+    "Nightline Changes",
+    {
+        "version": fields.Integer(required=True, description="Change version to pass as 'since' on the next request"),
+        "changed": fields.List(fields.Nested(pb_nightline_status_model), required=True, description="Nightlines changed since the given version"),
+        "removed": fields.List(fields.String, required=True, description="Names of nightlines removed since the given version"),
+    },
+)
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """Headers making clients revalidate their cached copy using the ETag"""
+    return {"ETag": quote_etag(etag), "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """Return a 304 response if the client already holds the current representation"""
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=cache_headers(etag))
+    return None
+
+
+def json_response(body: bytes, etag: str) -> Response:
+    """Return pre-encoded JSON. HEAD requests are answered by the same response without its body"""
+    return Response(body, status=200, headers=cache_headers(etag), mimetype="application/json")
+
+
+def parse_filters() -> Tuple[Optional[str], Optional[str], Optional[bool]]:
+    """Read and validate the filter parameters of the request"""
+    status_filter = request.args.get("status")
+    language_filter = request.args.get("language")
+    now_filter_str = request.args.get("now")
+
+    validate_filters(status_filter, language_filter, now_filter_str)
+    now_filter: Optional[bool] = None
+    if now_filter_str is not None:
+        now_filter = now_filter_str.lower() == "true"
+
+    return status_filter, language_filter, now_filter
+
+
+def format_event(data: Dict[str, Any], version: Optional[int] = None) -> str:
+    """Format a status change as a server-sent event. Only the last event of a batch carries the change version as id"""
+    event_id = f"id: {format_event_id(version)}\n" if version is not None else ""
+    return f"{event_id}event: status\ndata: {encode_json(data).decode()}\n\n"
+
+
+def format_reset_event(version: int) -> str:
+    """Format an event telling the client to refetch the full state because events were missed"""
+    return f"id: {format_event_id(version)}\nevent: reset\ndata: {{}}\n\n"
+
+
+def stream_events(
+    app: Flask,
+    last_event_id: Optional[str],
+    nightline_filter: Optional[str],
+    status_filter: Optional[str],
+    language_filter: Optional[str],
+) -> Iterator[str]:
+    """Yield server-sent events for status changes matching the filters
+
+    Events are read from the change log, so every worker process streams the changes of all processes and a client
+    can resume from the id of its last event on any worker. The log only keeps the latest change of a nightline, so a
+    resuming client receives the current state of every nightline that changed since.
+    """
+    yield f"retry: {STREAM_HEARTBEAT_SECONDS * 1000}\n\n"
+
+    # The stream outlives the request, so reading the database needs its own app context
+    with app.app_context():
+        last_id = parse_event_id(last_event_id)
+        version = NightlineChange.get_version()
+    if last_id is None or last_id > version:  # E.g. an id of another database
+        if last_event_id:
+            yield format_reset_event(version)
+        last_id = version
+
+    snapshot_version: Optional[int] = None
+    idle = 0.0
+    while True:
+        # Every change bumps the shared snapshot, so the change log is only read after a change
+        current_version = public_snapshot.version
+        if current_version != snapshot_version:
+            snapshot_version = current_version
+            with app.app_context():
+                last_id, changed, _ = NightlineChange.list_changes(last_id)
+                status_languages = public_snapshot.get_status_languages() if language_filter else {}
+
+            entries = [entry for entry in changed if not nightline_filter or entry["nightline_name"] == nightline_filter]
+            entries = filter_entries(entries, status_languages, status_filter, language_filter)
+            for index, entry in enumerate(entries, start=1):
+                yield format_event(entry, last_id if index == len(entries) else None)
+            if entries:
+                idle = 0.0
+
+        if idle >= STREAM_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            idle = 0.0
+        time.sleep(STREAM_POLL_SECONDS)
+        idle += STREAM_POLL_SECONDS
 
 
 @public_ns.route("/<string:nightline_name>")
@@ -23,23 +131,19 @@ class PublicNightlineStatusResource(Resource):  # type: ignore
     # Can be returend by sanitize_name
     @public_ns.response(400, "Bad Request", pb_error_model)  # type: ignore[misc]
     @public_ns.response(404, "Nightline Not Found", pb_error_model)  # type: ignore[misc]
-    def get(self, nightline_name: str) -> Union[Tuple[Dict[str, Any], int], Response]:
+    def get(self, nightline_name: str) -> Response:
         """Retrieve the status of a nightline"""
-        nightline = Nightline.get_nightline(nightline_name)
-        if not nightline:
+        etag = public_snapshot.etag(nightline_name)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        body = public_snapshot.get_nightline_json(nightline_name)
+        if not body:
             abort(404, message=f"Nightline '{nightline_name}' not found")
-        nightline = cast(Nightline, nightline)  # Ensure mypi knows the type
-
-        response = {
-            "nightline_name": nightline.name,
-            "status_name": nightline.status.name,
-            "description_de": nightline.status.description_de,
-            "description_en": nightline.status.description_en,
-            "description_now_de": nightline.status.description_now_de,
-            "description_now_en": nightline.status.description_now_en,
-            "now": nightline.now,
-        }
-        return response, 200
+        body = cast(bytes, body)  # Ensure mypi knows the type
+
+        return json_response(body, etag)
 
 
 # Resource to get the statuses of all nightlines with filter options
@@ -50,35 +154,75 @@ class PublicNightlineListResource(Resource):  # type: ignore
     @public_ns.param("now", "Filter for nightlines that are currently available ('true' or 'false'). Optional")  # type: ignore[misc]
     @public_ns.response(200, "Success", [pb_nightline_status_model])  # type: ignore[misc]
     @public_ns.response(400, "Bad Request", pb_error_model)  # type: ignore[misc]
-    def get(self) -> Union[Tuple[List[Dict[str, Any]], int], Response]:
+    def get(self) -> Response:
         """Retrieve the statuses of all nightlines with filter options"""
-        status_filter = request.args.get("status")
-        language_filter = request.args.get("language")
-        now_filter_str = request.args.get("now")
+        status_filter, language_filter, now_filter = parse_filters()
 
-        validate_filters(status_filter, language_filter, now_filter_str)
-        now_filter: Optional[bool] = None
-        if now_filter_str is not None:
-            now_filter = now_filter_str.lower() == "true"
+        etag = public_snapshot.etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        # Fetch filtered nightlines
-        nightlines = Nightline.list_nightlines(
+        # Assemble the response from the pre-encoded public state instead of querying the database
+        body = public_snapshot.list_nightlines_json(
             status_filter=status_filter,
             language_filter=language_filter,
             now_filter=now_filter,
         )
 
-        response = [
-            {
-                "nightline_name": nightline.name,
-                "status_name": nightline.status.name,
-                "description_de": nightline.status.description_de,
-                "description_en": nightline.status.description_en,
-                "description_now_de": nightline.status.description_now_de,
-                "description_now_en": nightline.status.description_now_en,
-                "now": nightline.now,
-            }
-            for nightline in nightlines
-        ]
+        return json_response(body, etag)
+
+
+# Resource to stream status changes of nightlines with filter options
+@public_ns.route("/stream")
+class PublicNightlineStreamResource(Resource):  # type: ignore
+    @public_ns.param("nightline", "Only stream changes of the nightline with this name. Optional")  # type: ignore[misc]
+    @public_ns.param("status", "Only stream changes to this status (e.g., 'default' or 'german-english'). Optional")  # type: ignore[misc]
+    @public_ns.param("language", "Only stream changes of nightlines speaking a certain language. Optional")  # type: ignore[misc]
+    @public_ns.response(200, "Success")  # type: ignore[misc]
+    @public_ns.response(400, "Bad Request", pb_error_model)  # type: ignore[misc]
+    @public_ns.response(503, "Too Many Streams", pb_error_model)  # type: ignore[misc]
+    def get(self) -> Response:
+        """Stream status changes of all nightlines as server-sent events"""
+        status_filter = request.args.get("status")
+        language_filter = request.args.get("language")
+        validate_filters(status_filter, language_filter)
+
+        nightline_filter = request.args.get("nightline")
+        if nightline_filter is not None:
+            nightline_filter = nightline_filter.strip().lower()
+            if not nightline_filter.isalnum() or len(nightline_filter) > 50:
+                abort(400, message="Invalid value for nightline filter. Only valid nightline names are allowed")
+
+        # Browsers resend the id of the last received event when reconnecting
+        last_event_id = request.headers.get("Last-Event-ID", request.args.get("last_event_id"))
+
+        if not stream_limiter.acquire(current_app.config["EVENT_STREAM_LIMIT"]):
+            abort(503, message="Too many open event streams, try again later")
+
+        app = current_app._get_current_object()  # type: ignore[attr-defined]
+        events = stream_events(app, last_event_id, nightline_filter, status_filter, language_filter)
+        response = Response(
+            events,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        response.call_on_close(stream_limiter.release)
+        return response
+
+
+# Resource to get the nightlines changed since a change version
+@public_ns.route("/changes")
+class PublicNightlineChangesResource(Resource):  # type: ignore
+    @public_ns.param("since", "Change version returned by the previous request, 0 to fetch all nightlines")  # type: ignore[misc]
+    @public_ns.response(200, "Success", pb_nightline_changes_model)  # type: ignore[misc]
+    @public_ns.response(400, "Bad Request", pb_error_model)  # type: ignore[misc]
+    def get(self) -> Tuple[Dict[str, Any], int]:
+        """Retrieve the nightlines changed or removed since a change version"""
+        since = request.args.get("since")
+        validate_change_version(since)
+
+        version, changed, removed = NightlineChange.list_changes(int(cast(str, since)))
 
+        response = {"version": version, "changed": changed, "removed": removed}
         return response, 200
@@ -1,19 +1,23 @@
+from typing import Any, Dict, List
+
 from sqlalchemy.exc import SQLAlchemyError
 
 from .db import db
 from .logger import logger
 from .models import Status
+from .snapshot import LANGUAGES
 
 
 def preinitialize_statuses() -> bool:
     """Pre-initialize default statuses if they don't exist"""
-    default_statuses = [
+    default_statuses: List[Dict[str, Any]] = [
         {
             "name": "default",
             "description_de": "",
             "description_en": "",
             "description_now_de": "Wir sind jetzt erreichbar 📞",
             "description_now_en": "We're now available 📞",
+            "languages": 0,
         },
         {
             "name": "german",
@@ -21,6 +25,7 @@ def preinitialize_statuses() -> bool:
             "description_en": "Today we're only available in German 📞",
             "description_now_de": "Wir sind jetzt erreichbar, heute allerdings nur auf Deutsch 📞",
             "description_now_en": "We're now available but today only in German 📞",
+            "languages": LANGUAGES["de"],
         },
         {
             "name": "english",
@@ -28,6 +33,7 @@ def preinitialize_statuses() -> bool:
             "description_en": "Today we're only available in English 📞",
             "description_now_de": "Wir sind jetzt erreichbar, heute allerdings nur auf Englisch 📞",
             "description_now_en": "We're now available but today only in English 📞",
+            "languages": LANGUAGES["en"],
         },
         {
             "name": "german-english",
@@ -35,6 +41,7 @@ def preinitialize_statuses() -> bool:
             "description_en": "Today we're available in German & English 📞",
             "description_now_de": "Wir sind jetzt erreichbar, heute auf Deutsch und Englisch 📞",
             "description_now_en": "We're now available, today in German & English",
+            "languages": LANGUAGES["de"] | LANGUAGES["en"],
         },
         {
             "name": "canceled",
@@ -42,6 +49,7 @@ def preinitialize_statuses() -> bool:
             "description_en": "Unfortunately, we're not available tonight 🙁",
             "description_now_de": "Wir sind heute Abend leider nicht erreichbar 🙁",
             "description_now_en": "Unfortunately, we're not available tonight 🙁",
+            "languages": 0,
         },
         {
             "name": "technical-issues",
@@ -49,6 +57,7 @@ def preinitialize_statuses() -> bool:
             "description_en": "Due to technical issues, we're currently unavailable ⚠️",
             "description_now_de": "Aufgrund technischer Probleme sind wir nicht erreichbar ⚠️",
             "description_now_en": "Due to technical issues, we're currently unavailable ⚠️",
+            "languages": 0,
         },
     ]
 
@@ -62,6 +71,7 @@ def preinitialize_statuses() -> bool:
                     description_en=status_data["description_en"],
                     description_now_de=status_data["description_now_de"],
                     description_now_en=status_data["description_now_en"],
+                    languages=status_data["languages"],
                 )
                 db.session.add(new_status)
                 logger.debug(f"Created status: {status_data['name']}")
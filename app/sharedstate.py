@@ -0,0 +1,110 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import BinaryIO, Callable, Optional, Tuple, cast
+
+from app.logger import logger
+
+# Layout of the file: generation (u64) | payload length (u64) | payload
+GENERATION = struct.Struct("<Q")
+LENGTH = struct.Struct("<Q")
+HEADER_SIZE = GENERATION.size + LENGTH.size
+INITIAL_SIZE = 1024 * 1024
+
+# Attempts to read a consistent payload before giving up, e.g. because a writer died while writing
+MAX_READ_ATTEMPTS = 1000
+
+
+class SharedMemoryState:
+    """Generation counter and payload in a memory-mapped file, shared by all worker processes
+
+    Readers never lock. A writer makes the generation odd while it writes, so readers retry
+    until they read the same even generation before and after the payload (a seqlock).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._pid: Optional[int] = None
+        self._file: Optional[BinaryIO] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._thread_lock = threading.Lock()
+
+    def _open(self) -> mmap.mmap:
+        """Open and map the file once per process. File locks must not be shared with forked workers"""
+        if self._mmap is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._file = os.fdopen(fd, "r+b")
+            if os.fstat(fd).st_size < HEADER_SIZE:
+                self._file.truncate(INITIAL_SIZE)
+            self._mmap = mmap.mmap(fd, 0)
+            self._pid = os.getpid()
+            logger.debug(f"Mapped shared state file: '{self.path}'")
+        return self._mmap
+
+    def _remap(self, size: int = 0) -> mmap.mmap:
+        """Map the file again after it grew, optionally growing it to a minimum size first"""
+        self._open()
+        file = cast(BinaryIO, self._file)
+        if size > os.fstat(file.fileno()).st_size:
+            file.truncate(size)
+        self._mmap = mmap.mmap(file.fileno(), 0)
+        return self._mmap
+
+    def generation(self) -> int:
+        """Return the current generation. Changes with every write"""
+        return int(GENERATION.unpack_from(self._open(), 0)[0])
+
+    def read(self) -> Optional[Tuple[int, bytes]]:
+        """Return the generation and payload, or None if no consistent payload could be read"""
+        for _ in range(MAX_READ_ATTEMPTS):
+            shared = self._open()
+            generation = GENERATION.unpack_from(shared, 0)[0]
+            if generation % 2:  # A writer is writing
+                time.sleep(0.001)
+                continue
+
+            length = LENGTH.unpack_from(shared, GENERATION.size)[0]
+            if HEADER_SIZE + length > len(shared):  # Another process grew the file
+                shared = self._remap()
+                continue
+
+            payload = shared[HEADER_SIZE : HEADER_SIZE + length]
+            if GENERATION.unpack_from(shared, 0)[0] == generation:
+                return int(generation), payload
+
+        logger.warning(f"Could not read a consistent payload from shared state file: '{self.path}'")
+        return None
+
+    def write(self, update: Callable[[bytes], bytes]) -> int:
+        """Replace the payload by the result of update(current payload) while holding an exclusive lock"""
+        with self._thread_lock:
+            shared = self._open()
+            file = cast(BinaryIO, self._file)
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                generation = GENERATION.unpack_from(shared, 0)[0]
+                length = LENGTH.unpack_from(shared, GENERATION.size)[0]
+                if HEADER_SIZE + length > len(shared):  # Another process grew the file
+                    shared = self._remap()
+
+                # An odd generation means a writer died while writing, so the payload can't be trusted
+                current = b"" if generation % 2 else shared[HEADER_SIZE : HEADER_SIZE + length]
+                payload = update(current)
+
+                if HEADER_SIZE + len(payload) > len(shared):
+                    shared = self._remap(max(2 * len(shared), HEADER_SIZE + len(payload)))
+
+                generation += 1 if generation % 2 == 0 else 0
+                GENERATION.pack_into(shared, 0, generation)
+                shared[HEADER_SIZE : HEADER_SIZE + len(payload)] = payload
+                LENGTH.pack_into(shared, GENERATION.size, len(payload))
+                GENERATION.pack_into(shared, 0, generation + 1)
+
+                logger.debug(f"Wrote shared state generation: '{generation + 1}'")
+                return int(generation + 1)
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
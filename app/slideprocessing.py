@@ -0,0 +1,112 @@
+import io
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional, cast
+
+from flask import current_app
+from PIL import Image, ImageCms, ImageOps
+
+from app.filehandler import write_file_atomic
+from app.logger import logger
+
+STORY_SIZE = (1080, 1920)  # Instagram story geometry, 9:16
+STORY_BACKGROUND = (0, 0, 0)  # Fills the borders of slides with another aspect ratio and transparent areas
+STORY_QUALITY = 90
+
+
+def story_file_path(file_path: Path) -> Path:
+    """Path of the ready-to-post version of a story slide, next to the original. E.g. 'english.png' -> 'english.story.jpg'"""
+    return file_path.with_suffix(".story.jpg")
+
+
+def render_story_slide(source: str, target: str) -> None:
+    """Normalize an image to a 1080x1920 sRGB JPEG without metadata. Runs in a worker process
+
+    The image is rotated by its EXIF orientation, scaled to fit and centered on a black background.
+    """
+    with Image.open(source) as original:
+        icc_profile = original.info.get("icc_profile")
+        image = ImageOps.exif_transpose(original)  # Apply the orientation before the EXIF data is dropped
+
+        if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, STORY_BACKGROUND)
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+
+        if icc_profile:
+            try:
+                source_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+                image = cast(Image.Image, ImageCms.profileToProfile(image, source_profile, ImageCms.createProfile("sRGB"), outputMode="RGB"))
+            except (ImageCms.PyCMSError, OSError, ValueError) as e:
+                logger.warning(f"Couldn't convert the colour profile of '{source}' to sRGB: {e}")
+        slide = ImageOps.pad(image.convert("RGB"), STORY_SIZE, method=Image.Resampling.LANCZOS, color=STORY_BACKGROUND)
+
+    # Neither 'exif' nor 'icc_profile' is passed, so the file has no metadata
+    buffer = io.BytesIO()
+    slide.save(buffer, "JPEG", quality=STORY_QUALITY, optimize=True)
+    if not write_file_atomic(Path(target), buffer.getvalue()):
+        raise OSError(f"Couldn't write '{target}'")
+
+
+class StorySlideRenderer:
+    """Prepares uploaded story slides for Instagram in a bounded pool of worker processes
+
+    Decoding, scaling and encoding images is CPU bound and would hold the GIL of a request worker, so it runs in up
+    to STORY_SLIDE_WORKERS separate processes. With 0 workers, slides are rendered in the calling thread.
+    """
+
+    def __init__(self) -> None:
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self, workers: int) -> ProcessPoolExecutor:
+        """The pool of this process. It's created on first use, since forked worker processes can't use the pool of their parent"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Forking a process with running threads may deadlock the child, so the workers are spawned
+                self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                self._pid = os.getpid()
+                logger.debug(f"Started {workers} story slide workers in process: '{self._pid}'")
+            return self._executor
+
+    def render(self, source: Path, target: Optional[Path] = None) -> Optional[Path]:
+        """Write the ready-to-post version of a story slide, by default next to it. Returns its path, or None if the slide couldn't be prepared
+
+        The slide is rendered to a temporary file, which only replaces an existing version once rendering succeeded.
+        """
+        target = target or story_file_path(source)
+        tmp_target = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+
+        workers = int(current_app.config.get("STORY_SLIDE_WORKERS", 0))
+        try:
+            if workers > 0:
+                future = self._get_executor(workers).submit(render_story_slide, str(source), str(tmp_target))
+                try:
+                    future.result(timeout=current_app.config.get("STORY_SLIDE_TIMEOUT"))
+                except FutureTimeoutError:
+                    future.cancel()  # A render that is already running finishes, but only writes its temporary file
+                    raise
+            else:
+                render_story_slide(str(source), str(tmp_target))
+            os.replace(tmp_target, target)
+            logger.info(f"Story slide '{source}' prepared for instagram: '{target}'")
+            return target
+        except BrokenProcessPool as e:
+            with self._lock:
+                self._executor = None  # A crashed worker breaks the pool, start a new one for the next slide
+            logger.error(f"Error preparing story slide '{source}' for instagram: {e}")
+        except Exception as e:
+            logger.error(f"Error preparing story slide '{source}' for instagram: {e}")
+        tmp_target.unlink(missing_ok=True)
+        return None
+
+
+story_slide_renderer = StorySlideRenderer()
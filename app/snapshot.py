@@ -0,0 +1,357 @@
+import json
+import os
+import secrets
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, cast
+
+from app.logger import logger
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.sharedstate import SharedMemoryState
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+# Bit flags of the languages a status can be marked with, used by the public language filter
+LANGUAGES = {
+    "de": 0b01,
+    "en": 0b10,
+}
+
+
+def language_mask(languages: Iterable[str]) -> int:
+    """Combine language codes to a bitmask"""
+    mask = 0
+    for language in languages:
+        mask |= LANGUAGES[language]
+    return mask
+
+
+def language_codes(mask: int) -> List[str]:
+    """Split a bitmask to language codes"""
+    return [language for language, flag in LANGUAGES.items() if mask & flag]
+
+
+def encode_json(data: Any) -> bytes:
+    """Encode data as compact UTF-8 JSON, using orjson if it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def decode_json(data: bytes) -> Any:
+    """Decode UTF-8 JSON, using orjson if it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def join_fragments(fragments: Iterable[bytes]) -> bytes:
+    """Assemble pre-encoded JSON objects into a JSON list"""
+    return b"[" + b",".join(fragments) + b"]"
+
+
+def load_public_state() -> Dict[str, Dict[str, Any]]:
+    """Load the public state of all nightlines from the database"""
+    from app.models import Nightline
+
+    return {row.nightline_name: row.public_state() for row in Nightline.list_nightline_rows()}
+
+
+def load_nightline_states(names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Load the public state of some nightlines from the database. Names of nightlines that don't exist are missing"""
+    from app.models import Nightline
+
+    return {name: row.public_state() for name, row in Nightline.get_nightline_rows(names).items()}
+
+
+def load_status_languages() -> Dict[str, int]:
+    """Load the language bitmask of all statuses from the database"""
+    from app.models import Status
+
+    return {name: languages for name, languages in Status.query.with_entities(Status.name, Status.languages)}
+
+
+def filter_entries(
+    entries: Iterable[Dict[str, Any]],
+    status_languages: Mapping[str, int],
+    status_filter: Optional[str] = None,
+    language_filter: Optional[str] = None,
+    now_filter: Optional[bool] = None,
+) -> List[Dict[str, Any]]:
+    """Apply the public filters to the public state of nightlines, using the language bitmask of their status"""
+    language_flag = LANGUAGES.get(language_filter) if language_filter else None
+
+    return [
+        entry
+        for entry in entries
+        if (not status_filter or entry["status_name"] == status_filter)
+        and (language_flag is None or status_languages.get(entry["status_name"], 0) & language_flag)
+        and (not isinstance(now_filter, bool) or entry["now"] == now_filter)
+    ]
+
+
+class SnapshotState:
+    """Immutable public state of all nightlines at a given version"""
+
+    __slots__ = ("version", "entries", "languages", "fragments", "body")
+
+    def __init__(self, version: int, entries: Dict[str, Dict[str, Any]], languages: Dict[str, int], fragments: Dict[str, bytes]) -> None:
+        self.version = version
+        self.entries = entries
+        self.languages = languages  # Language bitmask by status name
+        self.fragments = fragments  # Pre-encoded JSON object per nightline
+        self.body = join_fragments(fragments.values())  # Pre-encoded JSON list of all nightlines
+
+
+class PublicSnapshot:
+    """Versioned, read-through snapshot of the public state of all nightlines
+
+    The app attaches a shared state, so the writing process publishes every new snapshot to shared memory and all
+    other processes, including CLI commands, read it from there. A detached snapshot counts versions per process.
+    """
+
+    def __init__(self) -> None:
+        self._version = 0
+        self._all_version = 0  # Version of the last change affecting every nightline
+        self._nightline_versions: Dict[str, int] = {}
+        self._token = secrets.token_hex(4)
+        self._state = SnapshotState(-1, {}, {}, {})
+        self._version_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._listeners: List[Callable[..., Any]] = []
+        self._shared: Optional["SharedMemoryState"] = None
+        self._shared_generation = -1
+
+    @property
+    def version(self) -> int:
+        """The current version of the public state"""
+        self._sync()
+        return self._version
+
+    @property
+    def all_version(self) -> int:
+        """The version of the last change affecting every nightline, e.g. a change of the statuses"""
+        self._sync()
+        return self._all_version
+
+    def attach(self, shared: "SharedMemoryState") -> None:
+        """Share the snapshot with other processes and publish the current state from the database"""
+        self._shared = shared
+        self._write_shared((), reset=True)
+        logger.info(f"Public snapshot shared through: '{shared.path}'")
+
+    def bump(self, *nightline_names: str) -> int:
+        """Mark the public state of nightlines, or of all nightlines if no name is given, as changed. Must be called after a commit"""
+        if self._shared:
+            version = self._write_shared(nightline_names)
+        else:
+            with self._version_lock:
+                self._version += 1
+                for name in nightline_names:
+                    self._nightline_versions[name] = self._version
+                if not nightline_names:
+                    self._all_version = self._version
+                version = self._version
+        logger.debug(f"Public state version bumped to: '{version}'")
+
+        for listener in self._listeners:
+            listener(*nightline_names)
+        return version
+
+    def add_listener(self, listener: Callable[..., Any]) -> None:
+        """Register a function called with the changed nightline names, or none for all nightlines, after every bump"""
+        self._listeners.append(listener)
+
+    def nightline_version(self, name: str) -> int:
+        """The version of the last change to the public state of a nightline"""
+        self._sync()
+        return max(self._nightline_versions.get(name, 0), self._all_version)
+
+    def etag(self, nightline_name: Optional[str] = None) -> str:
+        """Strong ETag value for a nightline, or for the list of all nightlines if no name is given"""
+        version = self.nightline_version(nightline_name) if nightline_name else self.version
+        if self._shared:
+            return f"{self._token}-{version}"
+        # Versions are counted per process, so the process is part of the tag
+        return f"{self._token}-{os.getpid()}-{version}"
+
+    def _build(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+        """Load the public state of all nightlines and the language bitmask of all statuses from the database"""
+        return load_public_state(), load_status_languages()
+
+    def _build_nightlines(self, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Load the public state of some nightlines from the database"""
+        return load_nightline_states(names)
+
+    def _make_state(self, version: int, entries: Dict[str, Dict[str, Any]], languages: Dict[str, int]) -> SnapshotState:
+        """Create a snapshot state, only encoding nightlines whose public state changed since the current one"""
+        state = self._state
+        fragments = {}
+        for name, entry in entries.items():
+            if state.entries.get(name) == entry:
+                fragments[name] = state.fragments[name]
+            else:
+                fragments[name] = encode_json(entry)
+        return SnapshotState(version, entries, languages, fragments)
+
+    def _apply_shared(self, generation: int, meta: Dict[str, Any], state: SnapshotState) -> None:
+        """Take over a snapshot published to the shared state"""
+        self._state = state
+        self._token = meta["token"]
+        self._nightline_versions = meta["nightline_versions"]
+        self._all_version = meta["all_version"]
+        self._version = meta["version"]
+        self._shared_generation = generation
+
+    def _decode_shared(self, payload: bytes) -> Tuple[Dict[str, Any], SnapshotState]:
+        """Decode a payload of the shared state: the versions and languages, a newline, and the JSON list of all nightlines"""
+        meta_json, _, body = payload.partition(b"\n")
+        meta = decode_json(meta_json)
+        entries = {entry["nightline_name"]: entry for entry in decode_json(body)}
+        return meta, self._make_state(meta["version"], entries, meta["languages"])
+
+    def _write_shared(self, nightline_names: Tuple[str, ...], reset: bool = False) -> int:
+        """Publish a new version of the public state to the shared state
+
+        If only some nightlines changed, only their public state is loaded from the database and encoded. All other
+        nightlines are taken over from the previous version.
+        """
+        shared = cast("SharedMemoryState", self._shared)
+        written: List[Tuple[Dict[str, Any], SnapshotState]] = []
+
+        def update(payload: bytes) -> bytes:
+            # Runs while holding the write lock, so the database state includes all changes committed before
+            meta: Dict[str, Any] = {"version": 0, "all_version": 0, "nightline_versions": {}}
+            previous: Optional[SnapshotState] = None
+            if payload and not reset:  # A reset doesn't read the payload, e.g. of an older version of the app
+                if shared.generation() == self._shared_generation:
+                    meta, previous = self._meta(), self._state  # The previous version is already decoded
+                else:
+                    meta, previous = self._decode_shared(payload)
+            else:
+                meta["token"] = secrets.token_hex(4)
+
+            version = meta["version"] + 1
+            meta["version"] = version
+            for name in nightline_names:
+                meta["nightline_versions"][name] = version
+            if not nightline_names:
+                meta["all_version"] = version
+
+            if nightline_names and previous is not None and not reset:
+                entries = dict(previous.entries)
+                fragments = dict(previous.fragments)
+                changed = self._build_nightlines(nightline_names)
+                for name in nightline_names:
+                    if name in changed:
+                        entries[name] = changed[name]
+                        fragments[name] = encode_json(changed[name])
+                    else:  # The nightline was removed
+                        entries.pop(name, None)
+                        fragments.pop(name, None)
+                state = SnapshotState(version, entries, previous.languages, fragments)
+            else:
+                state = self._make_state(version, *self._build())
+            meta["languages"] = state.languages
+
+            written.append((meta, state))
+            return encode_json(meta) + b"\n" + state.body
+
+        with self._rebuild_lock:
+            generation = shared.write(update)
+            self._apply_shared(generation, *written[-1])
+        return self._version
+
+    def _meta(self) -> Dict[str, Any]:
+        """The versions of the current snapshot, as published to the shared state"""
+        return {
+            "token": self._token,
+            "version": self._version,
+            "all_version": self._all_version,
+            "nightline_versions": dict(self._nightline_versions),
+            "languages": self._state.languages,
+        }
+
+    def _sync(self) -> None:
+        """Take over a newer snapshot published by another process"""
+        shared = self._shared
+        if shared is None or shared.generation() == self._shared_generation:
+            return
+
+        with self._rebuild_lock:
+            result = shared.read()
+            if result is None or result[0] == self._shared_generation:
+                return
+            generation, payload = result
+            self._apply_shared(generation, *self._decode_shared(payload))
+            logger.debug(f"Loaded shared public snapshot at version: '{self._version}'")
+
+    def _get_state(self) -> SnapshotState:
+        """Return the public state, rebuilding it at most once per version"""
+        self._sync()
+        state = self._state
+        if state.version == self._version:
+            return state
+
+        # Single-flight: concurrent readers wait for one rebuild instead of all querying the db
+        with self._rebuild_lock:
+            state = self._state
+            version = self._version
+            if state.version == version:
+                return state
+
+            state = self._make_state(version, *self._build())
+            self._state = state
+            logger.debug(f"Rebuilt public snapshot with {len(state.entries)} nightlines at version: '{version}'")
+            return state
+
+    def get_entries(self) -> Dict[str, Dict[str, Any]]:
+        """Return the public state of all nightlines by name"""
+        return self._get_state().entries
+
+    def get_status_languages(self) -> Dict[str, int]:
+        """Return the language bitmask of all statuses by name"""
+        return self._get_state().languages
+
+    def get_fragments(self) -> Tuple[Dict[str, bytes], bytes]:
+        """Return the pre-encoded public state of every nightline by name and the pre-encoded list of all nightlines, of the same version"""
+        state = self._get_state()
+        return state.fragments, state.body
+
+    def get_nightline(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return the public state of a single nightline"""
+        return self.get_entries().get(name)
+
+    def get_nightline_json(self, name: str) -> Optional[bytes]:
+        """Return the pre-encoded public state of a single nightline"""
+        return self._get_state().fragments.get(name)
+
+    def list_nightlines(
+        self,
+        status_filter: Optional[str] = None,
+        language_filter: Optional[str] = None,
+        now_filter: Optional[bool] = None,
+    ) -> List[Dict[str, Any]]:
+        """List the public state of all nightlines with optional filters"""
+        state = self._get_state()
+        return filter_entries(state.entries.values(), state.languages, status_filter, language_filter, now_filter)
+
+    def list_nightlines_json(
+        self,
+        status_filter: Optional[str] = None,
+        language_filter: Optional[str] = None,
+        now_filter: Optional[bool] = None,
+    ) -> bytes:
+        """List the pre-encoded public state of all nightlines with optional filters"""
+        state = self._get_state()
+        if not status_filter and not language_filter and now_filter is None:
+            return state.body
+
+        entries = filter_entries(state.entries.values(), state.languages, status_filter, language_filter, now_filter)
+        return join_fragments(state.fragments[entry["nightline_name"]] for entry in entries)
+
+
+public_snapshot = PublicSnapshot()
@@ -1,72 +1,195 @@
+import json
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from pathlib import Path
-from typing import Optional, cast
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, TypeVar, cast
 
 from instagrapi import Client
 from instagrapi.exceptions import LoginRequired
 
+from app.circuitbreaker import CircuitBreaker
+from app.config import Config
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.models.instagram import InstagramAccount
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Threads calling Instagram, and the most calls that may be running or waiting for a thread at the same time
+CALL_THREADS = 4
+MAX_PENDING_CALLS = 8
+
 
-def login_user(cl: Client, username: str, password: str) -> bool:
+class InstagramBusyError(Exception):
+    """Raised when too many calls to Instagram are pending, e.g. because earlier ones exceeded their deadline"""
+
+
+def login_user(cl: Client, username: str, password: str, settings: Optional[Dict[str, Any]] = None) -> bool:
     """
-    Attempts to login to Instagram using either the provided session information
+    Attempts to login to Instagram using either the provided session settings
     or the provided username and password.
+
+    The session is not validated here. An invalid session fails the first request,
+    which logs in again (see InstagramClientPool.run).
     """
-    login_via_session = False
-    login_via_pw = False
+    if settings:
+        try:
+            cl.set_settings(settings)
+            cl.login(username, password)  # Reuses the session of the settings
+            return True
+        except Exception as e:
+            logger.info("Couldn't login user using session information: %s" % e)
 
-    # Load session.json if present
-    session = None
-    if os.path.exists("session.json"):
-        session = cl.load_settings("session.json")
+            # use the same device uuids across logins
+            cl.set_settings({})
+            if "uuids" in settings:
+                cl.set_uuids(settings["uuids"])
 
-    if session:
-        try:
-            cl.set_settings(session)
-            cl.login(username, password)
+    try:
+        logger.info("Attempting to login via username and password. username: %s" % username)
+        if cl.login(username, password):
+            return True
+    except Exception as e:
+        logger.info("Couldn't login user using username and password: %s" % e)
+    return False
 
-            # check if session is valid
-            try:
-                cl.get_timeline_feed()
-            except LoginRequired:
-                logger.info("Session is invalid, need to login via username and password")
 
-                old_session = cl.get_settings()
+def create_breaker(name: str, threshold: int) -> CircuitBreaker:
+    """Create a circuit breaker for Instagram calls"""
+    return CircuitBreaker(name, threshold, Config.INSTAGRAM_BREAKER_COOLDOWN, Config.INSTAGRAM_BREAKER_MAX_COOLDOWN)
 
-                # use the same device uuids across logins
-                cl.set_settings({})
-                cl.set_uuids(old_session["uuids"])
 
-                cl.login(username, password)
-            login_via_session = True
-        except Exception as e:
-            logger.info("Couldn't login user using session information: %s" % e)
+class InstagramClientPool:
+    """Logged-in Instagram clients by account id
+
+    The session settings of a client are stored in the session data of its account,
+    so other workers and restarts reuse the session instead of logging in again.
+
+    Every call to Instagram has a deadline and is guarded by a circuit breaker of its
+    account and a global one, so calls fail fast while Instagram is unavailable.
+    """
 
-    if not login_via_session:
+    def __init__(self) -> None:
+        self._clients: Dict[int, Client] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=CALL_THREADS, thread_name_prefix="instagram")
+        self._pending_calls = threading.BoundedSemaphore(MAX_PENDING_CALLS)
+        self.breaker = create_breaker("global", Config.INSTAGRAM_GLOBAL_BREAKER_THRESHOLD)
+        self._breakers: Dict[int, CircuitBreaker] = {}
+
+    def account_breaker(self, account_id: int) -> CircuitBreaker:
+        """Circuit breaker of an account"""
+        with self._lock:
+            if account_id not in self._breakers:
+                self._breakers[account_id] = create_breaker(f"account {account_id}", Config.INSTAGRAM_BREAKER_THRESHOLD)
+            return self._breakers[account_id]
+
+    def breakers(self) -> List[CircuitBreaker]:
+        """The global circuit breaker and the ones of all accounts"""
+        with self._lock:
+            return [self.breaker, *self._breakers.values()]
+
+    def _call(self, function: Callable[..., T], *args: Any) -> T:
+        """Call Instagram with a deadline
+
+        A call that didn't start before its deadline is cancelled. A running one can't be interrupted, it keeps its slot
+        until it finishes, but the caller moves on. Once MAX_PENDING_CALLS are pending, new calls are rejected instead of queued.
+        """
+        if not self._pending_calls.acquire(blocking=False):
+            raise InstagramBusyError(f"{MAX_PENDING_CALLS} calls to Instagram are already pending")
+
+        future = self._executor.submit(function, *args)
+        future.add_done_callback(lambda _: self._pending_calls.release())
         try:
-            logger.info("Attempting to login via username and password. username: %s" % username)
-            if cl.login(username, password):
-                login_via_pw = True
-                cl.dump_settings("session.json")
-        except Exception as e:
-            logger.info("Couldn't login user using username and password: %s" % e)
+            return future.result(timeout=Config.INSTAGRAM_CALL_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _account_lock(self, account_id: int) -> threading.Lock:
+        """Lock of an account. Clients are not thread-safe, so requests of an account are serialized"""
+        with self._lock:
+            return self._locks.setdefault(account_id, threading.Lock())
+
+    def _login(self, account: "InstagramAccount", use_session: bool = True) -> Optional[Client]:
+        """Log in a new client for an account and store its session settings"""
+        password = account.get_password()
+        if password is None:
+            return None
+
+        settings = json.loads(account.session_data) if use_session and account.session_data else None
+        client = Client()
+        if not self._call(login_user, client, account.username, password, settings):
+            return None
+
+        account.set_session_data(json.dumps(client.get_settings()))
+        self._clients[account.id] = client
+        return client
+
+    def discard(self, account_id: int) -> None:
+        """Drop the client of an account, e.g. after its credentials changed"""
+        with self._account_lock(account_id):
+            self._clients.pop(account_id, None)
+
+    def run(self, account: "InstagramAccount", action: Callable[[Client], T]) -> Optional[T]:
+        """Run an action with the client of an account. Returns None without calling Instagram if a circuit breaker is open"""
+        breaker = self.account_breaker(account.id)
+        if not breaker.allow():
+            logger.warning(f"Instagram calls for account {account.id} are suspended by an open circuit breaker")
+            return None
+        if not self.breaker.allow():
+            breaker.abandon()  # The trial call of the account, if it was one, is made by the next caller
+            logger.warning(f"Instagram calls for account {account.id} are suspended by an open circuit breaker")
+            return None
+
+        with self._account_lock(account.id):
+            try:
+                result = self._run(account, action)
+            except Exception:
+                # The client may still be used by a call that exceeded its deadline
+                self._clients.pop(account.id, None)
+                breaker.record_failure()
+                self.breaker.record_failure()
+                raise
+
+            if result is None:  # Logging in failed
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+                self.breaker.record_success()
+            return result
+
+    def _run(self, account: "InstagramAccount", action: Callable[[Client], T]) -> Optional[T]:
+        """Run an action with the client of an account. Logs in again once if the session is no longer valid"""
+        client = self._clients.get(account.id) or self._login(account)
+        if not client:
+            return None
+
+        try:
+            return self._call(action, client)
+        except LoginRequired:
+            logger.info("Session is invalid, need to login via username and password")
+            self._clients.pop(account.id, None)
 
-    if not login_via_pw and not login_via_session:
-        return False
-    return True
+        client = self._login(account, use_session=False)
+        if not client:
+            return None
+        return self._call(action, client)
 
 
-def post_story(image_path: Path, username: str, password: str) -> Optional[str]:
+instagram_clients = InstagramClientPool()
+
+
+def post_story(image_path: Path, account: "InstagramAccount") -> Optional[str]:
     """
     Uploads a story to Instagram.
     """
-    # Initiate Instagram session
-    cl = Client()
-    if not login_user(cl, username, password):
-        return None
-
     # Check image to upload
     if not os.path.exists(image_path):
         logger.error(f"Image not found: {image_path}")
@@ -74,7 +197,9 @@ def post_story(image_path: Path, username: str, password: str) -> Optional[str]:
 
     # Upload the image
     try:
-        resp = cl.photo_upload_to_story(image_path)
+        resp = instagram_clients.run(account, lambda cl: cl.photo_upload_to_story(image_path))
+        if resp is None:
+            return None
         media_id = cast(str, resp.pk)
         logger.info(f"Story {image_path} with ID: {media_id}, posted successfully.")
         return media_id
@@ -83,17 +208,18 @@ def post_story(image_path: Path, username: str, password: str) -> Optional[str]:
     return None
 
 
-def delete_story_by_id(media_id: str, username: str, password: str) -> bool:
+def delete_story_by_id(media_id: str, account: "InstagramAccount") -> bool:
     """
     Deletes an Instagram story given its media ID.
     """
-    # Initiate Instagram session
-    cl = Client()
-    if not login_user(cl, username, password):
-        return False
 
-    try:
+    def delete(cl: Client) -> bool:
         cl.media_delete(media_id)
+        return True
+
+    try:
+        if not instagram_clients.run(account, delete):
+            return False
         logger.info(f"Story with ID {media_id} deleted successfully.")
         return True
     except Exception as e:
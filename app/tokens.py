@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from app.config import Config
+from app.logger import logger
+
+# Format: nlt1.<nightline id>.<nightline name>.<key generation>.<signature>
+TOKEN_PREFIX = "nlt1"
+
+
+class NightlineTokens:
+    """Stateless nightline tokens, signed with HMAC-SHA256 and verified without a database query
+
+    A token is bound to the key generation of a nightline. Renewing the API key bumps the generation,
+    which revokes all tokens issued before. Each worker caches the generations, so a renewal in another
+    worker revokes tokens in this one after at most API_TOKEN_CACHE_SECONDS.
+    """
+
+    def __init__(self) -> None:
+        self._generations: Dict[int, Tuple[int, str, float]] = {}  # Generation, key hash and expiry by nightline ID
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Tokens are only issued and accepted if a secret is configured"""
+        return bool(Config.API_TOKEN_SECRET)
+
+    @staticmethod
+    def is_token(value: str) -> bool:
+        """Check if an Authorization header holds a token rather than an API key"""
+        return value.startswith(f"{TOKEN_PREFIX}.")
+
+    @staticmethod
+    def _sign(payload: str, key_hash: str) -> str:
+        """Sign a token payload. The hash of the API key is part of the signature, so tokens of a removed nightline stay invalid"""
+        digest = hmac.new(str(Config.API_TOKEN_SECRET).encode(), f"{payload}.{key_hash}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def issue(self, nightline_id: int, nightline_name: str, generation: int, key_hash: str) -> str:
+        """Issue a token for the current key generation of a nightline"""
+        payload = f"{TOKEN_PREFIX}.{nightline_id}.{nightline_name}.{generation}"
+        self.update(nightline_id, generation, key_hash)
+        logger.debug(f"Issued token for nightline: '{nightline_name}'")
+        return f"{payload}.{self._sign(payload, key_hash)}"
+
+    def update(self, nightline_id: int, generation: int, key_hash: str) -> None:
+        """Cache the current key generation of a nightline, e.g. after its API key was renewed"""
+        with self._lock:
+            self._generations[nightline_id] = (generation, key_hash, time.monotonic() + Config.API_TOKEN_CACHE_SECONDS)
+
+    def _get_generation(self, nightline_id: int, min_generation: int) -> Optional[Tuple[int, str]]:
+        """Return the cached key generation of a nightline, loading it if it's unknown, expired or older than a token"""
+        cached = self._generations.get(nightline_id)
+        if cached and cached[0] >= min_generation and cached[2] > time.monotonic():
+            return cached[0], cached[1]
+
+        from app.models import ApiKey
+
+        row = ApiKey.query.with_entities(ApiKey.generation, ApiKey.key_hash).filter_by(nightline_id=nightline_id).first()
+        if not row:
+            with self._lock:
+                self._generations.pop(nightline_id, None)
+            return None
+
+        self.update(nightline_id, row[0], row[1])
+        return row[0], row[1]
+
+    def verify(self, token: str, nightline_name: str) -> Optional[int]:
+        """Check that a token is signed, issued for a nightline and not revoked. Returns the ID of the nightline, or None if it's invalid"""
+        if not self.enabled:
+            return None
+
+        payload, _, signature = token.rpartition(".")
+        parts = payload.split(".")
+        if len(parts) != 4 or parts[0] != TOKEN_PREFIX or parts[2] != nightline_name or not parts[1].isdigit() or not parts[3].isdigit():
+            return None
+
+        nightline_id, generation = int(parts[1]), int(parts[3])
+        current = self._get_generation(nightline_id, generation)
+        if not current or current[0] != generation:
+            logger.info(f"Rejected revoked token for nightline: '{nightline_name}'")
+            return None
+
+        if not hmac.compare_digest(signature, self._sign(payload, current[1])):
+            return None
+        return nightline_id
+
+
+nightline_tokens = NightlineTokens()
@@ -4,6 +4,10 @@ from flask_restx import abort
 from PIL import Image
 from werkzeug.datastructures.file_storage import FileStorage
 
+from app.snapshot import LANGUAGES
+
+IMAGE_FORMATS = ["JPEG", "PNG", "GIF"]
+
 
 def validate_request_body(data: Any, keys: list[str]) -> bool:
     """Check if keys exist in request body"""
@@ -50,12 +54,49 @@ def validate_filters(status_filter: Optional[str] = None, language_filter: Optio
             abort(400, message="Invalid value for 'now' filter. Use 'true' or 'false'")
 
 
+def validate_change_version(since: Optional[str]) -> None:
+    """Validate the value of a change version parameter"""
+    if since is None or not since.isdigit() or len(since) > 18:
+        abort(400, message="Invalid value for 'since'. Use a non-negative change version")
+
+
+def validate_languages(languages: Any) -> None:
+    """Validate a list of language codes"""
+    if not isinstance(languages, list) or any(not isinstance(language, str) or language not in LANGUAGES for language in languages):
+        abort(400, message="Invalid value for 'languages'. Use a list of 'de' and 'en'")
+
+
 def validate_status_value(status_value: str) -> None:
     """Validate the format of a status parameter"""
     if not isinstance(status_value, str) or not status_value.strip() or len(status_value) > 15:
         abort(400, "'status' must be a non-empty valid status name")
 
 
+def validate_status_updates(updates: Any, limit: int = 100) -> None:
+    """Validate a list of status updates of nightlines"""
+    if not isinstance(updates, list) or not updates or len(updates) > limit:
+        abort(400, f"'updates' must be a list of 1 to {limit} status updates")
+
+    names = set()
+    for update in updates:
+        if not isinstance(update, dict) or not isinstance(update.get("nightline"), str):
+            abort(400, "Every update must be an object with a 'nightline' name")
+
+        name = update["nightline"].strip().lower()
+        if not name.isalnum() or len(name) > 50:
+            abort(400, f"Invalid name format: '{update['nightline']}'")
+        if name in names:
+            abort(400, f"Nightline '{name}' is updated more than once")
+        names.add(name)
+
+        if "status" not in update and "now" not in update:
+            abort(400, f"Missing 'status' or 'now' in update of nightline '{name}'")
+        if "status" in update:
+            validate_status_value(update["status"])
+        if "now" in update and not isinstance(update["now"], bool):
+            abort(400, "'now' must be a boolean")
+
+
 def validate_instagram_credentials(username: str, password: str) -> None:
     """Validate the format of instagram credentials"""
     if len(username) > 50 or len(password) > 100:
@@ -70,9 +111,14 @@ def validate_image(image_file: FileStorage) -> None:
         abort(400, "Unsupported image type")
         return
 
-    # Validate image files content
+    # Validate the image by its header, without decoding it. It's decoded when it's prepared for instagram
     try:
-        img = Image.open(image_file)
-        img.verify()  # Verify that it's a valid image
-    except Exception:
+        with Image.open(image_file.stream) as img:
+            image_format = img.format
+    except Exception:  # Also raised for images whose dimensions exceed the decompression bomb limit
+        image_format = None
+    finally:
+        image_file.stream.seek(0)  # The file is stored from the start
+
+    if image_format not in IMAGE_FORMATS:
         abort(400, "Invalid image content")
@@ -4,7 +4,7 @@ from app.app import create_app
 
 
 @pytest.fixture(scope="session")
-def app():
+def app(tmp_path_factory):
     overrides = {
         "TESTING": True,
         "ENCRYPTION_PASSWORD": "testpassword",
@@ -12,6 +12,10 @@ def app():
         "SQLALCHEMY_TRACK_MODIFICATIONS": False,
         "ENABLE_ADMIN_ROUTES": False,
         "API_DOC_PATH": False,
+        "INSTAGRAM_JOB_WORKER": False,
+        "INSTAGRAM_JOB_CONCURRENCY": 1,  # The in-memory database is a single connection
+        "STORY_SLIDE_WORKERS": 0,
+        "SHARED_STATE_PATH": str(tmp_path_factory.mktemp("shared") / "public-state"),
     }
     app = create_app(overrides)
 
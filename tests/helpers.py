@@ -0,0 +1,7 @@
+from app.models.nightline import Nightline
+
+
+def add_nightline(name):
+    """Create a nightline with the default status and return it"""
+    Nightline.add_nightlines([name])
+    return Nightline.get_nightline(name)
@@ -1,9 +1,16 @@
+import io
+import json
+import os
 from unittest.mock import patch
 
 import pytest
 
 from app.config import Config
+from app.models.apikey import ApiKey
 from app.models.nightline import Nightline
+from app.models.nightlinestatus import NightlineStatus
+from app.models.status import Status
+from tests.helpers import add_nightline
 
 
 @pytest.fixture
@@ -13,7 +20,7 @@ def headers_with_valid_token():
 
 @pytest.fixture
 def add_test_nightline():
-    nightline = Nightline.add_nightline("testline")
+    nightline = add_nightline("testline")
     yield nightline
     Nightline.remove_nightline("testline")
 
@@ -54,6 +61,7 @@ def test_add_nightline_success(client, headers_with_valid_token):
     response = client.post("/admin/nightline/testline", headers=headers_with_valid_token)
 
     assert_message(response, "Nightline 'testline' added successfully", 200)
+    assert ApiKey.get_nightline_by_key(response.get_json()["API-Key"]).name == "testline"  # The new nightline can be used right away
 
 
 def test_add_nightline_existing(client, headers_with_valid_token):
@@ -64,8 +72,8 @@ def test_add_nightline_existing(client, headers_with_valid_token):
     Nightline.remove_nightline("testline")
 
 
-@patch("app.routes.admin.admin_nightline_routes.Nightline.add_nightline", return_value=False)
-def test_add_nightline_error_on_add_nightline(mock_add_nightline, client, headers_with_valid_token):
+@patch("app.routes.admin.admin_nightline_routes.Nightline.add_nightlines", return_value=None)
+def test_add_nightline_error_on_add_nightline(mock_add_nightlines, client, headers_with_valid_token):
 
     response = client.post("/admin/nightline/testline", headers=headers_with_valid_token)
 
@@ -84,7 +92,7 @@ def test_delete_nightline_non_existing(client, headers_with_valid_token):
 
 
 def test_delete_nightline_success(client, headers_with_valid_token):
-    nightline = Nightline.add_nightline("testline")
+    nightline = add_nightline("testline")
 
     response = client.delete(f"/admin/nightline/{nightline.name}", headers=headers_with_valid_token)
 
@@ -92,50 +100,190 @@ def test_delete_nightline_success(client, headers_with_valid_token):
 
 
 # -------------------------
-# admin/nightline/key/<nightline_name> [get]
+# admin/nightline/key/<nightline_name> [patch]
 # -------------------------
-def test_get_nightline_api_key_non_existing_nightline(client, headers_with_valid_token):
-    response = client.get("/admin/nightline/key/testline", headers=headers_with_valid_token)
+def test_renew_nightline_api_key_success(client, headers_with_valid_token):
+    nightline = add_nightline("testline")
+
+    response = client.patch("/admin/nightline/key/testline", headers=headers_with_valid_token)
+
+    assert_message(response, "API key regenerated successfully", 200)
+    assert ApiKey.get_nightline_by_key(response.get_json()["API-Key"]) == nightline
+
+
+@patch("app.routes.admin.admin_nightline_routes.Nightline.renew_api_key", return_value=None)
+def test_renew_nightline_api_key_not_found_api_key(mock_renew_api_key, client, headers_with_valid_token):
+    response = client.patch("/admin/nightline/key/testline", headers=headers_with_valid_token)
+
+    assert_message(response, "No api key found for nightline: 'testline'", 500)
+
+    Nightline.remove_nightline("testline")
+
+
+def test_renew_nightline_api_key_nightline_not_found(client, headers_with_valid_token):
+    response = client.patch("/admin/nightline/key/testline", headers=headers_with_valid_token)
 
     assert_message(response, "Nightline 'testline' not found", 404)
 
 
-def test_get_nightline_api_key_success(client, headers_with_valid_token):
-    nightline = Nightline.add_nightline("testline")
+# -------------------------
+# admin/nightline/all/reset [post]
+# -------------------------
+@patch("app.models.nightline.instagram_job_worker")
+def test_reset_all(mock_worker, client, headers_with_valid_token, add_test_nightline):
+    add_test_nightline.set_status("german")
+    add_test_nightline.add_instagram_account("user", "pass")
+    add_test_nightline.set_instagram_media_id("media123")
+
+    response = client.post("/admin/nightline/all/reset", headers=headers_with_valid_token)
 
-    response = client.get(f"/admin/nightline/key/{nightline.name}", headers=headers_with_valid_token)
     assert response.status_code == 200
+    data = response.get_json()
+    assert data["message"] == "Reset the status of 1 nightlines"
+    assert data["nightlines"] == ["testline"]
+    assert list(data["jobs"]) == ["testline"]
+    assert add_test_nightline.status.name == "default"
+
+
+@patch("app.routes.admin.admin_nightline_routes.Nightline.reset_all_statuses", return_value=None)
+def test_reset_all_fails(mock_reset_all_statuses, client, headers_with_valid_token):
+    response = client.post("/admin/nightline/all/reset", headers=headers_with_valid_token)
+
+    assert_message(response, "Resetting the statuses failed", 500)
+
 
+@patch("app.routes.admin.admin_nightline_routes.Nightline.enqueue_instagram_story_deletions", return_value=None)
+def test_reset_all_queueing_deletions_fails(mock_enqueue_deletions, client, headers_with_valid_token):
+    response = client.post("/admin/nightline/all/reset", headers=headers_with_valid_token)
+
+    assert_message(response, "Statuses successfully reset but queueing the deletion of the instagram stories failed", 500)
+
+
+# -------------------------
+# admin/nightline/all/status [patch]
+# -------------------------
+@patch("app.models.nightline.instagram_job_worker")
+def test_update_statuses(mock_worker, client, headers_with_valid_token, add_test_nightline):
+    other = add_nightline("otherline")
+    NightlineStatus.update_instagram_story(add_test_nightline, Status.get_status_info("canceled"), True)
+    updates = [{"nightline": "TestLine", "status": "canceled"}, {"nightline": "otherline", "status": "canceled", "now": True}]
+
+    response = client.patch("/admin/nightline/all/status", json={"updates": updates}, headers=headers_with_valid_token)
+
+    assert response.status_code == 200
     data = response.get_json()
-    assert "API-Key" in data
+    assert data["message"] == "Updated 2 nightlines"
+    assert list(data["jobs"]) == ["testline"]
+    assert (add_test_nightline.status.name, add_test_nightline.now) == ("canceled", False)
+    assert (other.status.name, other.now) == ("canceled", True)
 
+    Nightline.remove_nightline("otherline")
 
-@patch("app.routes.admin.admin_nightline_routes.Nightline.get_api_key", return_value=None)
-def test_get_nightline_api_key_not_found(mock_get_api_key, client, headers_with_valid_token):
 
-    response = client.get(f"/admin/nightline/key/testline", headers=headers_with_valid_token)
-    assert_message(response, "No api key found for nightline: 'testline'", 500)
+def test_update_statuses_invalid_body(client, headers_with_valid_token):
+    response = client.patch("/admin/nightline/all/status", json={"updates": [{"nightline": "testline"}]}, headers=headers_with_valid_token)
+
+    assert_message(response, "Missing 'status' or 'now' in update of nightline 'testline'", 400)
+
+
+def test_update_statuses_nightline_not_found(client, headers_with_valid_token, add_test_nightline):
+    updates = [{"nightline": "testline", "now": True}, {"nightline": "ghostline", "now": True}]
+
+    response = client.patch("/admin/nightline/all/status", json={"updates": updates}, headers=headers_with_valid_token)
+
+    assert_message(response, "Nightlines not found: 'ghostline'", 404)
+    assert add_test_nightline.now is False
+
+
+def test_update_statuses_status_not_found(client, headers_with_valid_token, add_test_nightline):
+    response = client.patch("/admin/nightline/all/status", json={"updates": [{"nightline": "testline", "status": "bsod"}]}, headers=headers_with_valid_token)
+
+    assert_message(response, "Status 'bsod' not found", 404)
+
+
+@patch("app.routes.admin.admin_nightline_routes.Nightline.update_statuses", return_value=False)
+def test_update_statuses_fails(mock_update_statuses, client, headers_with_valid_token, add_test_nightline):
+    response = client.patch("/admin/nightline/all/status", json={"updates": [{"nightline": "testline", "now": True}]}, headers=headers_with_valid_token)
+
+    assert_message(response, "Updating the statuses failed", 500)
+
+
+@patch("app.routes.admin.admin_nightline_routes.Nightline.enqueue_instagram_stories", return_value=None)
+def test_update_statuses_queueing_stories_fails(mock_enqueue_stories, client, headers_with_valid_token, add_test_nightline):
+    updates = {"updates": [{"nightline": "testline", "status": "canceled"}]}
+    response = client.patch("/admin/nightline/all/status", json=updates, headers=headers_with_valid_token)
+
+    assert_message(response, "Statuses updated but queueing the instagram story posts failed", 500)
 
 
 # -------------------------
-# admin/nightline/key/<nightline_name> [patch]
+# admin/nightline/all/import [post]
 # -------------------------
-def test_renew_nightline_api_key_success(client, headers_with_valid_token):
-    response = client.patch("/admin/nightline/key/testline", headers=headers_with_valid_token)
+def test_import_nightlines(client, headers_with_valid_token, add_test_nightline):
+    response = client.post("/admin/nightline/all/import", json={"nightlines": ["importline", "TestLine"]}, headers=headers_with_valid_token)
 
-    assert_message(response, "API key regenerated successfully", 200)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert results[1] == {"nightline": "testline", "skipped": "already exists"}
+    assert results[0]["nightline"] == "importline"
+    assert ApiKey.get_nightline_by_key(results[0]["api_key"]).name == "importline"
 
+    Nightline.remove_nightline("importline")
 
-@patch("app.routes.admin.admin_nightline_routes.Nightline.renew_api_key", return_value=None)
-def test_renew_nightline_api_key_not_found_api_key(mock_renew_api_key, client, headers_with_valid_token):
-    response = client.patch("/admin/nightline/key/testline", headers=headers_with_valid_token)
 
-    assert_message(response, "No api key found for nightline: 'testline'", 500)
+def test_import_nightlines_csv_file(client):
+    data = {"file": (io.BytesIO(b"nightline\nimportline1\nimportline2\n"), "nightlines.csv")}
 
-    Nightline.remove_nightline("testline")
+    response = client.post("/admin/nightline/all/import", data=data, headers={"Authorization": Config.ADMIN_API_KEY}, content_type="multipart/form-data")
 
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [result["nightline"] for result in results] == ["importline1", "importline2"]
 
-def test_renew_nightline_api_key_nightline_not_found(client, headers_with_valid_token):
-    response = client.patch("/admin/nightline/key/testline", headers=headers_with_valid_token)
+    Nightline.remove_nightline("importline1")
+    Nightline.remove_nightline("importline2")
 
-    assert_message(response, "Nightline 'testline' not found", 404)
+
+def test_import_nightlines_missing_nightlines(client, headers_with_valid_token):
+    response = client.post("/admin/nightline/all/import", json={}, headers=headers_with_valid_token)
+
+    assert_message(response, "Missing 'nightlines' in request", 400)
+
+
+def test_import_nightlines_invalid_name(client, headers_with_valid_token):
+    response = client.post("/admin/nightline/all/import", json={"nightlines": ["import line"]}, headers=headers_with_valid_token)
+
+    assert_message(response, "Invalid name format: 'import line'", 400)
+    assert Nightline.get_nightline("importline") is None
+
+
+def test_import_nightlines_too_many(client, headers_with_valid_token):
+    with patch.object(Config, "NIGHTLINE_IMPORT_LIMIT", 1):
+        response = client.post("/admin/nightline/all/import", json={"nightlines": ["importline1", "importline2"]}, headers=headers_with_valid_token)
+
+    assert_message(response, "'nightlines' must be a list of 1 to 1 nightline names", 400)
+
+
+@patch("app.nightlineimport.Nightline.add_nightlines", return_value=None)
+def test_import_nightlines_fails(mock_add_nightlines, client, headers_with_valid_token):
+    response = client.post("/admin/nightline/all/import", json={"nightlines": ["importline"]}, headers=headers_with_valid_token)
+
+    assert response.status_code == 200  # The response started streaming already
+    assert json.loads(response.get_data(as_text=True)) == {"error": "Importing the nightlines failed after 0 of 1 nightlines"}
+
+
+# -------------------------
+# admin/nightline/instagram/breakers [get]
+# -------------------------
+def test_get_instagram_breakers(client, headers_with_valid_token):
+    response = client.get("/admin/nightline/instagram/breakers", headers=headers_with_valid_token)
+
+    assert response.status_code == 200
+    assert {"worker": os.getpid(), "name": "global", "state": "closed", "failures": 0, "retry_in": None} in response.get_json()
+
+
+def test_get_instagram_breakers_invalid_key(client):
+    response = client.get("/admin/nightline/instagram/breakers", headers={"Authorization": "invalid"})
+
+    assert_message(response, "Admin API key required", 403)
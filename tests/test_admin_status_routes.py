@@ -90,6 +90,54 @@ def test_add_duplicate_status(client, headers_with_valid_token, sample_status_pa
         db.session.commit()
 
 
+def test_add_status_with_languages(client, headers_with_valid_token, sample_status_payload):
+    payload = dict(sample_status_payload, languages=["de", "en"])
+    response = client.post("/admin/status/", json=payload, headers=headers_with_valid_token)
+    assert_message(response, "test-status", 200)
+
+    assert Status.get_status("test-status").languages == 0b11
+    Status.remove_status("test-status")
+
+
+def test_add_status_invalid_languages(client, headers_with_valid_token, sample_status_payload):
+    payload = dict(sample_status_payload, languages=["fr"])
+    response = client.post("/admin/status/", json=payload, headers=headers_with_valid_token)
+    assert_message(response, "Invalid value for 'languages'", 400)
+
+    assert Status.get_status("test-status") is None
+
+
+# -------------------------
+# admin/status/ [patch]
+# -------------------------
+def test_set_status_languages_success(client, headers_with_valid_token):
+    Status.add_status("lang-status", "", "", "", "")
+
+    response = client.patch("/admin/status/", json={"status": "lang-status", "languages": ["en"]}, headers=headers_with_valid_token)
+    assert_message(response, "Languages of status 'lang-status' set successfully", 200)
+
+    assert Status.get_status("lang-status").languages == 0b10
+    Status.remove_status("lang-status")
+
+
+def test_set_status_languages_not_found(client, headers_with_valid_token):
+    response = client.patch("/admin/status/", json={"status": "non-existent", "languages": []}, headers=headers_with_valid_token)
+    assert_message(response, "Status 'non-existent' not found", 404)
+
+
+def test_set_status_languages_missing_field(client, headers_with_valid_token):
+    response = client.patch("/admin/status/", json={"status": "default"}, headers=headers_with_valid_token)
+    assert_message(response, "Missing 'languages' in request", 400)
+
+
+@patch("app.routes.admin.admin_status_routes.Status.set_languages")
+def test_set_status_languages_fails(mock_set_languages, client, headers_with_valid_token):
+    mock_set_languages.return_value = False
+
+    response = client.patch("/admin/status/", json={"status": "default", "languages": ["de"]}, headers=headers_with_valid_token)
+    assert_message(response, "Languages of status 'default' could not be set", 400)
+
+
 # -------------------------
 # admin/status/ [delete]
 # -------------------------
@@ -161,6 +209,8 @@ def test_list_statuses_success(client, headers_with_valid_token):
     assert response.json[0]["description_en"] == ""
     assert response.json[0]["description_now_de"] == "Wir sind jetzt erreichbar 📞"
     assert response.json[0]["description_now_en"] == "We're now available 📞"
+    assert response.json[0]["languages"] == []
+    assert next(status for status in response.json if status["status_name"] == "german-english")["languages"] == ["de", "en"]
 
 
 @patch("app.routes.admin.admin_status_routes.Status.list_statuses")
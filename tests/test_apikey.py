@@ -1,6 +1,7 @@
 import re
 
 from app.models.apikey import ApiKey
+from tests.helpers import add_nightline
 
 
 # -------------------------
@@ -40,10 +41,33 @@ def test_get_api_key_existing(app):
     from app.models.nightline import Nightline
 
     # Setup Nightline und ApiKey
-    nightline = Nightline.add_nightline(name="Testline")
+    nightline = add_nightline(name="Testline")
 
     key = nightline.get_api_key()
     assert key is not None
     assert isinstance(key, ApiKey)
-    assert isinstance(key.key, str)
+    assert len(key.key_hash) == 64
     assert key.nightline_id == nightline.id
+
+
+# -------------------------
+# get_nightline_by_key
+# -------------------------
+def test_get_nightline_by_key(app):
+    from app.models.nightline import Nightline
+
+    nightline = add_nightline(name="keyline")
+    key = nightline.renew_api_key()
+
+    assert ApiKey.get_nightline_by_key(key) == nightline
+    assert ApiKey.get_nightline_by_key(key + "x") is None
+    Nightline.remove_nightline("keyline")
+
+
+def test_verify():
+    api_key = ApiKey()
+    key = api_key.set_key()
+
+    assert api_key.key_hash == ApiKey.hash_key(key)
+    assert api_key.verify(key) is True
+    assert api_key.verify("invalid-key") is False
@@ -15,6 +15,13 @@ config_overrides = {
 }
 
 
+@pytest.fixture(autouse=True)
+def detached_public_snapshot():
+    """Apps created here must not attach the public snapshot of the test session to their own database"""
+    with patch("app.snapshot.public_snapshot.attach"):
+        yield
+
+
 # -------------------------
 # create_app
 # -------------------------
@@ -32,6 +39,12 @@ def test_create_app_raises_unknown_operational_error():
             create_app()
 
 
+@patch("app.migrations.run_migrations", return_value=False)
+def test_create_app_migrations_fail(mock_run_migrations):
+    with pytest.raises(RuntimeError, match="Migrating the database schema failed"):
+        create_app(config_overrides)
+
+
 @patch("app.config.Config.ENABLE_ADMIN_ROUTES", True)
 def test_admin_routes_enabled():
     app = create_app(config_overrides)
@@ -0,0 +1,86 @@
+import os
+from unittest.mock import patch
+
+from app.circuitbreaker import CircuitBreaker
+
+
+def create_breaker():
+    return CircuitBreaker("test", threshold=2, cooldown=10, max_cooldown=25)
+
+
+# -------------------------
+# record_failure / allow
+# -------------------------
+def test_breaker_opens_after_threshold():
+    breaker = create_breaker()
+
+    breaker.record_failure()
+    assert (breaker.state, breaker.allow()) == ("closed", True)
+
+    with patch("app.circuitbreaker.logger") as mock_logger:
+        breaker.record_failure()
+    assert (breaker.state, breaker.allow()) == ("open", False)
+    mock_logger.warning.assert_called_once_with("Circuit breaker 'test' opened for 10 seconds after 2 failures")
+
+
+def test_breaker_success_resets_failures():
+    breaker = create_breaker()
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+@patch("app.circuitbreaker.time.monotonic")
+def test_breaker_half_open_after_cooldown(mock_monotonic):
+    mock_monotonic.return_value = 100
+    breaker = create_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    mock_monotonic.return_value = 110
+    assert (breaker.state, breaker.allow()) == ("half_open", True)
+
+    breaker.record_success()
+    assert breaker.to_dict() == {"worker": os.getpid(), "name": "test", "state": "closed", "failures": 0, "retry_in": None}
+
+
+@patch("app.circuitbreaker.time.monotonic")
+def test_breaker_half_open_allows_a_single_trial_call(mock_monotonic):
+    mock_monotonic.return_value = 100
+    breaker = create_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    mock_monotonic.return_value = 110
+    assert breaker.allow() is True
+    assert breaker.allow() is False  # The trial call is running
+
+    # A trial call that wasn't made is given up
+    breaker.abandon()
+    assert breaker.allow() is True
+
+    # A trial call without a result doesn't block the breaker forever
+    mock_monotonic.return_value = 120
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+
+
+@patch("app.circuitbreaker.time.monotonic")
+def test_breaker_backs_off_exponentially(mock_monotonic):
+    mock_monotonic.return_value = 100
+    breaker = create_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.to_dict()["retry_in"] == 10
+
+    # A failed trial call opens the breaker again with a doubled cooldown
+    mock_monotonic.return_value = 110
+    breaker.record_failure()
+    assert breaker.to_dict() == {"worker": os.getpid(), "name": "test", "state": "open", "failures": 3, "retry_in": 20}
+
+    # Up to the maximum cooldown
+    mock_monotonic.return_value = 130
+    breaker.record_failure()
+    assert breaker.to_dict()["retry_in"] == 25
@@ -0,0 +1,148 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.commands import import_nightlines_command, reset_all_command
+from app.models.apikey import ApiKey
+from app.models.nightline import Nightline
+from app.sharedstate import SharedMemoryState
+from app.snapshot import PublicSnapshot
+from tests.helpers import add_nightline
+
+
+@pytest.fixture
+def resetline(app):
+    nightline = add_nightline("resetline")
+    nightline.add_instagram_account("user", "pass")
+    nightline.set_instagram_media_id("media123")
+    yield nightline
+    Nightline.remove_nightline("resetline")
+
+
+# -------------------------
+# reset-all
+# -------------------------
+@patch("app.models.nightline.instagram_job_worker")
+@patch("app.models.nightline.Nightline.delete_instagram_story", return_value=True)
+def test_reset_all_command(mock_delete_instagram_story, mock_worker, app, resetline):
+    resetline.set_status("german")
+
+    result = app.test_cli_runner().invoke(reset_all_command)
+
+    assert result.exit_code == 0
+    assert result.output == "Reset the status of 1 nightlines\nresetline: done\n"
+    assert resetline.status.name == "default"
+    mock_delete_instagram_story.assert_called_once()
+
+
+@patch("app.models.nightline.instagram_job_worker")
+@patch("app.models.nightline.Nightline.delete_instagram_story", return_value=True)
+def test_reset_all_command_visible_to_api_workers(mock_delete_instagram_story, mock_worker, app, resetline):
+    resetline.set_status("german")
+    worker = PublicSnapshot()  # The snapshot of an API worker process, attached to the same shared state
+    worker._shared = SharedMemoryState(app.config["SHARED_STATE_PATH"])
+    assert worker.get_nightline("resetline")["status_name"] == "german"
+    etag = worker.etag("resetline")
+
+    assert app.test_cli_runner().invoke(reset_all_command).exit_code == 0
+
+    with patch.object(worker, "_build", side_effect=AssertionError("the worker must not query the database")):
+        assert worker.get_nightline("resetline")["status_name"] == "default"
+        assert worker.etag("resetline") != etag
+
+
+@patch("app.models.nightline.instagram_job_worker")
+@patch("app.models.nightline.Nightline.delete_instagram_story", return_value=False)
+def test_reset_all_command_deletion_fails(mock_delete_instagram_story, mock_worker, app, resetline):
+    result = app.test_cli_runner().invoke(reset_all_command)
+
+    assert result.exit_code == 1
+    assert "resetline: failed (Deleting the instagram story failed)" in result.output
+    assert "Deleting the instagram stories of 1 nightlines failed" in result.output
+
+
+@patch("app.models.nightline.Nightline.delete_instagram_story", return_value=True)
+def test_reset_all_command_does_not_start_job_worker(mock_delete_instagram_story, app, resetline):
+    resetline.set_status("german")
+    with patch("app.jobs.InstagramJobWorker.ensure_started") as mock_ensure_started:
+        result = app.test_cli_runner().invoke(reset_all_command)
+
+    assert result.exit_code == 0
+    assert result.output == "Reset the status of 1 nightlines\nresetline: done\n"
+    mock_ensure_started.assert_not_called()
+
+
+@patch("app.commands.instagram_job_worker.process_pending")  # The job was claimed by an API worker process
+def test_reset_all_command_deletion_unfinished(mock_process_pending, app, resetline):
+    with patch("app.jobs.InstagramJobWorker.ensure_started"):
+        result = app.test_cli_runner().invoke(reset_all_command)
+
+    assert result.exit_code == 1
+    assert "resetline: pending" in result.output
+    assert "Deleting the instagram stories of 1 nightlines didn't finish, they are processed by another process" in result.output
+
+
+@patch("app.commands.Nightline.reset_all_statuses", return_value=None)
+def test_reset_all_command_reset_fails(mock_reset_all_statuses, app):
+    result = app.test_cli_runner().invoke(reset_all_command)
+
+    assert result.exit_code == 1
+    assert "Resetting the statuses failed" in result.output
+
+
+@patch("app.commands.Nightline.enqueue_instagram_story_deletions", return_value=None)
+def test_reset_all_command_queueing_deletions_fails(mock_enqueue_deletions, app):
+    result = app.test_cli_runner().invoke(reset_all_command)
+
+    assert result.exit_code == 1
+    assert "Queueing the deletion of the instagram stories failed" in result.output
+
+
+def test_reset_all_command_registered(app):
+    assert app.cli.commands["reset-all"] is reset_all_command
+
+
+# -------------------------
+# import-nightlines
+# -------------------------
+def test_import_nightlines_command(app, tmp_path, resetline):
+    file = tmp_path / "nightlines.json"
+    file.write_text('["importline", "resetline"]')
+    output = tmp_path / "keys.csv"
+
+    result = app.test_cli_runner().invoke(import_nightlines_command, [str(file), "--output", str(output)])
+
+    assert result.exit_code == 0
+    assert result.stderr == "resetline: skipped, already exists\nImported 1 of 2 nightlines\n"
+    header, row = output.read_text().splitlines()
+    assert header == "nightline,api_key"
+    name, key = row.split(",")
+    assert name == "importline"
+    assert ApiKey.get_nightline_by_key(key).name == "importline"
+
+    Nightline.remove_nightline("importline")
+
+
+def test_import_nightlines_command_invalid_file(app, tmp_path):
+    file = tmp_path / "nightlines.csv"
+    file.write_text("import-line\n")
+
+    result = app.test_cli_runner().invoke(import_nightlines_command, [str(file)])
+
+    assert result.exit_code == 1
+    assert "Invalid name format: 'import-line'" in result.output
+
+
+@patch("app.nightlineimport.Nightline.add_nightlines", return_value=None)
+def test_import_nightlines_command_fails(mock_add_nightlines, app, tmp_path):
+    file = tmp_path / "nightlines.csv"
+    file.write_text("importline\n")
+
+    result = app.test_cli_runner().invoke(import_nightlines_command, [str(file)])
+
+    assert result.exit_code == 1
+    assert "Importing the nightlines failed after 0 of 1 nightlines" in result.output
+
+
+def test_import_nightlines_command_registered(app):
+    assert app.cli.commands["import-nightlines"] is import_nightlines_command
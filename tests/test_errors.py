@@ -27,7 +27,7 @@ def test_handle_404_error(app):
 
 def test_handle_runtime_error(app):
     with app.test_client() as client:
-        with patch("app.routes.public_routes.Nightline.get_nightline") as mock_get_nightline:
+        with patch("app.routes.public_routes.public_snapshot.get_nightline_json") as mock_get_nightline:
             mock_get_nightline.side_effect = RuntimeError("Random unhandled runtime error")
             response = client.get("/public/test")
             assert_message(response, "An error occurred while processing data", 500)
@@ -35,7 +35,7 @@ def test_handle_runtime_error(app):
 
 def test_handle_generic_error(app):
     with app.test_client() as client:
-        with patch("app.routes.public_routes.Nightline.get_nightline") as mock_get_nightline:
+        with patch("app.routes.public_routes.public_snapshot.get_nightline_json") as mock_get_nightline:
             mock_get_nightline.side_effect = Exception("Random unhandled server error")
             response = client.get("/public/test")
             assert_message(response, "An unexpected error occurred", 500)
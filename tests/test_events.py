@@ -0,0 +1,34 @@
+from unittest.mock import patch
+
+from app.events import StreamLimiter, format_event_id, parse_event_id
+
+
+# -------------------------
+# format_event_id / parse_event_id
+# -------------------------
+def test_format_and_parse_event_id():
+    assert parse_event_id(format_event_id(42)) == 42
+
+
+def test_parse_event_id_invalid():
+    assert parse_event_id(None) is None
+    assert parse_event_id("") is None
+    assert parse_event_id("abcd-123-4") is None
+    assert parse_event_id("-1") is None
+
+
+# -------------------------
+# StreamLimiter
+# -------------------------
+@patch("app.events.logger")
+def test_stream_limiter(mock_logger):
+    limiter = StreamLimiter()
+
+    assert limiter.acquire(2) is True
+    assert limiter.acquire(2) is True
+    assert limiter.acquire(2) is False
+    mock_logger.warning.assert_called_once_with("Rejected an event stream, 2 of 2 streams are open")
+
+    limiter.release()
+    assert limiter.open == 1
+    assert limiter.acquire(2) is True
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import shutil
 import tempfile
@@ -11,9 +12,11 @@ from werkzeug.datastructures import FileStorage
 from app.filehandler import (
     check_file_already_exists,
     ensure_storage_path_exists,
+    ingest_file,
     remove_file,
-    save_file,
+    replace_file,
     validate_file_extension,
+    write_file_atomic,
 )
 
 sample_jpg = FileStorage(stream=BytesIO(b"fake jpg content"), filename="example.jpg", content_type="image/jpg")
@@ -121,32 +124,60 @@ def test_check_file_already_exists_unallowed_file_extension():
 
 
 # -------------------------
-# save_file
+# ingest_file
 # -------------------------
 @patch("app.filehandler.logger")
-def test_save_file_successfull(mock_logger):
-    temp_dir = tempfile.mkdtemp()
-    temp_file_path = Path(temp_dir, sample_jpg.filename)
+def test_ingest_file_successfull(mock_logger, tmp_path):
+    file_path = tmp_path / "example.jpg"
+    content = b"fake jpg content" * 1000
+    upload = FileStorage(stream=BytesIO(content), filename="example.jpg", content_type="image/jpg")
 
-    assert save_file(sample_jpg, temp_file_path) == True
-    mock_logger.info.assert_called_with(f"File saved successfully: {temp_file_path}")
+    assert ingest_file(upload, file_path, max_bytes=len(content), chunk_size=1024) == hashlib.sha256(content).hexdigest()
 
-    shutil.rmtree(temp_dir)
+    assert file_path.read_bytes() == content
+    assert os.listdir(tmp_path) == ["example.jpg"]  # No temporary file is left
+    mock_logger.info.assert_called_with(f"File saved successfully: {file_path}")
 
 
 @patch("app.filehandler.logger")
-def test_save_file_exception(mock_logger):
-    temp_dir = tempfile.mkdtemp()
-    temp_file_path = Path(temp_dir, sample_jpg.filename)
+def test_ingest_file_too_large(mock_logger, tmp_path):
+    file_path = tmp_path / "example.jpg"
+    file_path.write_bytes(b"previous content")
+    upload = FileStorage(stream=BytesIO(b"fake jpg content"), filename="example.jpg", content_type="image/jpg")
 
-    # Patch den save-Methoden-Pfad korrekt
-    with patch("werkzeug.datastructures.FileStorage.save") as mock_save:
-        mock_save.side_effect = OSError("Simulated permission error")
+    assert ingest_file(upload, file_path, max_bytes=10, chunk_size=4) is None
 
-        assert save_file(sample_jpg, temp_file_path) == False
-        mock_logger.error.assert_called_with(f"Error saving file '{temp_file_path}': Simulated permission error")
+    assert file_path.read_bytes() == b"previous content"  # The existing file is kept
+    assert os.listdir(tmp_path) == ["example.jpg"]
+    mock_logger.error.assert_called_with(f"Error saving file '{file_path}': File exceeds the maximum size of 10 bytes")
 
-    shutil.rmtree(temp_dir)
+
+@patch("app.filehandler.logger")
+def test_ingest_file_exception(mock_logger, tmp_path):
+    file_path = tmp_path / "missing" / "example.jpg"
+    upload = FileStorage(stream=BytesIO(b"fake jpg content"), filename="example.jpg", content_type="image/jpg")
+
+    assert ingest_file(upload, file_path, max_bytes=1024) is None
+
+    mock_logger.error.assert_called_once()
+
+
+# -------------------------
+# replace_file
+# -------------------------
+def test_replace_file(tmp_path):
+    (tmp_path / "upload").write_bytes(b"new")
+    (tmp_path / "english.png").write_bytes(b"old")
+
+    assert replace_file(tmp_path / "upload", tmp_path / "english.png") is True
+    assert os.listdir(tmp_path) == ["english.png"]
+    assert (tmp_path / "english.png").read_bytes() == b"new"
+
+
+@patch("app.filehandler.logger")
+def test_replace_file_missing_source(mock_logger, tmp_path):
+    assert replace_file(tmp_path / "upload", tmp_path / "english.png") is False
+    mock_logger.error.assert_called_once()
 
 
 # -------------------------
@@ -184,3 +215,27 @@ def test_remove_file_exception(mock_logger):
         mock_logger.error.assert_called_with(f"Error removing file '{temp_file_path}': Simulated permission error")
 
     shutil.rmtree(temp_dir)
+
+
+# -------------------------
+# write_file_atomic
+# -------------------------
+def test_write_file_atomic_success(tmp_path):
+    file_path = tmp_path / "data.json"
+    file_path.write_bytes(b"old")
+
+    assert write_file_atomic(file_path, b"new") is True
+    assert file_path.read_bytes() == b"new"
+    assert oct(file_path.stat().st_mode & 0o777) == oct(0o644)
+    assert os.listdir(tmp_path) == ["data.json"]
+
+
+def test_write_file_atomic_failure_removes_temp_file(tmp_path):
+    with patch("app.filehandler.os.replace", side_effect=OSError("rename failed")):
+        assert write_file_atomic(tmp_path / "data.json", b"new") is False
+    assert os.listdir(tmp_path) == []
+
+
+def test_write_file_atomic_missing_directory(tmp_path):
+    assert write_file_atomic(tmp_path / "missing" / "data.json", b"new") is False
+
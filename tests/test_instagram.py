@@ -5,7 +5,7 @@ import pytest
 from cryptography.fernet import Fernet
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.models.instagram import InstagramAccount
+from app.models.instagram import KEY_VERSION, LEGACY_KEY_VERSION, InstagramAccount, derive_master_key
 
 
 # -------------------------
@@ -48,9 +48,42 @@ def test_set_username_exception(mock_commit, mock_logger):
     mock_logger.error.assert_called_with(f"Failed to set username for user_id={acc.id}: DB error")
 
 
+def test_set_session_data_successful():
+    acc = InstagramAccount()
+    assert acc.set_session_data('{"uuids": {}}') is True
+    assert acc.session_data == '{"uuids": {}}'
+
+
+@patch("app.models.instagram.logger")
+@patch("app.models.instagram.db.session.commit")
+def test_set_session_data_exception(mock_commit, mock_logger):
+    mock_commit.side_effect = SQLAlchemyError("DB error")
+
+    acc = InstagramAccount(id=1337)
+    assert acc.set_session_data("{}") is False
+
+    mock_logger.error.assert_called_with(f"Failed to set session data for user_id={acc.id}: DB error")
+
+
+@patch("app.models.instagram.instagram_clients")
+def test_set_credentials_discard_session(mock_instagram_clients):
+    acc = InstagramAccount(id=1338, session_data="{}")
+
+    assert acc.set_username("new") is True
+    assert acc.session_data is None
+
+    acc.session_data = "{}"
+    assert acc.set_password("new") is True
+    assert acc.session_data is None
+
+    assert mock_instagram_clients.discard.call_count == 2
+
+
 def test_set_password_successfull():
     acc = InstagramAccount(id=418)
     assert acc.set_password("meow") is True
+    assert acc.key_version == KEY_VERSION
+    assert acc.get_password() == "meow"
 
 
 @patch("app.models.instagram.logger")
@@ -94,6 +127,42 @@ def test_get_password_successfull():
     assert decrypted_password == original_password
 
 
+def test_get_password_rewraps_legacy_password():
+    acc = InstagramAccount(id=7, key_version=LEGACY_KEY_VERSION)
+    acc.salt = base64.urlsafe_b64encode(b"1234567890123456").decode()
+    acc.encrypted_password = acc.derive_legacy_key().encrypt(b"legacySecret").decode()
+
+    assert acc.get_password() == "legacySecret"
+    assert acc.key_version == KEY_VERSION
+
+    # Decrypted with the subkey from now on
+    with patch("app.models.instagram._pbkdf2") as mock_pbkdf2:
+        assert acc.get_password() == "legacySecret"
+    mock_pbkdf2.assert_not_called()
+
+
+@patch("app.models.instagram.logger")
+@patch("app.models.instagram.db.session.commit")
+def test_get_password_rewrap_database_error(mock_commit, mock_logger):
+    mock_commit.side_effect = SQLAlchemyError("DB error")
+
+    acc = InstagramAccount(id=8, key_version=LEGACY_KEY_VERSION)
+    acc.salt = base64.urlsafe_b64encode(b"1234567890123456").decode()
+    acc.encrypted_password = acc.derive_legacy_key().encrypt(b"legacySecret").decode()
+
+    assert acc.get_password() == "legacySecret"
+    mock_logger.error.assert_called_once_with(f"Database error when re-encrypting password for user_id={acc.id}: DB error")
+
+
+def test_master_key_is_derived_once():
+    derive_master_key.cache_clear()
+
+    with patch("app.models.instagram._pbkdf2", return_value=b"0" * 32) as mock_pbkdf2:
+        assert derive_master_key("password") == derive_master_key("password")
+    mock_pbkdf2.assert_called_once()
+    derive_master_key.cache_clear()
+
+
 @patch("app.models.instagram.logger.exception")
 def test_get_password_exception(mock_logger_exception):
     acc = InstagramAccount(id=42)
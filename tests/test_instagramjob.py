@@ -0,0 +1,148 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.models.instagramjob import DELETE_STORY, POST_STORY, InstagramJob
+from app.models.nightline import Nightline
+from tests.helpers import add_nightline
+
+
+@pytest.fixture
+def jobline(app):
+    nightline = add_nightline("jobline")
+    yield nightline
+    Nightline.remove_nightline("jobline")
+
+
+# -------------------------
+# enqueue
+# -------------------------
+def test_enqueue(jobline):
+    job = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+
+    assert (job.action, job.status_name, job.state) == (POST_STORY, "english", "pending")
+    assert job.created_at is not None
+
+
+@patch("app.models.instagramjob.logger")
+@patch("app.models.instagramjob.db.session.commit", side_effect=SQLAlchemyError("Database error"))
+def test_enqueue_database_error(mock_commit, mock_logger, jobline):
+    assert InstagramJob.enqueue(jobline.id, POST_STORY, "english") is None
+
+    mock_logger.error.assert_called_once_with(
+        f"Database error while enqueueing instagram job 'post_story' for nightline with ID '{jobline.id}': Database error"
+    )
+
+
+def test_enqueue_many(jobline):
+    other = add_nightline("otherjobline")
+
+    jobs = InstagramJob.enqueue_many([jobline.id, other.id], DELETE_STORY)
+
+    assert [(job.nightline_id, job.action, job.state) for job in jobs] == [(jobline.id, DELETE_STORY, "pending"), (other.id, DELETE_STORY, "pending")]
+    Nightline.remove_nightline("otherjobline")
+
+
+def test_enqueue_many_status_names(jobline):
+    jobs = InstagramJob.enqueue_many([jobline.id], POST_STORY, {jobline.id: "english"})
+
+    assert [(job.action, job.status_name) for job in jobs] == [(POST_STORY, "english")]
+
+
+@patch("app.models.instagramjob.logger")
+@patch("app.models.instagramjob.db.session.commit", side_effect=SQLAlchemyError("Database error"))
+def test_enqueue_many_database_error(mock_commit, mock_logger, jobline):
+    assert InstagramJob.enqueue_many([jobline.id], DELETE_STORY) is None
+
+    mock_logger.error.assert_called_once_with("Database error while enqueueing instagram jobs 'delete_story': Database error")
+
+
+# -------------------------
+# claim_next
+# -------------------------
+def test_claim_next_keeps_order_per_nightline(jobline):
+    other = add_nightline("otherjobline")
+    first = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+    second = InstagramJob.enqueue(jobline.id, DELETE_STORY)
+    other_job = InstagramJob.enqueue(other.id, POST_STORY, "german")
+
+    assert InstagramJob.claim_next() == first
+    assert first.state == "running"
+    # The second job of the nightline waits for the first one, the job of the other nightline doesn't
+    assert InstagramJob.claim_next() == other_job
+    assert InstagramJob.claim_next() is None
+
+    first.finish(True)
+    assert InstagramJob.claim_next() == second
+
+    second.finish(True)
+    other_job.finish(True)
+    Nightline.remove_nightline("otherjobline")
+
+
+def test_claim_next_already_claimed(jobline):
+    job = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+
+    with patch("app.models.instagramjob.InstagramJob.query") as mock_query:
+        mock_query.filter_by.return_value.update.return_value = 0  # Claimed by another worker
+        assert InstagramJob.claim_next() is None
+
+    job.finish(True)
+
+
+@patch("app.models.instagramjob.logger")
+@patch("app.models.instagramjob.db.session.query", side_effect=SQLAlchemyError("Database error"))
+def test_claim_next_database_error(mock_query, mock_logger):
+    assert InstagramJob.claim_next() is None
+
+    mock_logger.error.assert_called_once_with("Database error while claiming an instagram job: Database error")
+
+
+# -------------------------
+# requeue_stale
+# -------------------------
+def test_requeue_stale(jobline):
+    job = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+    assert InstagramJob.claim_next() == job
+
+    assert InstagramJob.requeue_stale(600) == 0
+    job.claimed_at = time.time() - 601
+    assert InstagramJob.requeue_stale(600) == 1
+    assert (job.state, job.claimed_at) == ("pending", None)
+
+    job.finish(True)
+
+
+@patch("app.models.instagramjob.logger")
+@patch("app.models.instagramjob.db.session.commit", side_effect=SQLAlchemyError("Database error"))
+def test_requeue_stale_database_error(mock_commit, mock_logger):
+    assert InstagramJob.requeue_stale(600) == 0
+
+    mock_logger.error.assert_called_once_with("Database error while requeueing stale instagram jobs: Database error")
+
+
+# -------------------------
+# finish / to_dict
+# -------------------------
+def test_finish_truncates_error(jobline):
+    job = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+
+    assert job.finish(False, "x" * 300) is True
+    assert job.to_dict()["state"] == "failed"
+    assert len(job.to_dict()["error"]) == 200
+
+
+@patch("app.models.instagramjob.logger")
+def test_finish_database_error(mock_logger, jobline):
+    job = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+
+    with patch("app.models.instagramjob.db.session.commit", side_effect=SQLAlchemyError("Database error")):
+        assert job.finish(True) is False
+
+    mock_logger.error.assert_called_once_with(f"Database error while finishing instagram job '{job.id}': Database error")
+
+
+def test_instagram_job_repr():
+    assert repr(InstagramJob(id=42)) == "InstagramJob('42')"
@@ -0,0 +1,114 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.jobs import InstagramJobWorker
+from app.models.instagramjob import DELETE_STORY, POST_STORY, InstagramJob
+from app.models.nightline import Nightline
+from tests.helpers import add_nightline
+
+
+@pytest.fixture
+def jobline(app):
+    nightline = add_nightline("jobline")
+    yield nightline
+    Nightline.remove_nightline("jobline")
+
+
+# -------------------------
+# process_pending / run_job
+# -------------------------
+@patch("app.models.nightline.Nightline.delete_instagram_story", return_value=True)
+@patch("app.models.nightline.Nightline.post_instagram_story", return_value=True)
+def test_process_pending_runs_jobs_in_order(mock_post_instagram_story, mock_delete_instagram_story, jobline):
+    calls = MagicMock()
+    calls.attach_mock(mock_post_instagram_story, "post")
+    calls.attach_mock(mock_delete_instagram_story, "delete")
+    post = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+    delete = InstagramJob.enqueue(jobline.id, DELETE_STORY)
+
+    assert InstagramJobWorker().process_pending() == 2
+
+    assert [call[0] for call in calls.mock_calls] == ["post", "delete"]
+    mock_post_instagram_story.assert_called_once_with("english")
+    assert (post.state, delete.state) == ("done", "done")
+
+
+def test_process_pending_concurrently(app):
+    worker = InstagramJobWorker()
+    remaining = iter(range(5))
+    threads = set()
+
+    def process_next():
+        threads.add(threading.current_thread().name)
+        return next(remaining, None) is not None
+
+    with patch.object(worker, "process_next", side_effect=process_next), patch.dict(app.config, {"INSTAGRAM_JOB_CONCURRENCY": 3}):
+        assert worker.process_pending() == 5
+
+    assert all(name.startswith("instagram-jobs") for name in threads)
+
+
+@patch("app.models.nightline.Nightline.post_instagram_story", return_value=False)
+def test_run_job_post_fails(mock_post_instagram_story, jobline):
+    job = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+
+    InstagramJobWorker.run_job(job)
+    assert (job.state, job.error) == ("failed", "Uploading the instagram story failed")
+
+
+@patch("app.models.nightline.Nightline.delete_instagram_story", return_value=False)
+def test_run_job_delete_fails(mock_delete_instagram_story, jobline):
+    job = InstagramJob.enqueue(jobline.id, DELETE_STORY)
+
+    InstagramJobWorker.run_job(job)
+    assert (job.state, job.error) == ("failed", "Deleting the instagram story failed")
+
+
+def test_run_job_unknown_action(jobline):
+    job = InstagramJob.enqueue(jobline.id, "unknown")
+
+    InstagramJobWorker.run_job(job)
+    assert (job.state, job.error) == ("failed", "Unknown action: 'unknown'")
+
+
+def test_run_job_nightline_not_found():
+    job = InstagramJob(id=99999, nightline_id=99999, action=POST_STORY)
+
+    with patch.object(InstagramJob, "finish") as mock_finish:
+        InstagramJobWorker.run_job(job)
+    mock_finish.assert_called_once_with(False, "Nightline not found")
+
+
+@patch("app.jobs.logger")
+@patch("app.models.nightline.Nightline.post_instagram_story", side_effect=Exception("Instagram error"))
+def test_run_job_exception(mock_post_instagram_story, mock_logger, jobline):
+    job = InstagramJob.enqueue(jobline.id, POST_STORY, "english")
+
+    InstagramJobWorker.run_job(job)
+    assert (job.state, job.error) == ("failed", "Instagram error")
+    mock_logger.error.assert_called_once_with(f"Error while running instagram job '{job.id}': Instagram error")
+
+
+# -------------------------
+# ensure_started / notify
+# -------------------------
+def test_ensure_started_without_app():
+    worker = InstagramJobWorker()
+    worker.notify()
+
+    assert worker._thread is None
+
+
+@patch("app.jobs.threading.Thread")
+def test_ensure_started_once_per_process(mock_thread, app):
+    worker = InstagramJobWorker()
+    worker._app = app
+    mock_thread.return_value.is_alive.return_value = True
+
+    worker.notify()
+    worker.notify()
+
+    mock_thread.assert_called_once()
+    mock_thread.return_value.start.assert_called_once()
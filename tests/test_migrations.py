@@ -0,0 +1,105 @@
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.app import create_app
+from app.db import db
+from app.migrations import MIGRATIONS, _add_lookup_indexes, run_migrations
+from app.models.apikey import ApiKey
+from app.models.schemamigration import SchemaMigration
+
+LEGACY_SCHEMA = """
+CREATE TABLE statuses (id INTEGER PRIMARY KEY, name VARCHAR(15) NOT NULL UNIQUE, description_de VARCHAR(200) NOT NULL,
+    description_en VARCHAR(200) NOT NULL, description_now_de VARCHAR(200) NOT NULL, description_now_en VARCHAR(200) NOT NULL);
+CREATE TABLE nightlines (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL UNIQUE, status_id INTEGER NOT NULL REFERENCES statuses (id),
+    now BOOLEAN NOT NULL, instagram_media_id VARCHAR(50));
+CREATE TABLE nightline_statuses (id INTEGER PRIMARY KEY, nightline_id INTEGER NOT NULL REFERENCES nightlines (id),
+    status_id INTEGER NOT NULL REFERENCES statuses (id), instagram_story BOOLEAN NOT NULL);
+CREATE TABLE storyslides (id INTEGER PRIMARY KEY, filename VARCHAR(20), path VARCHAR(100),
+    nightline_status_id INTEGER NOT NULL UNIQUE REFERENCES nightline_statuses (id));
+CREATE TABLE api_keys (id INTEGER PRIMARY KEY, key VARCHAR(512) NOT NULL UNIQUE, nightline_id INTEGER NOT NULL REFERENCES nightlines (id));
+CREATE TABLE instagram_accounts (id INTEGER PRIMARY KEY, nightline_id INTEGER NOT NULL UNIQUE REFERENCES nightlines (id), username VARCHAR(50) NOT NULL,
+    encrypted_password VARCHAR(100) NOT NULL, salt VARCHAR(255) NOT NULL, session_data TEXT);
+INSERT INTO statuses VALUES (1, 'default', '', '', '', ''), (2, 'german', '', '', '', ''), (3, 'german-english', '', '', '', '');
+INSERT INTO nightlines VALUES (1, 'legacyline', 2, 0, '');
+INSERT INTO nightline_statuses VALUES (1, 1, 1, 0), (2, 1, 1, 0), (3, 1, 2, 0), (4, 1, 2, 1), (5, 1, 3, 0);
+INSERT INTO storyslides VALUES (1, 'german.png', 'slides/german.png', 4);
+INSERT INTO api_keys VALUES (1, 'legacykey', 1);
+INSERT INTO instagram_accounts VALUES (1, 1, 'legacyuser', 'encrypted', 'salt', NULL);
+"""
+
+
+@pytest.fixture(autouse=True)
+def detached_public_snapshot():
+    """Apps created here must not attach the public snapshot of the test session to their own database"""
+    with patch("app.snapshot.public_snapshot.attach"):
+        yield
+
+
+def create_legacy_app(tmp_path):
+    path = tmp_path / "legacy.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(LEGACY_SCHEMA)
+
+    return create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "ENABLE_ADMIN_ROUTES": False, "API_DOC_PATH": False})
+
+
+# -------------------------
+# run_migrations
+# -------------------------
+def test_migrations_upgrade_legacy_database(tmp_path):
+    legacy_app = create_legacy_app(tmp_path)
+
+    with legacy_app.app_context():
+        inspector = inspect(db.engine)
+        assert "languages" in {column["name"] for column in inspector.get_columns("statuses")}
+        assert {index["name"] for index in inspector.get_indexes("nightlines")} == {"ix_nightlines_status_id"}
+        assert {index["name"] for index in inspector.get_indexes("api_keys")} == {"ix_api_keys_nightline_id"}
+        assert inspector.get_indexes("statuses") == []
+
+        languages = dict(db.session.execute(text("SELECT name, languages FROM statuses")).all())
+        assert (languages["default"], languages["german"], languages["german-english"]) == (0, 1, 3)
+
+        # Duplicates are removed, the one with a story slide is kept. Entries with the default configuration are dropped
+        rows = db.session.execute(text("SELECT id FROM nightline_statuses ORDER BY id")).scalars().all()
+        assert rows == [4]
+
+        # Plaintext API keys are replaced by their digest and stay valid
+        assert db.session.execute(text("SELECT key FROM api_keys")).scalar() == ApiKey.hash_key("legacykey")
+        assert ApiKey.get_nightline_by_key("legacykey").name == "legacyline"
+        assert db.session.execute(text("SELECT generation FROM api_keys")).scalar() == 0
+
+        # Existing Instagram passwords are marked as legacy
+        assert db.session.execute(text("SELECT key_version FROM instagram_accounts")).scalar() == 1
+
+        # Existing story slides have no content hash
+        assert db.session.execute(text("SELECT content_hash FROM storyslides")).scalar() is None
+
+        assert [migration.version for migration in SchemaMigration.query.order_by(SchemaMigration.version)] == [version for version, _, _ in MIGRATIONS]
+        db.session.remove()
+
+
+def test_migrations_add_all_model_columns(tmp_path):
+    legacy_app = create_legacy_app(tmp_path)
+
+    with legacy_app.app_context():
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            # create_all() only creates missing tables, so every column added to an existing one needs a migration
+            assert {column.name for column in table.columns} <= {column["name"] for column in inspector.get_columns(table.name)}, table.name
+        db.session.remove()
+
+
+def test_migrations_are_applied_once(tmp_path):
+    legacy_app = create_legacy_app(tmp_path)
+
+    with legacy_app.app_context():
+        migrate = MagicMock()
+        with patch("app.migrations.MIGRATIONS", MIGRATIONS + [(len(MIGRATIONS) + 1, "Test migration", migrate)]):
+            assert run_migrations() is True
+            assert run_migrations() is True
+        migrate.assert_called_once()
+        db.session.remove()
@@ -1,11 +1,34 @@
+from contextlib import contextmanager
 from unittest.mock import MagicMock, patch
 
+from sqlalchemy import event
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.db import db
 from app.models.apikey import ApiKey
 from app.models.nightline import Nightline
+from app.models.nightlinechange import NightlineChange
 from app.models.nightlinestatus import NightlineStatus
 from app.models.status import Status
+from tests.helpers import add_nightline
+
+def loads_nightlines(statement):
+    """Check if a statement loads nightline objects, by a query or to refresh expired ones"""
+    return statement.startswith("SELECT nightlines.id")
+
+
+@contextmanager
+def record_statements():
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
 
 
 # -------------------------
@@ -37,46 +60,50 @@ def test_get_nightline_not_found(mock_query, mock_logger):
 
 
 # -------------------------
-# add_nightline
+# add_nightlines
 # -------------------------
-@patch("app.models.nightline.logger")
-@patch("app.models.status.Status.get_status")
-def test_add_nightline_missing_default_status(mock_get_status, mock_logger):
-    mock_get_status.return_value = None
+def test_add_nightlines_successfull():
+    add_nightline("bulkline2")
+
+    with patch("app.models.nightline.logger") as mock_logger:
+        keys = Nightline.add_nightlines(["bulkline1", "bulkline2", "bulkline3"])
 
-    assert Nightline.add_nightline("morningline") is None
+    assert [name for name, _ in keys] == ["bulkline1", "bulkline3"]  # 'bulkline2' already exists
+    for name, key in keys:
+        nightline = ApiKey.get_nightline_by_key(key)
+        assert (nightline.name, nightline.status.name, nightline.now) == (name, "default", False)
+    assert NightlineChange.query.filter(NightlineChange.nightline_name.in_(["bulkline1", "bulkline3"])).count() == 2
+    mock_logger.info.assert_called_once_with("Added 2 nightlines, skipped 1 existing nightlines")
 
-    mock_logger.error.assert_called_with(f"Nightline was not added because the default status is missing")
+    for name in ["bulkline1", "bulkline2", "bulkline3"]:
+        Nightline.remove_nightline(name)
 
 
 @patch("app.models.nightline.logger")
-def test_add_nightline_successfull(mock_logger):
-    nightline = Nightline.add_nightline("morningline")
-    assert isinstance(nightline, Nightline)
-    assert nightline.name == "morningline"
+@patch("app.models.status.Status.get_status_info", return_value=None)
+def test_add_nightlines_missing_default_status(mock_get_status, mock_logger):
+    assert Nightline.add_nightlines(["bulkline1"]) is None
 
-    mock_logger.debug.assert_any_call(f"Adding new nightline: '{nightline.name}'")
-    mock_logger.debug.assert_any_call(f"Created nightline: '{nightline.name}'")
-    mock_logger.debug.assert_any_call(f"Created API-Key for nightline: '{nightline.name}'")
-    mock_logger.info.assert_called_once_with(f"Nightline '{nightline.name}' added successfully")
+    mock_logger.error.assert_called_with(f"Nightlines were not added because the default status is missing")
 
 
 @patch("app.models.nightline.logger")
-@patch("app.models.instagram.db.session.commit")
-def test_add_nightline_exception(mock_commit, mock_logger):
-    mock_commit.side_effect = SQLAlchemyError("DB error")
+@patch("app.models.nightline.db.session.commit", side_effect=SQLAlchemyError("DB error"))
+def test_add_nightlines_exception(mock_commit, mock_logger):
+    assert Nightline.add_nightlines(["bulkline1", "bulkline2"]) is None
 
-    assert Nightline.add_nightline("morningline") is None
-
-    mock_logger.error.assert_called_once_with(f"Error adding nightline 'morningline': DB error")
+    assert Nightline.query.filter_by(name="bulkline1").first() is None
+    mock_logger.error.assert_called_once_with(f"Error adding 2 nightlines: DB error")
 
 
 # -------------------------
 # remove_nightline
 # -------------------------
-@patch("app.models.nightline.logger")
-def test_remove_nightline_successful(mock_logger):  # Remove previously created 'morningline'
-    nightline = Nightline.remove_nightline("morningline")
+def test_remove_nightline_successful():
+    add_nightline("morningline")
+
+    with patch("app.models.nightline.logger") as mock_logger:
+        nightline = Nightline.remove_nightline("morningline")
     assert isinstance(nightline, Nightline)
     assert nightline.name == "morningline"
 
@@ -110,7 +137,7 @@ def test_remove_nightline_no_api_key_found(mock_get_api_key, mock_get_nightline,
 @patch("app.models.nightline.db.session.delete")
 def test_remove_nightline_exception(mock_delete, mock_logger):
     mock_delete.side_effect = Exception("Wierd exception occured")
-    Nightline.add_nightline("templine")
+    add_nightline("templine")
 
     assert Nightline.remove_nightline("templine") is None
 
@@ -119,71 +146,79 @@ def test_remove_nightline_exception(mock_delete, mock_logger):
 
 
 # -------------------------
-# list_nightlines
+# get_nightlines
 # -------------------------
-@patch("app.models.nightline.logger")
-def test_list_nightlines_no_filters(mock_logger):
-    templine = Nightline.get_nightline("templine")
-    Testline = Nightline.get_nightline("Testline")
+def test_get_nightlines():
+    nightlines = Nightline.get_nightlines(["templine", "ghostline"])
 
-    assert Nightline.list_nightlines() == [Testline, templine]
+    assert nightlines == {"templine": Nightline.get_nightline("templine")}
 
-    mock_logger.debug.assert_any_call("Listing all nightlines with filters")
-    mock_logger.info.assert_any_call(f"Listed 2 nightlines")
 
-    Nightline.remove_nightline("Testline")
+# -------------------------
+# reference
+# -------------------------
+def test_reference_of_loaded_nightline(app):
+    nightline = Nightline.get_nightline("templine")
 
+    assert Nightline.reference(nightline.id, "templine") is nightline
 
-@patch("app.models.nightline.logger")
-def test_list_nightlines_canceled_filter(mock_logger):
-    templine = Nightline.get_nightline("templine")
-    templine.set_status("canceled")
 
-    assert Nightline.list_nightlines(status_filter="canceled") == [templine]
+def test_reference_updates_by_id_without_loading_the_nightline(app):
+    nightline = Nightline.get_nightline("templine")
+    nightline_id = nightline.id
+    db.session.expunge(nightline)
+
+    reference = Nightline.reference(nightline_id, "templine")
+    with record_statements() as statements:
+        assert reference.set_now(True) is True
+        assert (reference.id, reference.name, reference.now) == (nightline_id, "templine", True)
 
-    mock_logger.debug.assert_any_call("Listing all nightlines with filters")
-    mock_logger.info.assert_any_call(f"Listed 1 nightlines")
+    assert not any(loads_nightlines(statement) for statement in statements)
+    assert reference.status.name == "default"  # Other attributes are loaded on first access
+    assert reference.set_now(False) is True
 
 
 @patch("app.models.nightline.logger")
-def test_list_nightlines_language_filter_english(mock_logger):
-    templine = Nightline.get_nightline("templine")
-    templine.set_status("english")
+def test_reference_of_removed_nightline(mock_logger, app):
+    reference = Nightline.reference(999999, "ghostline")
 
-    assert Nightline.list_nightlines(language_filter="en") == [templine]
+    assert reference.set_now(True) is False
 
-    mock_logger.debug.assert_any_call("Listing all nightlines with filters")
-    mock_logger.info.assert_any_call(f"Listed 1 nightlines")
+    mock_logger.error.assert_called_once()
+    db.session.expunge(reference)
 
 
+# -------------------------
+# list_nightline_rows
+# -------------------------
 @patch("app.models.nightline.logger")
-def test_list_nightlines_language_filter_german(mock_logger):
-    templine = Nightline.get_nightline("templine")
-    templine.set_status("german")
+def test_list_nightline_rows(mock_logger):
+    nightlines = [Nightline.get_nightline("Testline"), Nightline.get_nightline("templine")]
 
-    assert Nightline.list_nightlines(language_filter="de") == [templine]
+    rows = Nightline.list_nightline_rows()
 
-    mock_logger.debug.assert_any_call("Listing all nightlines with filters")
-    mock_logger.info.assert_any_call(f"Listed 1 nightlines")
+    assert [row.public_state() for row in rows] == [nightline.public_state() for nightline in nightlines]
+    mock_logger.debug.assert_any_call("Listing public state of all nightlines")
+    mock_logger.debug.assert_any_call("Listed public state of 2 nightlines")
 
+    Nightline.remove_nightline("Testline")
 
-@patch("app.models.nightline.logger")
-def test_list_nightlines_language_unknown_and_now_filter(mock_logger):
-    assert Nightline.list_nightlines(language_filter="python", now_filter=True) == []
 
-    mock_logger.debug.assert_any_call("Listing all nightlines with filters")
-    mock_logger.info.assert_any_call(f"Listed 0 nightlines")
+def test_get_nightline_rows():
+    rows = Nightline.get_nightline_rows(["templine", "ghostline"])
 
+    assert list(rows) == ["templine"]
+    assert rows["templine"].public_state() == Nightline.get_nightline("templine").public_state()
 
-@patch("app.models.nightline.logger")
-@patch("app.models.nightline.Nightline.query")
-def test_list_nightlines_exception(mock_query, mock_logger):
-    mock_query.join.side_effect = Exception("Unknown error")
 
-    assert Nightline.list_nightlines() == []
+def test_nightline_row_public_state():
+    templine = Nightline.get_nightline("templine")
+    templine.set_status("german")
+    row = Nightline.list_nightline_rows()[0]
 
-    mock_logger.debug.assert_any_call("Listing all nightlines with filters")
-    mock_logger.error.assert_called_once_with("Error while fetching the nightlines: Unknown error")
+    assert row.public_state() == Nightline.get_nightline("templine").public_state()
+    assert repr(row) == "NightlineRow('templine')"
+    assert not hasattr(row, "__dict__")
 
 
 # -------------------------
@@ -207,7 +242,7 @@ def test_set_status_no_valid_status(mock_logger):
 
 
 @patch("app.models.nightline.logger")
-@patch("app.models.status.Status.get_status")
+@patch("app.models.status.Status.get_status_info")
 def test_set_status_exception(mock_get_status, mock_logger):
     mock_get_status.side_effect = Exception("Unknown Error")
 
@@ -230,6 +265,149 @@ def test_reset_status_successfull(mock_logger):
     mock_logger.info.assert_any_call(f"Reset the status of nightline: '{nightline.name}'")
 
 
+# -------------------------
+# reset_all_statuses
+# -------------------------
+def test_reset_all_statuses_successfull():
+    nightline = Nightline.get_nightline("templine")
+    nightline.set_status("german")
+    nightline.set_now(True)
+    version = NightlineChange.get_version()
+
+    with patch("app.models.nightline.public_snapshot") as mock_snapshot:
+        assert Nightline.reset_all_statuses() == ["templine"]
+
+    assert (nightline.status.name, nightline.now) == ("default", False)
+    assert NightlineChange.list_changes(version)[1] == [nightline.public_state()]
+    mock_snapshot.bump.assert_called_once_with()
+
+    # Nothing left to reset
+    assert Nightline.reset_all_statuses() == []
+
+
+@patch("app.models.nightline.logger")
+@patch("app.models.status.Status.get_status_info", return_value=None)
+def test_reset_all_statuses_default_status_missing(mock_get_status_info, mock_logger):
+    assert Nightline.reset_all_statuses() is None
+
+    mock_logger.error.assert_called_once_with("Statuses were not reset because the default status is missing")
+
+
+@patch("app.models.nightline.logger")
+@patch("app.models.nightline.db.session.commit", side_effect=SQLAlchemyError("DB error"))
+def test_reset_all_statuses_database_error(mock_commit, mock_logger):
+    assert Nightline.reset_all_statuses() is None
+
+    mock_logger.error.assert_called_once_with("Error while resetting the status of all nightlines: DB error")
+
+
+# -------------------------
+# update_statuses
+# -------------------------
+def test_update_statuses_successfull():
+    nightline = add_nightline("updateline")
+    templine = Nightline.get_nightline("templine")
+    version = NightlineChange.get_version()
+
+    with patch("app.models.nightline.public_snapshot") as mock_snapshot:
+        assert Nightline.update_statuses([(nightline, Status.get_status_info("german"), True), (templine, None, False)]) is True
+
+    assert (nightline.status.name, nightline.now) == ("german", True)
+    assert (templine.status.name, templine.now) == ("default", False)
+    assert [change["nightline_name"] for change in NightlineChange.list_changes(version)[1]] == ["updateline", "templine"]
+    mock_snapshot.bump.assert_called_once_with("updateline", "templine")  # One bump, after the commit
+
+    Nightline.remove_nightline("updateline")
+
+
+@patch("app.models.nightline.instagram_job_worker")
+def test_update_statuses_does_not_load_nightlines_again(mock_worker):
+    nightlines = [add_nightline("updateline"), add_nightline("otherline")]
+    for nightline in nightlines:
+        assert nightline.now is False  # Loads the nightline, as the route does
+    german = Status.get_status_info("german")
+
+    with record_statements() as statements:
+        assert Nightline.update_statuses([(nightline, german, None) for nightline in nightlines]) is True
+        assert Nightline.enqueue_instagram_stories(nightlines) == []
+
+    assert not any(loads_nightlines(statement) for statement in statements)
+    for name in ("updateline", "otherline"):
+        Nightline.remove_nightline(name)
+
+
+@patch("app.models.nightline.logger")
+@patch("app.models.nightline.db.session.commit", side_effect=SQLAlchemyError("DB error"))
+def test_update_statuses_database_error(mock_commit, mock_logger):
+    nightline = Nightline.get_nightline("templine")
+
+    assert Nightline.update_statuses([(nightline, Status.get_status_info("german"), None)]) is False
+
+    assert nightline.status.name == "default"
+    mock_logger.error.assert_called_once_with("Failed to update the status of 1 nightlines: DB error")
+
+
+# -------------------------
+# enqueue_instagram_stories
+# -------------------------
+@patch("app.models.nightline.instagram_job_worker")
+def test_enqueue_instagram_stories(mock_worker):
+    configured = add_nightline("configuredline")
+    configured.set_status("english")
+    NightlineStatus.update_instagram_story(configured, Status.get_status_info("english"), True)
+    unconfigured = add_nightline("unconfiguredline")
+    unconfigured.set_status("english")
+
+    jobs = Nightline.enqueue_instagram_stories([configured, unconfigured])
+
+    assert [(name, job.action, job.status_name) for name, job in jobs] == [("configuredline", "post_story", "english")]
+    mock_worker.notify.assert_called_once()
+
+    for name in ("configuredline", "unconfiguredline"):
+        Nightline.remove_nightline(name)
+
+
+@patch("app.models.nightline.instagram_job_worker")
+def test_enqueue_instagram_stories_none_configured(mock_worker):
+    assert Nightline.enqueue_instagram_stories([Nightline.get_nightline("templine")]) == []
+    mock_worker.notify.assert_not_called()
+
+
+@patch("app.models.nightline.InstagramJob.enqueue_many", return_value=None)
+def test_enqueue_instagram_stories_database_error(mock_enqueue_many):
+    assert Nightline.enqueue_instagram_stories([Nightline.get_nightline("templine")]) is None
+
+
+# -------------------------
+# enqueue_instagram_story_deletions
+# -------------------------
+@patch("app.models.nightline.instagram_job_worker")
+def test_enqueue_instagram_story_deletions(mock_worker):
+    posted = add_nightline("postedline")
+    posted.add_instagram_account("user", "pass")
+    posted.set_instagram_media_id("media123")
+    queued = add_nightline("queuedline")
+    queued.add_instagram_account("user", "pass")
+    queued.enqueue_instagram_story("default")
+    add_nightline("plainline").set_instagram_media_id("media123")  # No account to delete the story with
+
+    jobs = Nightline.enqueue_instagram_story_deletions()
+
+    assert [(name, job.nightline_id, job.action) for name, job in jobs] == [
+        ("postedline", posted.id, "delete_story"),
+        ("queuedline", queued.id, "delete_story"),
+    ]
+    assert mock_worker.notify.call_count == 2
+
+    for name in ("postedline", "queuedline", "plainline"):
+        Nightline.remove_nightline(name)
+
+
+@patch("app.models.nightline.InstagramJob.enqueue_many", return_value=None)
+def test_enqueue_instagram_story_deletions_database_error(mock_enqueue_many):
+    assert Nightline.enqueue_instagram_story_deletions() is None
+
+
 # -------------------------
 # set_now
 # -------------------------
@@ -261,6 +439,8 @@ def test_get_instagram_story_config_story_false():
     nightline = Nightline.get_nightline("templine")
     nightline.set_status("technical-issues")
 
+    # Not configured, so no entry is stored and the default applies
+    assert NightlineStatus.get_nightline_status(nightline.id, nightline.status_id).id is None
     assert nightline.get_instagram_story_config() is False
 
 
@@ -271,14 +451,6 @@ def test_get_instagram_story_config_story_true():
     assert nightline.get_instagram_story_config() is True
 
 
-@patch("app.models.nightline.NightlineStatus.get_nightline_status")
-def test_get_instagram_story_config_story_nightline_status_none(mock_get_nightline_status):
-    mock_get_nightline_status.return_value = None
-    nightline = Nightline.get_nightline("templine")
-
-    assert nightline.get_instagram_story_config() is False
-
-
 # -------------------------
 # set_instagram_media_id
 # -------------------------
@@ -323,10 +495,12 @@ def test_get_api_key():
 @patch("app.models.nightline.logger")
 def test_renew_api_key_successfull(mock_logger):
     nightline = Nightline.get_nightline("templine")
-    old_api_key = nightline.get_api_key().key
+    old_key_hash = nightline.get_api_key().key_hash
 
-    assert nightline.renew_api_key() is True
-    assert nightline.get_api_key().key != old_api_key
+    api_key = nightline.renew_api_key()
+    assert isinstance(api_key, str)
+    assert nightline.get_api_key().key_hash == ApiKey.hash_key(api_key) != old_key_hash
+    assert nightline.get_api_key().generation == 1
 
     mock_logger.debug.assert_any_call(f"Renew api key of nightline: '{nightline.name}'")
     mock_logger.info.assert_called_once_with(f"API key for nightline '{nightline.name}' renewed successfully")
@@ -339,7 +513,7 @@ def test_renew_api_key_no_api_key_found(mock_get_api_key, mock_logger):
 
     nightline = Nightline.get_nightline("templine")
 
-    assert nightline.renew_api_key() is False
+    assert nightline.renew_api_key() is None
 
     mock_logger.debug.assert_any_call(f"Renew api key of nightline: '{nightline.name}'")
     mock_logger.warning.assert_called_once_with(f"No API key found for nightline: '{nightline.name}'")
@@ -352,7 +526,7 @@ def test_renew_api_key_database_error(mock_commit, mock_logger):
 
     nightline = Nightline.get_nightline("templine")
 
-    assert nightline.renew_api_key() is False
+    assert nightline.renew_api_key() is None
 
     mock_logger.debug.assert_any_call(f"Renew api key of nightline: '{nightline.name}'")
     mock_logger.error.assert_called_once_with(f"Database error while renewing API key for nightline '{nightline.name}': Database error")
@@ -533,23 +707,10 @@ def test_post_instagram_story_bad_status(mock_logger):
     mock_logger.warning.assert_called_once_with(f"No status with name '{status_name}' found.")
 
 
-@patch("app.models.nightline.logger")
-@patch("app.models.nightlinestatus.NightlineStatus.get_nightline_status")
-def test_post_instagram_story_nightline_status_not_found(mock_get_nightline_status, mock_logger):
-    nightline = Nightline.get_nightline("templine")
-    Status.add_status("custom_status", "", "", "", "")
-
-    mock_get_nightline_status.return_value = None
-
-    status_name = "custom_status"
-    assert nightline.post_instagram_story(status_name) is False
-
-    mock_logger.warning.assert_called_once_with(f"NightlineStatus not found for status '{status_name}' and nightline '{nightline.name}'.")
-
-
 @patch("app.models.nightline.logger")
 def test_post_instagram_story_instagram_story_posts_turned_off_for_status(mock_logger):
     nightline = Nightline.get_nightline("templine")
+    Status.add_status("custom_status", "", "", "", "")
 
     status_name = "custom_status"
     assert nightline.post_instagram_story(status_name) is False
@@ -1,11 +1,17 @@
+import hashlib
 import io
 from unittest.mock import patch
 
 import pytest
+from PIL import Image
 
 from app.config import Config
+from app.models.apikey import ApiKey
+from app.models.instagramjob import InstagramJob
 from app.models.nightline import Nightline
 from app.models.nightlinestatus import NightlineStatus
+from app.models.status import Status
+from tests.helpers import add_nightline
 
 
 @pytest.fixture
@@ -49,7 +55,7 @@ def test_set_status_using_admin_api_key_nightline_not_found(client, auth_header_
 
 
 def test_require_api_key_nightline_in_kwargs_invalid_key(client):
-    nightline = Nightline.add_nightline("testline")
+    nightline = add_nightline("testline")
 
     headers = {"Authorization": "invalid-key"}
 
@@ -57,13 +63,36 @@ def test_require_api_key_nightline_in_kwargs_invalid_key(client):
     assert_message(response, "Invalid API key", 403)
 
 
+def test_require_api_key_key_of_other_nightline(client):
+    other = add_nightline("otherline")
+
+    response = client.patch("/nightline/testline/status", headers={"Authorization": other.renew_api_key()}, json={"status": "english"})
+    assert_message(response, "Invalid API key", 403)
+
+    Nightline.remove_nightline("otherline")
+
+
+def test_require_api_key_resolves_nightline_once(client, auth_header_needs_key):
+    nightline = Nightline.get_nightline("testline")
+    auth_header_needs_key["Authorization"] = nightline.renew_api_key()
+
+    with patch("app.routes.decorators.ApiKey.get_nightline_by_key", wraps=ApiKey.get_nightline_by_key) as mock_resolve, patch(
+        "app.models.nightline.Nightline.get_nightline"
+    ) as mock_get_nightline:
+        response = client.patch("/nightline/testline/now", headers=auth_header_needs_key, json={"now": False})
+
+    assert_message(response, "Now value successfully set to 'False'", 200)
+    mock_resolve.assert_called_once_with(auth_header_needs_key["Authorization"])
+    mock_get_nightline.assert_not_called()
+
+
 # -------------------------
 # nightline/<nightline_name>/status [patch]
 # -------------------------
 def test_set_status_success(client, auth_header_needs_key):
     nightline = Nightline.get_nightline("testline")
 
-    auth_header_needs_key["Authorization"] = nightline.get_api_key().key
+    auth_header_needs_key["Authorization"] = nightline.renew_api_key()
 
     response = client.patch(
         "/nightline/testline/status",
@@ -76,7 +105,7 @@ def test_set_status_success(client, auth_header_needs_key):
 def test_set_status_invalid_status(client, auth_header_needs_key):
     nightline = Nightline.get_nightline("testline")
 
-    auth_header_needs_key["Authorization"] = nightline.get_api_key().key
+    auth_header_needs_key["Authorization"] = nightline.renew_api_key()
 
     response = client.patch(
         "/nightline/testline/status",
@@ -87,38 +116,43 @@ def test_set_status_invalid_status(client, auth_header_needs_key):
     assert_message(response, "Updating the status failed", 500)
 
 
-@patch("app.routes.nightline.nightline_routes.Nightline.post_instagram_story", return_value=False)
-def test_set_status_posting_story_slide_fails(mock_post_instagram_story, client, auth_header_needs_key):
+@patch("app.routes.nightline.nightline_routes.Nightline.enqueue_instagram_story", return_value=None)
+def test_set_status_queueing_story_post_fails(mock_enqueue_instagram_story, client, auth_header_needs_key):
     nightline = Nightline.get_nightline("testline")
     NightlineStatus.update_instagram_story(nightline, nightline.status, True)
 
-    auth_header_needs_key["Authorization"] = nightline.get_api_key().key
+    auth_header_needs_key["Authorization"] = nightline.renew_api_key()
 
     response = client.patch(
         "/nightline/testline/status",
         headers=auth_header_needs_key,
         json={"status": "english"},
     )
-    assert_message(response, "Status updated but uploading an instagram story post failed", 500)
+    assert_message(response, "Status updated but queueing the instagram story post failed", 500)
 
 
-@patch("app.routes.nightline.nightline_routes.Nightline.post_instagram_story")
-def test_set_status_posting_story_slide_success(mock_post_instagram_story, client, auth_header_needs_key):
-    mock_post_instagram_story.return_value = True
-
+@patch("app.models.nightline.instagram_job_worker")
+def test_set_status_queues_story_post(mock_instagram_job_worker, client, auth_header_needs_key):
     nightline = Nightline.get_nightline("testline")
     NightlineStatus.update_instagram_story(nightline, nightline.status, True)
 
     payload = {"status": "english"}
 
-    auth_header_needs_key["Authorization"] = nightline.get_api_key().key
+    auth_header_needs_key["Authorization"] = nightline.renew_api_key()
 
-    response = client.patch(
-        "/nightline/testline/status",
-        headers=auth_header_needs_key,
-        json=payload,
-    )
+    with patch("app.models.nightline.Nightline.post_instagram_story") as mock_post_instagram_story:
+        response = client.patch(
+            "/nightline/testline/status",
+            headers=auth_header_needs_key,
+            json=payload,
+        )
     assert_message(response, "Status successfully updated to: 'english'", 200)
+    mock_post_instagram_story.assert_not_called()  # Posted in the background
+    mock_instagram_job_worker.notify.assert_called_once()
+
+    job = InstagramJob.get_job(nightline.id, response.get_json()["job_id"])
+    assert (job.action, job.status_name, job.state) == ("post_story", "english", "pending")
+    job.finish(True)
 
 
 # -------------------------
@@ -143,21 +177,35 @@ def test_reset_status_resetting_failes(mock_reset_status, client, auth_header_ad
     assert_message(response, "Resetting the status failed", 500)
 
 
-@patch("app.routes.nightline.nightline_routes.Nightline.delete_instagram_story", return_value=False)
-def test_reset_status_deleting_instagram_story_fails(mock_delete_instagram_story, client, auth_header_admin):
+@patch("app.routes.nightline.nightline_routes.Nightline.enqueue_instagram_story_deletion", return_value=None)
+def test_reset_status_queueing_story_deletion_fails(mock_enqueue_instagram_story_deletion, client, auth_header_admin):
+    nightline = Nightline.get_nightline("testline")
+    nightline.add_instagram_account("user", "pass")
+
+    response = client.delete(
+        f"/nightline/{nightline.name}/status",
+        headers=auth_header_admin,
+    )
+    assert_message(response, "Status successfully reset but queueing the deletion of the current instagram story failed", 500)
+
+    nightline.delete_instagram_account()
+
+
+def test_reset_status_success(client, auth_header_admin):
     nightline = Nightline.get_nightline("testline")
-    nightline.set_instagram_media_id("exampleID")
 
     response = client.delete(
         f"/nightline/{nightline.name}/status",
         headers=auth_header_admin,
     )
-    assert_message(response, "Staus successfully reset but deleting the current instagram story failed", 500)
+    assert_message(response, "Status successfully reset to: 'default'", 200)
+    assert "job_id" not in response.get_json()  # No instagram account
 
 
-@patch("app.routes.nightline.nightline_routes.Nightline.delete_instagram_story", return_value=True)
-def test_reset_status_success(mock_delete_instagram_story, client, auth_header_admin):
+@patch("app.models.nightline.instagram_job_worker")
+def test_reset_status_queues_story_deletion(mock_instagram_job_worker, client, auth_header_admin):
     nightline = Nightline.get_nightline("testline")
+    nightline.add_instagram_account("user", "pass")
 
     response = client.delete(
         f"/nightline/{nightline.name}/status",
@@ -165,6 +213,11 @@ def test_reset_status_success(mock_delete_instagram_story, client, auth_header_a
     )
     assert_message(response, "Status successfully reset to: 'default'", 200)
 
+    job = InstagramJob.get_job(nightline.id, response.get_json()["job_id"])
+    assert (job.action, job.state) == ("delete_story", "pending")
+    job.finish(True)
+    nightline.delete_instagram_account()
+
 
 # -------------------------
 # nightline/<nightline_name>/status/config [patch]
@@ -197,14 +250,6 @@ def test_configure_nightline_status_invalid_status(client, auth_header_admin):
     assert_message(response, "Status 'unknown' not found", 404)
 
 
-@patch("app.routes.nightline.nightline_routes.NightlineStatus.get_nightline_status", return_value=False)
-def test_configure_nightline_status_nightline_status_not_found(mock_get_nightline_status, client, auth_header_admin):
-    data = {"status": "english", "instagram_story": False}
-
-    response = client.patch("/nightline/testline/status/config", headers=auth_header_admin, json=data)
-    assert_message(response, "Status 'english' for nightline 'testline' not found", 500)
-
-
 def test_configure_nightline_status_no_story_slide_configured(client, auth_header_admin):
     data = {"status": "english", "instagram_story": True}
 
@@ -238,6 +283,12 @@ def test_update_now_nightline_not_found(client, auth_header_admin):
     assert_message(response, "Nightline 'invalidnightline' not found", 404)
 
 
+@patch("app.models.nightline.Nightline.set_now", return_value=False)
+def test_update_now_failed(mock_set_now, client, auth_header_admin):
+    response = client.patch("/nightline/testline/now", headers=auth_header_admin, json={"now": True})
+    assert_message(response, "Updating the now value failed", 500)
+
+
 # -------------------------
 # nightline/<nightline_name>/instagram [post]
 # -------------------------
@@ -314,7 +365,10 @@ def test_delete_instagram_account_already_deleted(client, auth_header_admin):
 def test_upload_story_slide_success(mock_validate_image, client, auth_header_admin):
     status_name = "english"
 
-    image_data = io.BytesIO(b"\xff\xd8\xff\xe0" + b"FakeJPEGContent")
+    image_data = io.BytesIO()
+    Image.new("RGB", (100, 100), "red").save(image_data, "JPEG")
+    content_hash = hashlib.sha256(image_data.getvalue()).hexdigest()
+    image_data.seek(0)
     image_data.name = "test.jpg"
 
     data = {"status": status_name, "image": (image_data, image_data.name)}
@@ -322,6 +376,21 @@ def test_upload_story_slide_success(mock_validate_image, client, auth_header_adm
     response = client.post("/nightline/testline/story", headers=auth_header_admin, content_type="multipart/form-data", data=data)
     assert_message(response, f"Story for status '{status_name}' added successfully", 201)
 
+    story_slide = NightlineStatus.get_nightline_status(Nightline.get_nightline("testline").id, Status.get_status_info(status_name).id).instagram_story_slide
+    assert story_slide.content_hash == content_hash
+    with Image.open(story_slide.story_path) as story:
+        assert story.size == (1080, 1920)
+
+
+def test_upload_story_slide_too_large(app, client, auth_header_admin):
+    data = {"status": "english", "image": (io.BytesIO(b"\xff\xd8\xff\xe0" + b"0" * 2048), "test.jpg")}
+
+    with patch.dict(app.config, {"MAX_CONTENT_LENGTH": 1024}):
+        response = client.post("/nightline/testline/story", headers=auth_header_admin, content_type="multipart/form-data", data=data)
+
+    assert response.status_code == 413
+    assert "message" in response.get_json()
+
 
 @patch("app.routes.nightline.nightline_routes.validate_image", return_value=True)
 def test_upload_story_slide_nightline_not_found(mock_validate_image, client, auth_header_admin):
@@ -350,8 +419,8 @@ def test_upload_story_slide_status_not_found(mock_validate_image, client, auth_h
 
 
 @patch("app.routes.nightline.nightline_routes.validate_image", return_value=True)
-@patch("app.routes.nightline.nightline_routes.NightlineStatus.get_nightline_status", return_value=False)
-def test_upload_story_slide_nightline_status_not_found(mock_get_nightline_status, mock_validate_image, client, auth_header_admin):
+@patch("app.routes.nightline.nightline_routes.NightlineStatus.store_nightline_status", return_value=None)
+def test_upload_story_slide_storing_nightline_status_fails(mock_store_nightline_status, mock_validate_image, client, auth_header_admin):
     status_name = "english"
 
     image_data = io.BytesIO(b"\xff\xd8\xff\xe0" + b"FakeJPEGContent")
@@ -360,7 +429,7 @@ def test_upload_story_slide_nightline_status_not_found(mock_get_nightline_status
     data = {"status": status_name, "image": (image_data, image_data.name)}
 
     response = client.post(f"/nightline/testline/story", headers=auth_header_admin, content_type="multipart/form-data", data=data)
-    assert_message(response, f"Status '{status_name}' not found", 404)
+    assert_message(response, f"Uploading a story slide for status '{status_name}' failed", 500)
 
 
 @patch("app.routes.nightline.nightline_routes.validate_image", return_value=True)
@@ -401,17 +470,91 @@ def test_remove_story_slide_status_not_found(client, auth_header_admin):
     assert_message(response, f"Status '{status_name}' not found", 404)
 
 
-@patch("app.routes.nightline.nightline_routes.NightlineStatus.get_nightline_status", return_value=False)
-def test_remove_story_slide_nightline_status_not_found(mock_get_nightline_status, client, auth_header_admin):
+def test_remove_story_slide_no_story_slide_set(client, auth_header_admin):
     status_name = "english"
 
     response = client.delete(f"/nightline/testline/story", headers=auth_header_admin, json={"status": status_name})
-    assert_message(response, f"Status '{status_name}' not found", 404)
+    assert_message(response, f"No story slide set for status '{status_name}' of nightline 'testline'", 404)
 
 
+@patch("app.routes.nightline.nightline_routes.NightlineStatus.get_nightline_status")
 @patch("app.routes.nightline.nightline_routes.StorySlide.remove_story_slide", return_value=False)
-def test_remove_story_slide_removing_fails(mock_remove_story_slide, client, auth_header_admin):
+def test_remove_story_slide_removing_fails(mock_remove_story_slide, mock_get_nightline_status, client, auth_header_admin):
     status_name = "english"
 
     response = client.delete(f"/nightline/testline/story", headers=auth_header_admin, json={"status": status_name})
     assert_message(response, f"Deleting a story slide for status '{status_name}' failed", 500)
+
+
+# -------------------------
+# nightline/<nightline_name>/token [post]
+# -------------------------
+def test_issue_token_disabled(client, auth_header_admin):
+    with patch.object(Config, "API_TOKEN_SECRET", ""):
+        response = client.post("/nightline/testline/token", headers=auth_header_admin)
+    assert_message(response, "Tokens are not enabled", 501)
+
+
+def test_issue_token_nightline_not_found(client, auth_header_admin):
+    response = client.post("/nightline/invalidnightline/token", headers=auth_header_admin)
+    assert_message(response, "Nightline 'invalidnightline' not found", 404)
+
+
+def test_issue_token_success(client, auth_header_needs_key):
+    nightline = Nightline.get_nightline("testline")
+    auth_header_needs_key["Authorization"] = nightline.renew_api_key()
+
+    with patch.object(Config, "API_TOKEN_SECRET", "testsecret"):
+        response = client.post("/nightline/testline/token", headers=auth_header_needs_key)
+        assert_message(response, "Token issued successfully", 201)
+
+        auth_header_needs_key["Authorization"] = response.get_json()["token"]
+        with patch("app.routes.decorators.ApiKey.get_nightline_by_key") as mock_get_nightline_by_key:
+            response = client.patch("/nightline/testline/now", headers=auth_header_needs_key, json={"now": False})
+        assert_message(response, "Now value successfully set to 'False'", 200)
+        mock_get_nightline_by_key.assert_not_called()
+
+        # The token passes a reference to the nightline, which is updated without loading it
+        with patch("app.routes.decorators.Nightline.get_nightline") as mock_get_nightline, patch(
+            "app.routes.decorators.Nightline.reference", wraps=Nightline.reference
+        ) as mock_reference:
+            response = client.patch("/nightline/testline/status", headers=auth_header_needs_key, json={"status": "german"})
+        assert_message(response, "Status successfully updated to: 'german'", 200)
+        mock_get_nightline.assert_not_called()
+        mock_reference.assert_called_once_with(nightline.id, "testline")
+
+        # Renewing the API key revokes the token
+        nightline.renew_api_key()
+        response = client.patch("/nightline/testline/now", headers=auth_header_needs_key, json={"now": False})
+        assert_message(response, "Invalid token", 403)
+
+
+# -------------------------
+# nightline/<nightline_name>/jobs/<job_id> [get]
+# -------------------------
+def test_get_job_success(client, auth_header_admin):
+    nightline = Nightline.get_nightline("testline")
+    job = InstagramJob.enqueue(nightline.id, "post_story", "english")
+
+    response = client.get(f"/nightline/testline/jobs/{job.id}", headers=auth_header_admin)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert (data["job_id"], data["action"], data["status_name"], data["state"]) == (job.id, "post_story", "english", "pending")
+
+    job.finish(False, "Uploading the instagram story failed")
+    response = client.get(f"/nightline/testline/jobs/{job.id}", headers=auth_header_admin)
+    assert (response.get_json()["state"], response.get_json()["error"]) == ("failed", "Uploading the instagram story failed")
+
+
+def test_get_job_not_found(client, auth_header_admin):
+    response = client.get("/nightline/testline/jobs/99999", headers=auth_header_admin)
+    assert_message(response, "Job '99999' not found", 404)
+
+
+def test_get_job_nightline_not_found(client, auth_header_admin):
+    response = client.get("/nightline/invalidnightline/jobs/1", headers=auth_header_admin)
+    assert_message(response, "Nightline 'invalidnightline' not found", 404)
+
+
+def test_remove_testline():
+    assert Nightline.remove_nightline("testline") is not None
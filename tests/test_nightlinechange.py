@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db import db
+from app.models.nightline import Nightline
+from app.models.nightlinechange import NightlineChange
+from tests.helpers import add_nightline
+
+
+# -------------------------
+# record
+# -------------------------
+def test_mutators_record_changes():
+    version = NightlineChange.get_version()
+    nightline = add_nightline("changetest")
+    assert NightlineChange.get_version() > version
+
+    version = NightlineChange.get_version()
+    nightline.set_status("english")
+    assert NightlineChange.get_version() > version
+
+    version = NightlineChange.get_version()
+    nightline.set_now(True)
+    assert NightlineChange.get_version() > version
+
+    # Only the latest change per nightline is kept
+    assert NightlineChange.query.filter_by(nightline_name="changetest").count() == 1
+
+    Nightline.remove_nightline("changetest")
+    change = NightlineChange.query.filter_by(nightline_name="changetest").first()
+    assert change.removed is True
+
+
+# -------------------------
+# list_changes
+# -------------------------
+def test_list_changes():
+    nightline1 = add_nightline("changetest1")
+    add_nightline("changetest2")
+    version = NightlineChange.get_version()
+
+    nightline1.set_status("german")
+    Nightline.remove_nightline("changetest2")
+
+    new_version, changed, removed = NightlineChange.list_changes(version)
+    assert new_version == NightlineChange.get_version()
+    assert changed == [nightline1.public_state()]
+    assert changed[0]["status_name"] == "german"
+    assert removed == ["changetest2"]
+
+    assert NightlineChange.list_changes(new_version) == (new_version, [], [])
+
+    Nightline.remove_nightline("changetest1")
+
+
+def test_list_changes_since_zero_lists_all_nightlines():
+    add_nightline("changetest3")
+
+    _, changed, _ = NightlineChange.list_changes(0)
+    assert {entry["nightline_name"] for entry in changed} == {row.nightline_name for row in Nightline.list_nightline_rows()}
+
+    Nightline.remove_nightline("changetest3")
+
+
+# -------------------------
+# initialize
+# -------------------------
+def test_initialize_records_missing_nightlines():
+    add_nightline("changetest4")
+    NightlineChange.query.filter_by(nightline_name="changetest4").delete()
+    db.session.commit()
+
+    assert NightlineChange.initialize() is True
+    assert NightlineChange.query.filter_by(nightline_name="changetest4").count() == 1
+
+    Nightline.remove_nightline("changetest4")
+
+
+@patch("app.models.nightlinechange.logger")
+@patch("app.models.nightlinechange.db.session.commit")
+def test_initialize_database_error(mock_commit, mock_logger):
+    mock_commit.side_effect = SQLAlchemyError("DB error")
+
+    assert NightlineChange.initialize() is False
+    mock_logger.error.assert_called_once_with("Error while initializing the nightline change log: DB error")
+
+
+def test_nightline_change_repr():
+    assert repr(NightlineChange(id=7)) == "NightlineChange('7')"
@@ -0,0 +1,79 @@
+from unittest.mock import patch
+
+from app.models.nightline import Nightline
+from app.nightlineimport import check_nightline_names, import_nightlines, parse_nightline_names
+from tests.helpers import add_nightline
+
+
+# -------------------------
+# parse_nightline_names
+# -------------------------
+def test_parse_nightline_names_csv():
+    assert parse_nightline_names("nightline\nfirstline\n\n secondline ,comment\n", "lines.csv") == ["firstline", "secondline"]
+
+
+def test_parse_nightline_names_csv_without_header():
+    assert parse_nightline_names("firstline\r\nsecondline") == ["firstline", "secondline"]
+
+
+def test_parse_nightline_names_json():
+    assert parse_nightline_names('["firstline", "secondline"]', "lines.JSON") == ["firstline", "secondline"]
+
+
+def test_parse_nightline_names_invalid_json():
+    assert parse_nightline_names("[firstline", "lines.json") is None
+
+
+# -------------------------
+# check_nightline_names
+# -------------------------
+def test_check_nightline_names_valid():
+    assert check_nightline_names(["firstline", " SecondLine "], limit=2) is None
+
+
+def test_check_nightline_names_not_a_list():
+    assert check_nightline_names(None) == "'nightlines' must be a non-empty list of nightline names"
+    assert check_nightline_names([]) == "'nightlines' must be a non-empty list of nightline names"
+
+
+def test_check_nightline_names_too_many():
+    assert check_nightline_names(["firstline", "secondline"], limit=1) == "'nightlines' must be a list of 1 to 1 nightline names"
+
+
+def test_check_nightline_names_invalid_name():
+    assert check_nightline_names(["first-line"]) == "Invalid name format: 'first-line'"
+    assert check_nightline_names([42]) == "Invalid name format: '42'"
+    assert check_nightline_names(["a" * 51]) == f"Invalid name format: '{'a' * 51}'"
+
+
+def test_check_nightline_names_duplicate():
+    assert check_nightline_names(["firstline", "FirstLine"]) == "Nightline 'firstline' is imported more than once"
+
+
+# -------------------------
+# import_nightlines
+# -------------------------
+def test_import_nightlines_in_batches(app):
+    add_nightline("importline2")
+
+    with patch("app.nightlineimport.Nightline.add_nightlines", wraps=Nightline.add_nightlines) as mock_add_nightlines:
+        results = list(import_nightlines(["importline1", "ImportLine2", "importline3"], batch_size=2))
+
+    assert [call.args[0] for call in mock_add_nightlines.call_args_list] == [["importline1", "importline2"], ["importline3"]]
+    assert [result["nightline"] for result in results] == ["importline1", "importline2", "importline3"]
+    assert results[1] == {"nightline": "importline2", "skipped": "already exists"}
+    assert all("api_key" in results[i] for i in (0, 2))
+
+    for name in ["importline1", "importline2", "importline3"]:
+        Nightline.remove_nightline(name)
+
+
+@patch("app.nightlineimport.Nightline.add_nightlines", side_effect=[[("importline1", "key")], None])
+def test_import_nightlines_batch_fails(mock_add_nightlines):
+    results = list(import_nightlines(["importline1", "importline2", "importline3"], batch_size=1))
+
+    assert results == [
+        {"nightline": "importline1", "api_key": "key"},
+        {"error": "Importing the nightlines failed after 1 of 3 nightlines"},
+    ]
+    assert mock_add_nightlines.call_count == 2
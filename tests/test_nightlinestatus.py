@@ -1,111 +1,136 @@
 from unittest.mock import patch
 
+import pytest
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.db import db
 from app.models.nightline import Nightline
 from app.models.nightlinestatus import NightlineStatus
 from app.models.status import Status
+from app.models.storyslide import StorySlide
+from tests.helpers import add_nightline
+
+
+@pytest.fixture
+def statusline(app):
+    nightline = add_nightline("nightlinestatus_line")
+    yield nightline
+    Nightline.remove_nightline("nightlinestatus_line")
 
 
 # -------------------------
 # get_nightline_status
 # -------------------------
-def test_get_nightline_status_successfull():
-    nightline = Nightline.add_nightline("nightlinestatus_line_1")
-    assert isinstance(NightlineStatus.get_nightline_status(nightline.id, nightline.status.id), NightlineStatus)
+def test_get_nightline_status_default(statusline):
+    status = Status.get_status("english")
+
+    nightline_status = NightlineStatus.get_nightline_status(statusline.id, status.id)
+
+    assert (nightline_status.id, nightline_status.nightline_id, nightline_status.status_id) == (None, statusline.id, status.id)
+    assert nightline_status.instagram_story is False
+    assert nightline_status.is_default is True
+
+
+def test_get_nightline_status_stored(statusline):
+    status = Status.get_status("english")
+    NightlineStatus.update_instagram_story(statusline, status, True)
 
+    nightline_status = NightlineStatus.get_nightline_status(statusline.id, status.id)
 
-def test_get_nightline_status_wrong_nightline_id():
-    nightline = Nightline.get_nightline("nightlinestatus_line_1")
-    assert NightlineStatus.get_nightline_status(100, nightline.status.id) is None
+    assert nightline_status.id is not None
+    assert nightline_status.instagram_story is True
+    assert nightline_status.is_default is False
 
 
-def test_get_nightline_status_wrong_status_id():
-    nightline = Nightline.get_nightline("nightlinestatus_line_1")
-    assert NightlineStatus.get_nightline_status(nightline.id, 100) is None
-    Nightline.remove_nightline("nightlinestatus_line_1")
+def test_add_nightline_stores_no_nightline_statuses(statusline):
+    assert NightlineStatus.query.filter_by(nightline_id=statusline.id).count() == 0
 
 
 # -------------------------
-# add_new_status_for_all_nightlines
+# store_nightline_status
 # -------------------------
-@patch("app.models.nightlinestatus.logger")
-def test_add_new_status_for_all_nightlines_successfull(mock_logger):
-    new_status = Status(id=10, name="new_status", description_de="", description_en="", description_now_de="", description_now_en="")
-    db.session.add(new_status)
-    db.session.commit()
+def test_store_nightline_status(statusline):
+    status = Status.get_status("english")
 
-    assert NightlineStatus.add_new_status_for_all_nightlines(new_status) is True
+    nightline_status = NightlineStatus.store_nightline_status(statusline.id, status.id)
 
-    mock_logger.debug.assert_called_once_with(f"Creating NightlineStatus entries for all nightlines with status '{new_status.name}'")
-    mock_logger.info.assert_called_once_with(f"NightlineStatus entries created successfully for status '{new_status.name}'")
+    assert nightline_status.id is not None
+    assert NightlineStatus.store_nightline_status(statusline.id, status.id) is nightline_status
 
 
 @patch("app.models.nightlinestatus.logger")
-@patch("app.models.nightlinestatus.db.session.commit")
-def test_add_new_status_for_all_nightlines_database_error_missing_status_id(mock_commit, mock_logger):
-    mock_commit.side_effect = SQLAlchemyError("Database error")
-
-    status = Status.get_status("new_status")
+@patch("app.models.nightlinestatus.db.session.commit", side_effect=SQLAlchemyError("Database error"))
+def test_store_nightline_status_database_error(mock_commit, mock_logger, statusline):
+    status = Status.get_status("english")
 
-    assert NightlineStatus.add_new_status_for_all_nightlines(status) is False
+    assert NightlineStatus.store_nightline_status(statusline.id, status.id) is None
 
-    mock_logger.debug.assert_called_once_with(f"Creating NightlineStatus entries for all nightlines with status '{status.name}'")
-    mock_logger.error.assert_called_once_with(f"Error creating NightlineStatus entries for status '{status.name}': Database error")
+    mock_logger.error.assert_called_once_with(
+        f"Error storing NightlineStatus entry for nightline with ID: '{statusline.id}' and status with ID: '{status.id}': Database error"
+    )
 
 
 # -------------------------
-# add_statuses_for_new_nightlines
+# prune
 # -------------------------
-@patch("app.models.nightlinestatus.logger")
-@patch("app.models.nightlinestatus.db.session.add")
-def test_add_statuses_for_new_nightlines_database_error(mock_add, mock_logger):
-    mock_add.side_effect = SQLAlchemyError("Database error")
+def test_prune_default(statusline):
+    status = Status.get_status("english")
+    nightline_status = NightlineStatus.store_nightline_status(statusline.id, status.id)
 
-    nightline = Nightline(name="nightlinestatus_line_2", status_id=Status.get_status("default").id, now=False, instagram_media_id="")
+    assert nightline_status.prune() is True
 
-    assert NightlineStatus.add_statuses_for_new_nightlines(nightline) is False
+    assert NightlineStatus.query.filter_by(nightline_id=statusline.id).count() == 0
 
-    mock_logger.debug.assert_called_once_with(f"Creating NightlineStatus entries for all statuses for nightline '{nightline.name}'")
-    mock_logger.error.assert_called_once_with(f"Error creating NightlineStatus entries for nightline '{nightline.name}': Database error")
 
+def test_prune_keeps_configured(statusline):
+    status = Status.get_status("english")
+    nightline_status = NightlineStatus.store_nightline_status(statusline.id, status.id)
+    db.session.add(StorySlide(filename="english.png", path="./english.png", nightline_status_id=nightline_status.id))
+    db.session.commit()
 
-@patch("app.models.nightlinestatus.logger")
-def test_add_statuses_for_new_nightlines_successfull(mock_logger):
-    nightline = Nightline(name="nightlinestatus_line_2", status_id=Status.get_status("default").id, now=False, instagram_media_id="")
-    db.session.add(nightline)
+    assert nightline_status.prune() is True
+
+    assert NightlineStatus.query.filter_by(nightline_id=statusline.id).count() == 1
+    db.session.delete(nightline_status.instagram_story_slide)
     db.session.commit()
 
-    assert NightlineStatus.add_statuses_for_new_nightlines(nightline) is True
 
-    all_nls = NightlineStatus.query.filter_by(nightline_id=nightline.id).all()
-    assert len(all_nls) == len(Status.query.all())
+def test_prune_unsaved(statusline):
+    assert NightlineStatus.get_nightline_status(statusline.id, Status.get_status("english").id).prune() is True
+
 
-    for nls in all_nls:
-        assert nls.instagram_story is False
+@patch("app.models.nightlinestatus.logger")
+def test_prune_database_error(mock_logger, statusline):
+    nightline_status = NightlineStatus.store_nightline_status(statusline.id, Status.get_status("english").id)
 
-    mock_logger.debug.assert_called_once_with(f"Creating NightlineStatus entries for all statuses for nightline '{nightline.name}'")
-    mock_logger.info.assert_called_once_with(f"NightlineStatus entries created successfully for nightline '{nightline.name}'")
+    with patch("app.models.nightlinestatus.db.session.commit", side_effect=SQLAlchemyError("Database error")):
+        assert nightline_status.prune() is False
 
-    NightlineStatus.delete_statuses_for_nightline(nightline)
-    db.session.delete(nightline)
-    db.session.commit()
+    mock_logger.error.assert_called_once_with(f"Error removing default NightlineStatus entry with ID: '{nightline_status.id}': Database error")
 
 
 # -------------------------
 # delete_status_for_all_nightlines
 # -------------------------
 @patch("app.models.nightlinestatus.logger")
-def test_delete_status_for_all_nightlines_no_nightlinestatuses_deleted(mock_logger):
-    new_status = Status(id=11, name="no_nightline_statuses_status", description_de="", description_en="", description_now_de="", description_now_en="")
+def test_delete_status_for_all_nightlines_successfull(mock_logger, statusline):
+    status = Status.get_status("english")
+    NightlineStatus.update_instagram_story(statusline, status, True)
 
-    Nightline.add_nightline("testline")
+    assert NightlineStatus.delete_status_for_all_nightlines(status) is True
 
-    assert NightlineStatus.delete_status_for_all_nightlines(new_status) is False
+    assert NightlineStatus.query.filter_by(status_id=status.id).count() == 0
+    mock_logger.debug.assert_any_call(f"Deleting NightlineStatus entries for status: '{status.name}'")
+    mock_logger.info.assert_any_call(f"Successfully deleted '1' NightlineStatus entries for status: '{status.name}'")
 
-    mock_logger.debug.assert_any_call(f"Deleting NightlineStatus entries for status: '{new_status.name}'")
-    mock_logger.warning.assert_called_once_with(f"No NightlineStatus entries found for status: '{new_status.name}'")
+
+@patch("app.models.nightlinestatus.logger")
+def test_delete_status_for_all_nightlines_no_nightlinestatuses_stored(mock_logger):
+    status = Status.get_status("english")
+
+    assert NightlineStatus.delete_status_for_all_nightlines(status) is True
+
+    mock_logger.info.assert_called_once_with(f"Successfully deleted '0' NightlineStatus entries for status: '{status.name}'")
 
 
 @patch("app.models.nightlinestatus.logger")
@@ -121,99 +146,63 @@ def test_delete_status_for_all_nightlines_database_error(mock_commit, mock_logge
     mock_logger.error.assert_called_once_with(f"Error deleting NightlineStatus entries for status: '{status.name}': Database error")
 
 
-@patch("app.models.nightlinestatus.logger")
-def test_delete_status_for_all_nightlines_successfull(mock_logger):
-    status = Status.get_status("new_status")
-    amount_nls = len(Nightline.list_nightlines())
-
-    assert NightlineStatus.delete_status_for_all_nightlines(status) is True
-
-    mock_logger.debug.assert_called_once_with(f"Deleting NightlineStatus entries for status: '{status.name}'")
-    mock_logger.info.assert_called_once_with(f"Successfully deleted '{amount_nls}' NightlineStatus entries for status: '{status.name}'")
-
-    db.session.delete(status)
-    db.session.commit()
-
-    Nightline.remove_nightline("testline")
-
-
 # -------------------------
 # delete_statuses_for_nightline
 # -------------------------
 @patch("app.models.nightlinestatus.logger")
-def test_delete_statuses_for_nightline_successfull(mock_logger):
-    nightline = Nightline.add_nightline("nightlinestatus_line_3")
-    amount_statuses = len(Status.list_statuses())
-
-    assert NightlineStatus.delete_statuses_for_nightline(nightline) is True
+def test_delete_statuses_for_nightline_successfull(mock_logger, statusline):
+    NightlineStatus.update_instagram_story(statusline, Status.get_status("english"), True)
+    NightlineStatus.update_instagram_story(statusline, Status.get_status("german"), True)
 
-    mock_logger.debug(f"Deleting all NightlineStatus entries for nightline: '{nightline.name}'")
-    mock_logger.info(f"Successfully deleted '{amount_statuses}' NightlineStatus entries for nightline: '{nightline.name}'")
+    assert NightlineStatus.delete_statuses_for_nightline(statusline) is True
 
-    NightlineStatus.add_statuses_for_new_nightlines(nightline)
+    assert NightlineStatus.query.filter_by(nightline_id=statusline.id).count() == 0
+    mock_logger.info.assert_any_call(f"Successfully deleted '2' NightlineStatus entries for nightline: '{statusline.name}'")
 
 
 @patch("app.models.nightlinestatus.logger")
 @patch("app.models.nightlinestatus.db.session.commit")
-def test_delete_statuses_for_nightline_database_error(mock_commit, mock_logger):
+def test_delete_statuses_for_nightline_database_error(mock_commit, mock_logger, statusline):
     mock_commit.side_effect = SQLAlchemyError("Database error")
 
-    nightline = Nightline.get_nightline("nightlinestatus_line_3")
+    assert NightlineStatus.delete_statuses_for_nightline(statusline) is False
 
-    assert NightlineStatus.delete_statuses_for_nightline(nightline) is False
-
-    mock_logger.debug(f"Deleting all NightlineStatus entries for nightline: '{nightline.name}'")
-    mock_logger.error(f"Error deleting NightlineStatus entries for nightline: '{nightline.name}': Database error")
-
-
-@patch("app.models.nightlinestatus.logger")
-def test_delete_statuses_for_nightline_no_nightlinestatuses_deleted(mock_logger):
-    nightline = Nightline(name="no_nightline_statuses_nightline", status_id=Status.get_status("default").id, now=False, instagram_media_id="")
-
-    assert NightlineStatus.delete_statuses_for_nightline(nightline) is False
-
-    mock_logger.debug(f"Deleting all NightlineStatus entries for nightline: '{nightline.name}'")
-    mock_logger.warning(f"No NightlineStatus entries found for nightline: '{nightline.name}'")
-
-    Nightline.remove_nightline("nightlinestatus_line_3")
+    mock_logger.debug.assert_called_once_with(f"Deleting all NightlineStatus entries for nightline: '{statusline.name}'")
+    mock_logger.error.assert_called_once_with(f"Error deleting NightlineStatus entries for nightline: '{statusline.name}': Database error")
 
 
 # -------------------------
 # update_instagram_story
 # -------------------------
 @patch("app.models.nightlinestatus.logger")
-def test_update_instagram_story_successfull(mock_logger):
-    nightline = Nightline.add_nightline("nightlinestatus_line_4")
+def test_update_instagram_story_successfull(mock_logger, statusline):
     status = Status.get_status("english")
 
-    assert NightlineStatus.update_instagram_story(nightline, status, True) is True
+    assert NightlineStatus.update_instagram_story(statusline, status, True) is True
 
-    mock_logger.debug.assert_any_call(f"Updating instagram_story for nightline: '{nightline.name}' and status: '{status.name}' to 'True'")
-    mock_logger.info.assert_any_call(f"Updated instagram_story for nightline: '{nightline.name}', status: '{status.name}' to 'True'")
+    assert NightlineStatus.query.filter_by(nightline_id=statusline.id, status_id=status.id, instagram_story=True).count() == 1
+    mock_logger.debug.assert_any_call(f"Updating instagram_story for nightline: '{statusline.name}' and status: '{status.name}' to 'True'")
+    mock_logger.info.assert_any_call(f"Updated instagram_story for nightline: '{statusline.name}', status: '{status.name}' to 'True'")
 
 
-@patch("app.models.nightlinestatus.logger")
-@patch("app.models.nightlinestatus.db.session.commit")
-def test_update_instagram_story_database_error(mock_commit, mock_logger):
-    mock_commit.side_effect = SQLAlchemyError("Database error")
-
-    nightline = Nightline.get_nightline("nightlinestatus_line_4")
+def test_update_instagram_story_back_to_default(statusline):
     status = Status.get_status("english")
+    NightlineStatus.update_instagram_story(statusline, status, True)
 
-    assert NightlineStatus.update_instagram_story(nightline, status, True) is False
+    assert NightlineStatus.update_instagram_story(statusline, status, False) is True
 
-    mock_logger.debug.assert_called_once_with(f"Updating instagram_story for nightline: '{nightline.name}' and status: '{status.name}' to 'True'")
-    mock_logger.error.assert_called_once_with(f"Error updating instagram_story for nightline: '{nightline.name}', status: '{status.name}': Database error")
+    # The default configuration isn't stored
+    assert NightlineStatus.query.filter_by(nightline_id=statusline.id).count() == 0
 
 
 @patch("app.models.nightlinestatus.logger")
-def test_update_instagram_story_no_nightlinestatuses_found(mock_logger):
-    nightline = Nightline.get_nightline("nightlinestatus_line_4")
-    status = Status(id=11, name="no_nightline_statuses_status", description_de="", description_en="", description_now_de="", description_now_en="")
+@patch("app.models.nightlinestatus.db.session.commit")
+def test_update_instagram_story_database_error(mock_commit, mock_logger, statusline):
+    mock_commit.side_effect = SQLAlchemyError("Database error")
 
-    assert NightlineStatus.update_instagram_story(nightline, status, False) is False
+    status = Status.get_status("english")
 
-    mock_logger.debug.assert_called_once_with(f"Updating instagram_story for nightline: '{nightline.name}' and status: '{status.name}' to 'False'")
-    mock_logger.warning.assert_called_once_with(f"No NightlineStatus entry found for nightline: '{nightline.name}' and status: {status.name}")
+    assert NightlineStatus.update_instagram_story(statusline, status, True) is False
 
-    Nightline.remove_nightline(nightline.name)
+    mock_logger.debug.assert_called_once_with(f"Updating instagram_story for nightline: '{statusline.name}' and status: '{status.name}' to 'True'")
+    mock_logger.error.assert_called_once_with(f"Error updating instagram_story for nightline: '{statusline.name}', status: '{status.name}': Database error")
@@ -1,4 +1,9 @@
+from unittest.mock import patch
+
+from app.events import stream_limiter
 from app.models.nightline import Nightline
+from app.models.nightlinechange import NightlineChange
+from tests.helpers import add_nightline
 
 
 def assert_message(response, expected_substring, status_code):
@@ -12,7 +17,7 @@ def assert_message(response, expected_substring, status_code):
 # public/<nightline_name>
 # -------------------------
 def test_get_nightline_status_success(client):
-    Nightline.add_nightline("pubroutetest")
+    add_nightline("pubroutetest")
 
     response = client.get("/public/pubroutetest")
     assert response.status_code == 200
@@ -44,11 +49,11 @@ def test_get_nightline_status_invalid_name(client):
 # public/all
 # -------------------------
 def test_get_all_nightlines(client):
-    pubroutetest1 = Nightline.add_nightline("pubroutetest1")
-    pubroutetest2 = Nightline.add_nightline("pubroutetest2")
+    pubroutetest1 = add_nightline("pubroutetest1")
+    pubroutetest2 = add_nightline("pubroutetest2")
     pubroutetest2.set_status("english")
     pubroutetest2.set_now(True)
-    pubroutetest3 = Nightline.add_nightline("pubroutetest3")
+    pubroutetest3 = add_nightline("pubroutetest3")
     pubroutetest3.set_status("german")
 
     resp = client.get("/public/all")
@@ -99,3 +104,219 @@ def test_invalid_now_value_returns_400(client):
     Nightline.remove_nightline("pubroutetest1")
     Nightline.remove_nightline("pubroutetest2")
     Nightline.remove_nightline("pubroutetest3")
+
+
+# -------------------------
+# ETag / If-None-Match
+# -------------------------
+def test_get_nightline_status_etag_not_modified(client):
+    nightline = add_nightline("pubetagtest")
+
+    response = client.get("/public/pubetagtest")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/public/pubetagtest", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+
+    nightline.set_now(True)
+    response = client.get("/public/pubetagtest", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json()["now"] is True
+
+    Nightline.remove_nightline("pubetagtest")
+
+
+def test_get_nightline_status_etag_unchanged_by_other_nightline(client):
+    add_nightline("pubetagtest1")
+    etag = client.get("/public/pubetagtest1").headers["ETag"]
+
+    other = add_nightline("pubetagtest2")
+    other.set_status("english")
+
+    response = client.get("/public/pubetagtest1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    all_response = client.get("/public/all", headers={"If-None-Match": etag})
+    assert all_response.status_code == 200
+
+    Nightline.remove_nightline("pubetagtest1")
+    Nightline.remove_nightline("pubetagtest2")
+
+
+def test_get_all_nightlines_etag_not_modified(client):
+    etag = client.get("/public/all").headers["ETag"]
+
+    response = client.get("/public/all", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    add_nightline("pubetagtest")
+    response = client.get("/public/all", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    Nightline.remove_nightline("pubetagtest")
+
+
+def test_head_nightline_status(client):
+    add_nightline("pubheadtest")
+
+    response = client.head("/public/pubheadtest")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == client.get("/public/pubheadtest").headers["ETag"]
+    assert response.data == b""
+
+    response = client.head("/public/pubheadtest", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    Nightline.remove_nightline("pubheadtest")
+
+
+def test_head_nightline_status_not_found(client):
+    response = client.head("/public/nonexistent")
+    assert response.status_code == 404
+
+
+def test_head_all_nightlines(client):
+    response = client.head("/public/all")
+    assert response.status_code == 200
+    assert "ETag" in response.headers
+
+    response = client.head("/public/all", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    response = client.head("/public/all?now=maybe")
+    assert response.status_code == 400
+
+
+# -------------------------
+# public/stream
+# -------------------------
+def read_events(response, count):
+    chunks = iter(response.response)
+    return [next(chunks).decode() for _ in range(count)]
+
+
+def test_stream_replays_events_after_last_event_id(client):
+    last_event_id = str(NightlineChange.get_version())
+    nightline = add_nightline("pubstreamtest")
+    nightline.set_status("english")
+    nightline.set_now(True)
+
+    response = client.get("/public/stream", headers={"Last-Event-ID": last_event_id}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    retry, status_event = read_events(response, 2)
+    assert retry.startswith("retry: ")
+    assert status_event.startswith(f"id: {NightlineChange.get_version()}\nevent: status")
+    assert '"status_name":"english"' in status_event  # The latest state of the nightline
+    assert '"now":true' in status_event
+    response.close()
+
+    Nightline.remove_nightline("pubstreamtest")
+
+
+@patch("app.routes.public_routes.STREAM_HEARTBEAT_SECONDS", 0.02)
+@patch("app.routes.public_routes.STREAM_POLL_SECONDS", 0.01)
+def test_stream_sends_changes_made_after_connecting(client):
+    response = client.get("/public/stream", buffered=False)
+    _, keep_alive = read_events(response, 2)
+    assert keep_alive == ": keep-alive\n\n"
+    chunks = iter(response.response)
+
+    # The stream reads the change from the database after the shared snapshot was bumped
+    nightline = add_nightline("pubstreamtest")
+    event = next(chunks).decode()
+    assert event.startswith(f"id: {NightlineChange.get_version()}\nevent: status")
+    assert '"nightline_name":"pubstreamtest"' in event
+    response.close()
+
+    Nightline.remove_nightline(nightline.name)
+
+
+def test_stream_filters_events(client):
+    last_event_id = str(NightlineChange.get_version())
+    nightline1 = add_nightline("pubstreamtest1")
+    nightline2 = add_nightline("pubstreamtest2")
+    nightline1.set_status("english")
+    nightline2.set_status("german")
+    nightline2.set_now(True)
+
+    response = client.get("/public/stream?language=de", headers={"Last-Event-ID": last_event_id}, buffered=False)
+    _, german_event = read_events(response, 2)
+    assert '"nightline_name":"pubstreamtest2"' in german_event
+    assert '"now":true' in german_event
+    response.close()
+
+    response = client.get("/public/stream?nightline=pubstreamtest1", headers={"Last-Event-ID": last_event_id}, buffered=False)
+    _, english_event = read_events(response, 2)
+    assert '"nightline_name":"pubstreamtest1"' in english_event
+    response.close()
+
+    Nightline.remove_nightline("pubstreamtest1")
+    Nightline.remove_nightline("pubstreamtest2")
+
+
+@patch("app.routes.public_routes.STREAM_HEARTBEAT_SECONDS", 0.02)
+@patch("app.routes.public_routes.STREAM_POLL_SECONDS", 0.01)
+def test_stream_unknown_last_event_id_and_keep_alive(client):
+    response = client.get("/public/stream", headers={"Last-Event-ID": "unknown-1"}, buffered=False)
+    _, reset_event, keep_alive = read_events(response, 3)
+    assert reset_event == f"id: {NightlineChange.get_version()}\nevent: reset\ndata: {{}}\n\n"
+    assert keep_alive == ": keep-alive\n\n"
+    response.close()
+
+
+def test_stream_last_event_id_of_another_database_sends_reset(client):
+    response = client.get("/public/stream", headers={"Last-Event-ID": str(NightlineChange.get_version() + 1000)}, buffered=False)
+    _, reset_event = read_events(response, 2)
+    assert "event: reset" in reset_event
+    response.close()
+
+
+def test_stream_invalid_filters(client):
+    assert_message(client.get("/public/stream?nightline=.."), "Invalid value for nightline filter", 400)
+    assert client.get("/public/stream?status=a.b").status_code == 400
+
+
+def test_stream_limit(app, client):
+    with patch.dict(app.config, {"EVENT_STREAM_LIMIT": 1}):
+        response = client.get("/public/stream", buffered=False)
+        assert stream_limiter.open == 1
+
+        assert_message(client.get("/public/stream"), "Too many open event streams", 503)
+
+        response.close()
+        assert stream_limiter.open == 0
+
+
+# -------------------------
+# public/changes
+# -------------------------
+def test_get_changes(client):
+    version = client.get("/public/changes?since=0").get_json()["version"]
+
+    nightline = add_nightline("pubchangetest")
+    nightline.set_now(True)
+
+    response = client.get(f"/public/changes?since={version}")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["version"] > version
+    assert [entry["nightline_name"] for entry in data["changed"]] == ["pubchangetest"]
+    assert data["changed"][0]["now"] is True
+    assert data["removed"] == []
+
+    Nightline.remove_nightline("pubchangetest")
+
+    data = client.get(f"/public/changes?since={data['version']}").get_json()
+    assert data["changed"] == []
+    assert data["removed"] == ["pubchangetest"]
+
+
+def test_get_changes_invalid_since(client):
+    assert_message(client.get("/public/changes"), "Invalid value for 'since'", 400)
+    assert_message(client.get("/public/changes?since=-1"), "Invalid value for 'since'", 400)
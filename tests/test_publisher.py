@@ -0,0 +1,99 @@
+import gzip
+import json
+from unittest.mock import patch
+
+from app.models.nightline import Nightline
+from app.publisher import StaticPublisher
+from app.snapshot import load_public_state, public_snapshot
+from tests.helpers import add_nightline
+
+
+def make_publisher(directory):
+    publisher = StaticPublisher()
+    publisher.directory = directory
+    return publisher
+
+
+# -------------------------
+# init_app
+# -------------------------
+@patch("app.publisher.public_snapshot.add_listener")
+def test_init_app_publishes_and_registers_listener(mock_add_listener, tmp_path):
+    publisher = StaticPublisher()
+
+    assert publisher.init_app(str(tmp_path / "static")) is True
+    mock_add_listener.assert_called_once_with(publisher.publish)
+    assert json.loads((tmp_path / "static" / "all.json").read_bytes()) == list(load_public_state().values())
+
+
+@patch("app.publisher.ensure_storage_path_exists", return_value=False)
+def test_init_app_directory_unavailable(mock_ensure, tmp_path):
+    publisher = StaticPublisher()
+    assert publisher.init_app(str(tmp_path)) is False
+    assert publisher.directory is None
+
+
+# -------------------------
+# publish
+# -------------------------
+def test_publish_disabled():
+    assert StaticPublisher().publish() is False
+
+
+def test_publish_all(tmp_path):
+    add_nightline("publishtest")
+    (tmp_path / "removedline.json").write_bytes(b"{}")
+    (tmp_path / "removedline.json.gz").write_bytes(b"")
+
+    assert make_publisher(tmp_path).publish() is True
+
+    entry = json.loads((tmp_path / "publishtest.json").read_bytes())
+    assert entry["nightline_name"] == "publishtest"
+    assert gzip.decompress((tmp_path / "publishtest.json.gz").read_bytes()) == (tmp_path / "publishtest.json").read_bytes()
+    assert entry in json.loads((tmp_path / "all.json").read_bytes())
+    assert not (tmp_path / "removedline.json").exists()
+    assert not (tmp_path / "removedline.json.gz").exists()
+
+    Nightline.remove_nightline("publishtest")
+
+
+def test_publish_single_nightline(tmp_path):
+    nightline = add_nightline("publishtest")
+    publisher = make_publisher(tmp_path)
+
+    nightline.set_status("english")
+    assert publisher.publish("publishtest") is True
+    assert json.loads((tmp_path / "publishtest.json").read_bytes())["status_name"] == "english"
+    assert {entry["nightline_name"] for entry in json.loads((tmp_path / "all.json").read_bytes())} == set(load_public_state())
+
+    Nightline.remove_nightline("publishtest")
+    assert publisher.publish("publishtest") is True
+    assert not (tmp_path / "publishtest.json").exists()
+
+
+def test_publish_uses_snapshot_fragments(tmp_path):
+    nightline = add_nightline("publishtest")
+    fragments, body = public_snapshot.get_fragments()
+
+    with patch.object(public_snapshot, "_build", side_effect=AssertionError("publishing must not query the database")):
+        assert make_publisher(tmp_path).publish("publishtest") is True
+
+    assert (tmp_path / "publishtest.json").read_bytes() == fragments["publishtest"]
+    assert (tmp_path / "all.json").read_bytes() == body
+
+    Nightline.remove_nightline(nightline.name)
+
+
+@patch("app.publisher.logger")
+def test_publish_skips_unsafe_names(mock_logger, tmp_path):
+    assert make_publisher(tmp_path).publish("../etc") is True
+    mock_logger.warning.assert_called_once_with("Not publishing nightline with a name unsafe as filename: '../etc'")
+
+
+@patch("app.publisher.logger")
+@patch("app.publisher.public_snapshot.get_fragments")
+def test_publish_error(mock_get_fragments, mock_logger, tmp_path):
+    mock_get_fragments.side_effect = Exception("DB error")
+
+    assert make_publisher(tmp_path).publish() is False
+    mock_logger.error.assert_called_once_with("Error publishing static snapshot: DB error")
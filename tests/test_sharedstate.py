@@ -0,0 +1,91 @@
+import os
+from unittest.mock import patch
+
+from app.sharedstate import GENERATION, INITIAL_SIZE, SharedMemoryState
+
+
+# -------------------------
+# write / read
+# -------------------------
+def test_new_file_is_empty(tmp_path):
+    shared = SharedMemoryState(str(tmp_path / "state"))
+
+    assert shared.generation() == 0
+    assert shared.read() == (0, b"")
+    assert os.path.getsize(tmp_path / "state") == INITIAL_SIZE
+
+
+def test_creates_missing_directory(tmp_path):
+    shared = SharedMemoryState(str(tmp_path / "instance" / "state"))
+
+    assert shared.generation() == 0
+
+
+def test_write_and_read(tmp_path):
+    shared = SharedMemoryState(str(tmp_path / "state"))
+
+    assert shared.write(lambda payload: payload + b"first") == 2
+    assert shared.write(lambda payload: payload + b",second") == 4
+    assert shared.read() == (4, b"first,second")
+
+
+def test_write_visible_to_other_mapping(tmp_path):
+    writer = SharedMemoryState(str(tmp_path / "state"))
+    reader = SharedMemoryState(str(tmp_path / "state"))
+    assert reader.generation() == 0
+
+    writer.write(lambda payload: b"data")
+    assert reader.generation() == 2
+    assert reader.read() == (2, b"data")
+
+
+def test_write_grows_file(tmp_path):
+    writer = SharedMemoryState(str(tmp_path / "state"))
+    reader = SharedMemoryState(str(tmp_path / "state"))
+    reader.read()
+
+    payload = b"x" * (INITIAL_SIZE + 1)
+    writer.write(lambda current: payload)
+
+    assert os.path.getsize(tmp_path / "state") >= INITIAL_SIZE * 2
+    assert reader.read() == (2, payload)
+
+
+def test_write_after_other_process_grew_file(tmp_path):
+    first = SharedMemoryState(str(tmp_path / "state"))
+    second = SharedMemoryState(str(tmp_path / "state"))
+    second.read()  # Maps the file at its initial size
+
+    payload = b"x" * (INITIAL_SIZE + 1)
+    first.write(lambda current: payload)
+
+    # The whole payload is passed to the update, not the part in the mapping from before the file grew
+    assert second.write(lambda current: current + b"y") == 4
+    assert first.read() == (4, payload + b"y")
+
+
+def test_write_after_interrupted_write(tmp_path):
+    shared = SharedMemoryState(str(tmp_path / "state"))
+    shared.write(lambda payload: b"data")
+    GENERATION.pack_into(shared._open(), 0, 3)  # A writer died while writing
+
+    assert shared.write(lambda payload: payload + b"new") == 4
+    assert shared.read() == (4, b"new")
+
+
+@patch("app.sharedstate.MAX_READ_ATTEMPTS", 3)
+@patch("app.sharedstate.logger")
+def test_read_gives_up_while_writing(mock_logger, tmp_path):
+    shared = SharedMemoryState(str(tmp_path / "state"))
+    GENERATION.pack_into(shared._open(), 0, 1)
+
+    assert shared.read() is None
+    mock_logger.warning.assert_called_once_with(f"Could not read a consistent payload from shared state file: '{tmp_path / 'state'}'")
+
+
+def test_reopens_after_fork(tmp_path):
+    shared = SharedMemoryState(str(tmp_path / "state"))
+    mapping = shared._open()
+
+    with patch("app.sharedstate.os.getpid", return_value=-1):
+        assert shared._open() is not mapping
@@ -0,0 +1,127 @@
+import os
+from unittest.mock import patch
+
+from PIL import Image, ImageCms
+
+from app.slideprocessing import StorySlideRenderer, render_story_slide, story_file_path
+
+
+def create_image(path, size=(200, 100), mode="RGB", color="red", **save_args):
+    Image.new(mode, size, color).save(path, **save_args)
+    return path
+
+
+# -------------------------
+# story_file_path
+# -------------------------
+def test_story_file_path(tmp_path):
+    assert story_file_path(tmp_path / "english.png") == tmp_path / "english.story.jpg"
+
+
+# -------------------------
+# render_story_slide
+# -------------------------
+def test_render_story_slide_geometry(tmp_path):
+    source = create_image(tmp_path / "english.png")
+    target = tmp_path / "english.story.jpg"
+
+    render_story_slide(str(source), str(target))
+
+    with Image.open(target) as story:
+        assert (story.format, story.mode, story.size) == ("JPEG", "RGB", (1080, 1920))
+        assert story.getpixel((540, 960))[0] > 200  # The image is centered
+        assert story.getpixel((540, 10)) == (0, 0, 0)  # On a black background
+
+
+def test_render_story_slide_strips_exif_and_applies_orientation(tmp_path):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated by 90 degrees
+    source = create_image(tmp_path / "english.jpg", size=(1920, 1080), exif=exif.tobytes())
+    target = tmp_path / "english.story.jpg"
+
+    render_story_slide(str(source), str(target))
+
+    with Image.open(target) as story:
+        assert not story.getexif()
+        assert story.getpixel((540, 10))[0] > 200  # Portrait after the rotation, so it fills the slide
+
+
+def test_render_story_slide_converts_colour_profile(tmp_path):
+    icc_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    source = create_image(tmp_path / "english.jpg", icc_profile=icc_profile)
+    target = tmp_path / "english.story.jpg"
+
+    render_story_slide(str(source), str(target))
+
+    with Image.open(target) as story:
+        assert "icc_profile" not in story.info
+
+
+def test_render_story_slide_transparency(tmp_path):
+    source = create_image(tmp_path / "english.png", mode="RGBA", color=(255, 0, 0, 0))
+    target = tmp_path / "english.story.jpg"
+
+    render_story_slide(str(source), str(target))
+
+    with Image.open(target) as story:
+        assert story.getpixel((540, 960)) == (0, 0, 0)
+
+
+# -------------------------
+# StorySlideRenderer.render
+# -------------------------
+def test_render_in_process(app, tmp_path):
+    source = create_image(tmp_path / "english.png")
+    (tmp_path / "english.story.jpg").write_bytes(b"previous slide")
+
+    assert StorySlideRenderer().render(source) == tmp_path / "english.story.jpg"
+
+    with Image.open(tmp_path / "english.story.jpg") as story:
+        assert story.size == (1080, 1920)
+    assert sorted(os.listdir(tmp_path)) == ["english.png", "english.story.jpg"]
+
+
+def test_render_to_target(app, tmp_path):
+    source = create_image(tmp_path / ".english.png.upload", format="PNG")
+
+    assert StorySlideRenderer().render(source, tmp_path / "english.story.jpg") == tmp_path / "english.story.jpg"
+    assert sorted(os.listdir(tmp_path)) == [".english.png.upload", "english.story.jpg"]
+
+
+@patch("app.slideprocessing.logger")
+def test_render_invalid_image(mock_logger, app, tmp_path):
+    source = tmp_path / "english.png"
+    source.write_bytes(b"no image")
+    (tmp_path / "english.story.jpg").write_bytes(b"previous slide")
+
+    assert StorySlideRenderer().render(source) is None
+
+    assert (tmp_path / "english.story.jpg").read_bytes() == b"previous slide"  # Kept along with the slide it belongs to
+    assert sorted(os.listdir(tmp_path)) == ["english.png", "english.story.jpg"]
+    mock_logger.error.assert_called_once()
+
+
+@patch("app.slideprocessing.logger")
+def test_render_in_worker_process_timeout(mock_logger, app, tmp_path):
+    source = create_image(tmp_path / "english.png")
+    (tmp_path / "english.story.jpg").write_bytes(b"previous slide")
+    renderer = StorySlideRenderer()
+
+    with patch.dict(app.config, {"STORY_SLIDE_WORKERS": 1, "STORY_SLIDE_TIMEOUT": 0}):
+        assert renderer.render(source) is None
+
+    assert (tmp_path / "english.story.jpg").read_bytes() == b"previous slide"
+    mock_logger.error.assert_called_once()
+    renderer._executor.shutdown()
+
+
+def test_render_in_worker_process(app, tmp_path):
+    source = create_image(tmp_path / "english.png")
+    renderer = StorySlideRenderer()
+
+    with patch.dict(app.config, {"STORY_SLIDE_WORKERS": 1}):
+        assert renderer.render(source) == tmp_path / "english.story.jpg"
+
+    with Image.open(tmp_path / "english.story.jpg") as story:
+        assert story.size == (1080, 1920)
+    renderer._executor.shutdown()
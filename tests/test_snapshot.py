@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from app.models.nightline import Nightline
+from app.sharedstate import SharedMemoryState
+from app.snapshot import PublicSnapshot, encode_json, public_snapshot
+from tests.helpers import add_nightline
+
+
+STATUS_LANGUAGES = {"default": 0, "german": 0b01, "english": 0b10, "german-english": 0b11}
+
+
+def make_entry(name, status_name="default", now=False):
+    return {
+        "nightline_name": name,
+        "status_name": status_name,
+        "description_de": "",
+        "description_en": "",
+        "description_now_de": "",
+        "description_now_en": "",
+        "now": now,
+    }
+
+
+# -------------------------
+# bump / get_entries
+# -------------------------
+def test_bump_increments_version():
+    snapshot = PublicSnapshot()
+    assert snapshot.version == 0
+    assert snapshot.bump() == 1
+    assert snapshot.version == 1
+
+
+def test_get_entries_rebuilds_once_per_version():
+    snapshot = PublicSnapshot()
+    with patch.object(snapshot, "_build", return_value=({"a": make_entry("a")}, STATUS_LANGUAGES)) as mock_build:
+        snapshot.get_entries()
+        snapshot.get_entries()
+        assert mock_build.call_count == 1
+
+        snapshot.bump()
+        snapshot.get_entries()
+        assert mock_build.call_count == 2
+
+
+def test_get_entries_single_flight():
+    snapshot = PublicSnapshot()
+    calls = []
+
+    def slow_build():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"a": make_entry("a")}, STATUS_LANGUAGES
+
+    with patch.object(snapshot, "_build", side_effect=slow_build):
+        threads = [threading.Thread(target=snapshot.get_entries) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(calls) == 1
+
+
+def test_get_entries_build_error_keeps_snapshot_stale():
+    snapshot = PublicSnapshot()
+    with patch.object(snapshot, "_build", side_effect=[RuntimeError("db down"), ({"a": make_entry("a")}, STATUS_LANGUAGES)]):
+        try:
+            snapshot.get_entries()
+        except RuntimeError:
+            pass
+        assert snapshot.get_nightline("a") == make_entry("a")
+
+
+# -------------------------
+# list_nightlines
+# -------------------------
+def test_list_nightlines_filters():
+    snapshot = PublicSnapshot()
+    entries = {
+        "a": make_entry("a", "german"),
+        "b": make_entry("b", "english", now=True),
+        "c": make_entry("c", "german-english"),
+    }
+    with patch.object(snapshot, "_build", return_value=(entries, STATUS_LANGUAGES)):
+        assert [e["nightline_name"] for e in snapshot.list_nightlines()] == ["a", "b", "c"]
+        assert [e["nightline_name"] for e in snapshot.list_nightlines(status_filter="english")] == ["b"]
+        assert [e["nightline_name"] for e in snapshot.list_nightlines(language_filter="de")] == ["a", "c"]
+        assert [e["nightline_name"] for e in snapshot.list_nightlines(language_filter="en")] == ["b", "c"]
+        assert [e["nightline_name"] for e in snapshot.list_nightlines(now_filter=False)] == ["a", "c"]
+
+
+def test_list_nightlines_language_filter_uses_status_languages():
+    snapshot = PublicSnapshot()
+    entries = {"a": make_entry("a", "custom"), "b": make_entry("b", "german")}
+    with patch.object(snapshot, "_build", return_value=(entries, {"custom": 0b10, "german": 0b01})):
+        assert [e["nightline_name"] for e in snapshot.list_nightlines(language_filter="en")] == ["a"]
+        assert snapshot.get_status_languages() == {"custom": 0b10, "german": 0b01}
+
+
+# -------------------------
+# Nightline mutators
+# -------------------------
+def test_mutators_invalidate_snapshot():
+    version = public_snapshot.version
+    nightline = add_nightline("snapshottest")
+    assert public_snapshot.version > version
+    assert public_snapshot.get_nightline("snapshottest")["status_name"] == "default"
+
+    nightline.set_status("english")
+    assert public_snapshot.get_nightline("snapshottest")["status_name"] == "english"
+
+    nightline.set_now(True)
+    assert public_snapshot.get_nightline("snapshottest")["now"] is True
+
+    Nightline.remove_nightline("snapshottest")
+    assert public_snapshot.get_nightline("snapshottest") is None
+
+
+# -------------------------
+# nightline_version / etag
+# -------------------------
+def test_nightline_version_tracks_changes():
+    snapshot = PublicSnapshot()
+    snapshot.bump("a")
+    snapshot.bump("b")
+    assert snapshot.nightline_version("a") == 1
+    assert snapshot.nightline_version("b") == 2
+    assert snapshot.nightline_version("c") == 0
+
+    # A change without a nightline name affects every nightline
+    snapshot.bump()
+    assert snapshot.nightline_version("a") == 3
+    assert snapshot.nightline_version("c") == 3
+
+    # Several nightlines changed together share a version
+    assert snapshot.bump("a", "b") == 4
+    assert (snapshot.nightline_version("a"), snapshot.nightline_version("b"), snapshot.nightline_version("c")) == (4, 4, 3)
+
+
+def test_etag_changes_with_version():
+    snapshot = PublicSnapshot()
+    etag_all = snapshot.etag()
+    etag_a = snapshot.etag("a")
+
+    snapshot.bump("b")
+    assert snapshot.etag() != etag_all
+    assert snapshot.etag("a") == etag_a
+    assert snapshot.etag("b") != etag_a
+
+
+# -------------------------
+# pre-encoded JSON
+# -------------------------
+def test_encode_json_is_compact_utf8():
+    assert encode_json({"a": "📞", "b": True}) == '{"a":"📞","b":true}'.encode()
+
+
+def test_json_fragments_only_reencoded_on_change():
+    snapshot = PublicSnapshot()
+    builds = [
+        ({"a": make_entry("a"), "b": make_entry("b")}, STATUS_LANGUAGES),
+        ({"a": make_entry("a"), "b": make_entry("b", "english")}, STATUS_LANGUAGES),
+    ]
+    with patch.object(snapshot, "_build", side_effect=builds), patch("app.snapshot.encode_json", side_effect=encode_json) as mock_encode:
+        body = snapshot.list_nightlines_json()
+        assert json.loads(body) == list(builds[0][0].values())
+        assert mock_encode.call_count == 2
+
+        snapshot.bump("b")
+        assert json.loads(snapshot.get_nightline_json("b")) == builds[1][0]["b"]
+        assert mock_encode.call_count == 3
+
+
+def test_list_nightlines_json_filters():
+    snapshot = PublicSnapshot()
+    entries = {"a": make_entry("a", "german"), "b": make_entry("b", "english", now=True)}
+    with patch.object(snapshot, "_build", return_value=(entries, STATUS_LANGUAGES)):
+        assert json.loads(snapshot.list_nightlines_json(now_filter=True)) == [entries["b"]]
+        assert json.loads(snapshot.list_nightlines_json(language_filter="de")) == [entries["a"]]
+        assert snapshot.list_nightlines_json(status_filter="canceled") == b"[]"
+
+
+# -------------------------
+# shared snapshot
+# -------------------------
+def test_shared_snapshot_across_processes(tmp_path):
+    writer = PublicSnapshot()
+    reader = PublicSnapshot()
+    entries = {"a": make_entry("a")}
+
+    with patch.object(writer, "_build", return_value=(entries, STATUS_LANGUAGES)):
+        writer.attach(SharedMemoryState(str(tmp_path / "state")))
+    reader._shared = SharedMemoryState(str(tmp_path / "state"))
+
+    with patch.object(reader, "_build", side_effect=AssertionError("reader must not query the database")):
+        assert reader.get_entries() == entries
+        assert reader.etag() == writer.etag()
+        assert reader.get_status_languages() == STATUS_LANGUAGES
+
+        entries = {"a": make_entry("a", "english")}
+        with patch.object(writer, "_build_nightlines", return_value=entries):
+            version = writer.bump("a")
+
+        assert reader.version == version
+        assert reader.get_nightline("a")["status_name"] == "english"
+        assert reader.etag("a") == writer.etag("a")
+        assert reader.nightline_version("a") == version
+
+
+def test_shared_snapshot_bump_only_loads_changed_nightlines(tmp_path):
+    first = PublicSnapshot()
+    second = PublicSnapshot()
+    with patch.object(first, "_build", return_value=({"a": make_entry("a"), "b": make_entry("b")}, STATUS_LANGUAGES)):
+        first.attach(SharedMemoryState(str(tmp_path / "state")))
+    second._shared = SharedMemoryState(str(tmp_path / "state"))
+
+    with patch.object(first, "_build", side_effect=AssertionError("only the changed nightline may be loaded")), patch.object(
+        second, "_build", side_effect=AssertionError("only the changed nightline may be loaded")
+    ):
+        with patch.object(first, "_build_nightlines", return_value={"a": make_entry("a", "english")}) as mock_build_nightlines:
+            first.bump("a")
+        mock_build_nightlines.assert_called_once_with(("a",))
+
+        # Another process takes over the previous version from the shared state. A missing nightline was removed
+        with patch.object(second, "_build_nightlines", return_value={"c": make_entry("c")}):
+            second.bump("b", "c")
+
+        assert list(first.get_entries()) == ["a", "c"]
+        assert first.get_nightline("a")["status_name"] == "english"
+        assert json.loads(first.list_nightlines_json()) == [make_entry("a", "english"), make_entry("c")]
+        assert first.get_status_languages() == STATUS_LANGUAGES
+
+
+def test_shared_snapshot_attach_resets_token(tmp_path):
+    snapshot = PublicSnapshot()
+    with patch.object(snapshot, "_build", return_value=({}, {})):
+        snapshot.attach(SharedMemoryState(str(tmp_path / "state")))
+        etag = snapshot.etag()
+
+        snapshot.attach(SharedMemoryState(str(tmp_path / "state")))
+        assert snapshot.etag() != etag
+
+        # The payload of an older version of the app isn't read
+        SharedMemoryState(str(tmp_path / "state")).write(lambda payload: b"incompatible payload")
+        snapshot.attach(SharedMemoryState(str(tmp_path / "state")))
+        assert snapshot.get_entries() == {}
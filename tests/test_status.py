@@ -2,8 +2,10 @@ from unittest.mock import patch
 
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.db import db
 from app.models.nightlinestatus import NightlineStatus
-from app.models.status import Status
+from app.models.status import Status, StatusInfo, status_registry
+from app.snapshot import public_snapshot
 
 
 # -------------------------
@@ -129,6 +131,88 @@ def test_list_statuses_database_error(mock_query, mock_logger):
     mock_logger.error.assert_called_once_with(f"Error while fetching the statuses: Database error")
 
 
+# -------------------------
+# set_languages
+# -------------------------
+@patch("app.models.status.logger")
+def test_set_languages_successfully(mock_logger):
+    status = Status.add_status("langstatus", "", "", "", "", languages=0b01)
+    assert status.languages == 0b01
+
+    assert status.set_languages(0b11) is True
+    assert Status.get_status("langstatus").languages == 0b11
+
+    mock_logger.debug.assert_any_call("Set languages of status 'langstatus' to: '3'")
+    mock_logger.info.assert_any_call("Languages of status 'langstatus' set successfully")
+    Status.remove_status("langstatus")
+
+
+@patch("app.models.status.logger")
+@patch("app.models.status.db.session.commit")
+def test_set_languages_database_error(mock_commit, mock_logger):
+    mock_commit.side_effect = SQLAlchemyError("Database error")
+    status = Status.get_status("default")
+
+    assert status.set_languages(0b11) is False
+    assert Status.get_status("default").languages == 0
+
+    mock_logger.error.assert_called_once_with("Failed to set languages of status 'default': Database error")
+
+
+# -------------------------
+# status registry
+# -------------------------
+def test_get_status_info_without_query():
+    status_registry.load()
+
+    with patch("app.models.status.Status.query") as mock_query:
+        status = Status.get_status_info("german")
+        assert isinstance(status, StatusInfo)
+        assert (status.name, status.languages) == ("german", 0b01)
+        assert status_registry.get_by_id(status.id) is status
+        mock_query.order_by.assert_not_called()
+
+
+def test_status_registry_invalidated_on_commit():
+    assert Status.get_status_info("registrystatus") is None
+
+    Status.add_status("registrystatus", "", "", "", "")
+    assert Status.get_status_info("registrystatus").name == "registrystatus"
+
+    Status.remove_status("registrystatus")
+    assert "registrystatus" not in [status.name for status in status_registry.list()]
+
+
+def test_status_registry_ignores_rolled_back_changes():
+    status = Status.get_status("default")
+    status.description_de = "changed"
+    db.session.flush()
+    db.session.rollback()
+
+    assert Status.get_status_info("default").description_de == ""
+
+
+def test_status_registry_reloads_after_change_in_other_process():
+    status_registry.load()
+
+    with patch.object(status_registry, "load") as mock_load:
+        status_registry.get("default")
+        mock_load.assert_not_called()
+
+        public_snapshot.bump()  # A change of the statuses in any process bumps all nightlines
+        status_registry.get("default")
+        mock_load.assert_called_once()
+
+
+def test_status_registry_reloads_on_miss():
+    status_registry.load()
+
+    with patch.object(status_registry, "load") as mock_load:
+        assert status_registry.get("unknown") is None
+        assert status_registry.get_by_id(-1) is None
+        assert mock_load.call_count == 2
+
+
 # -------------------------
 # __repr__
 # -------------------------
@@ -136,3 +220,7 @@ def test_status_repr():
     status = Status(name="test")
 
     assert repr(status) == "Status('test')"
+
+
+def test_status_info_repr():
+    assert repr(Status.get_status_info("default")) == "StatusInfo('default')"
@@ -1,9 +1,13 @@
+import json
+import threading
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 from instagrapi.exceptions import LoginRequired
 
-from app.story_post import delete_story_by_id, login_user, post_story
+from app.config import Config
+from app.story_post import CALL_THREADS, MAX_PENDING_CALLS, InstagramBusyError, InstagramClientPool, delete_story_by_id, login_user, post_story
 
 
 @pytest.fixture
@@ -11,53 +15,45 @@ def mock_client():
     return MagicMock()
 
 
-# -------------------------
-# login_user
-# -------------------------
-def test_login_user_with_valid_session(mock_client):
-    mock_client.load_settings.return_value = {"uuids": "some-uuid"}
-    mock_client.get_timeline_feed.return_value = {}
-
-    with patch("os.path.exists", return_value=True):
-        assert login_user(mock_client, "user", "pass") is True
+@pytest.fixture
+def mock_client_cls():
+    with patch("app.story_post.Client") as mock_client_cls:
+        mock_client_cls.return_value.get_settings.return_value = {"uuids": "some-uuid"}
+        yield mock_client_cls
 
-    mock_client.load_settings.assert_called_once_with("session.json")
-    mock_client.set_settings.assert_called()
-    mock_client.login.assert_called()
-    mock_client.get_timeline_feed.assert_called()
 
+@pytest.fixture
+def mock_account():
+    account = MagicMock()
+    account.id = 1
+    account.username = "user"
+    account.session_data = None
+    account.get_password.return_value = "pass"
+    return account
 
-@patch("app.story_post.logger")
-def test_login_user_with_invalid_session_then_successful_password_login(mock_logger, mock_client):
-    mock_client.load_settings.return_value = {"uuids": "some-uuid"}
-    mock_client.get_settings.return_value = {"uuids": "some-uuid"}
-    mock_client.get_timeline_feed.side_effect = [LoginRequired, {}]
 
-    with patch("os.path.exists", return_value=True):
-        assert login_user(mock_client, "user", "pass") is True
+# -------------------------
+# login_user
+# -------------------------
+def test_login_user_with_session(mock_client):
+    assert login_user(mock_client, "user", "pass", {"uuids": "some-uuid"}) is True
 
-    assert mock_client.login.call_count == 2
-    mock_logger.info.assert_any_call("Session is invalid, need to login via username and password")
+    mock_client.set_settings.assert_called_once_with({"uuids": "some-uuid"})
+    mock_client.login.assert_called_once_with("user", "pass")
+    mock_client.get_timeline_feed.assert_not_called()  # Validated lazily
 
 
 @patch("app.story_post.logger")
 def test_login_user_with_session_exception_then_successful_password_login(mock_logger, mock_client):
-    mock_client.load_settings.return_value = {"uuids": "some-uuid"}
-    mock_client.get_timeline_feed.side_effect = Exception("session error")
-
-    mock_client.login.return_value = True
-    mock_client.dump_settings.return_value = None
+    mock_client.login.side_effect = [Exception("session error"), True]
 
-    with patch("os.path.exists", return_value=True):
-        assert login_user(mock_client, "user", "pass") is True
+    assert login_user(mock_client, "user", "pass", {"uuids": "some-uuid"}) is True
 
-    mock_client.load_settings.assert_called_once_with("session.json")
-    mock_client.set_settings.assert_called()
     assert mock_client.login.call_count == 2
-    mock_client.get_timeline_feed.assert_called()
+    mock_client.set_uuids.assert_called_once_with("some-uuid")
 
     assert mock_logger.info.call_count == 2
-    mock_logger.info.assert_any_call("Couldn't login user using session information: %s" % mock_client.get_timeline_feed.side_effect)
+    mock_logger.info.assert_any_call("Couldn't login user using session information: session error")
     mock_logger.info.assert_any_call("Attempting to login via username and password. username: %s" % "user")
 
 
@@ -65,8 +61,7 @@ def test_login_user_with_session_exception_then_successful_password_login(mock_l
 def test_login_user_without_session_then_password_login_fails(mock_logger, mock_client):
     mock_client.login.return_value = False
 
-    with patch("os.path.exists", return_value=False):
-        assert login_user(mock_client, "user", "pass") is False
+    assert login_user(mock_client, "user", "pass") is False
 
     assert mock_client.login.call_count == 1
 
@@ -78,8 +73,7 @@ def test_login_user_without_session_then_password_login_fails(mock_logger, mock_
 def test_login_user_without_session_then_exception_in_password_login(mock_logger, mock_client):
     mock_client.login.side_effect = Exception("session error")
 
-    with patch("os.path.exists", return_value=False):
-        assert login_user(mock_client, "user", "pass") is False
+    assert login_user(mock_client, "user", "pass") is False
 
     assert mock_client.login.call_count == 1
 
@@ -88,95 +82,221 @@ def test_login_user_without_session_then_exception_in_password_login(mock_logger
     mock_logger.info.assert_any_call("Couldn't login user using username and password: %s" % mock_client.login.side_effect)
 
 
-from pathlib import Path
-
 # -------------------------
-# post_story
+# InstagramClientPool
 # -------------------------
-from unittest.mock import MagicMock, patch
+def test_client_pool_logs_in_once(mock_client_cls, mock_account):
+    pool = InstagramClientPool()
+
+    with patch("app.story_post.login_user", return_value=True) as mock_login_user:
+        assert pool.run(mock_account, lambda cl: "first") == "first"
+        assert pool.run(mock_account, lambda cl: "second") == "second"
+
+    mock_login_user.assert_called_once_with(mock_client_cls.return_value, "user", "pass", None)
+    mock_account.set_session_data.assert_called_once_with(json.dumps({"uuids": "some-uuid"}))
+
+
+def test_client_pool_uses_stored_session(mock_client_cls, mock_account):
+    mock_account.session_data = json.dumps({"uuids": "some-uuid"})
+
+    with patch("app.story_post.login_user", return_value=True) as mock_login_user:
+        InstagramClientPool().run(mock_account, lambda cl: None)
+
+    mock_login_user.assert_called_once_with(mock_client_cls.return_value, "user", "pass", {"uuids": "some-uuid"})
+
+
+def test_client_pool_logs_in_again_if_session_is_invalid(mock_client_cls, mock_account):
+    mock_account.session_data = json.dumps({"uuids": "some-uuid"})
+    action = MagicMock(side_effect=[LoginRequired, "result"])
+
+    with patch("app.story_post.login_user", return_value=True) as mock_login_user:
+        assert InstagramClientPool().run(mock_account, action) == "result"
+
+    assert action.call_count == 2
+    mock_login_user.assert_called_with(mock_client_cls.return_value, "user", "pass", None)
+
+
+def test_client_pool_login_fails(mock_client_cls, mock_account):
+    action = MagicMock()
+
+    with patch("app.story_post.login_user", return_value=False):
+        assert InstagramClientPool().run(mock_account, action) is None
+
+    action.assert_not_called()
+    mock_account.set_session_data.assert_not_called()
+
+
+def test_client_pool_password_not_decryptable(mock_account):
+    mock_account.get_password.return_value = None
+
+    assert InstagramClientPool().run(mock_account, MagicMock()) is None
+
+
+def test_client_pool_discard(mock_client_cls, mock_account):
+    pool = InstagramClientPool()
+
+    with patch("app.story_post.login_user", return_value=True) as mock_login_user:
+        pool.run(mock_account, lambda cl: None)
+        pool.discard(mock_account.id)
+        pool.run(mock_account, lambda cl: None)
+
+    assert mock_login_user.call_count == 2
+
 
-from app.story_post import post_story  # or wherever it's located
+def test_client_pool_open_breaker_fails_fast(mock_client_cls, mock_account):
+    pool = InstagramClientPool()
+    action = MagicMock(side_effect=Exception("Instagram unavailable"))
 
+    with patch("app.story_post.login_user", return_value=True), patch.object(Config, "INSTAGRAM_BREAKER_THRESHOLD", 2):
+        for _ in range(2):
+            with pytest.raises(Exception, match="Instagram unavailable"):
+                pool.run(mock_account, action)
 
-@patch("app.story_post.Client")
+        assert pool.account_breaker(mock_account.id).state == "open"
+        assert pool.run(mock_account, action) is None
+
+    assert action.call_count == 2
+    assert [breaker.to_dict()["failures"] for breaker in pool.breakers()] == [2, 2]
+
+
+def test_client_pool_open_global_breaker_fails_fast(mock_account):
+    pool = InstagramClientPool()
+    for _ in range(pool.breaker.threshold):
+        pool.breaker.record_failure()
+
+    with patch("app.story_post.login_user") as mock_login_user:
+        assert pool.run(mock_account, MagicMock()) is None
+    mock_login_user.assert_not_called()
+
+
+def test_client_pool_login_failures_only_trip_account_breaker(mock_client_cls, mock_account):
+    pool = InstagramClientPool()
+
+    with patch("app.story_post.login_user", return_value=False):
+        pool.run(mock_account, MagicMock())
+
+    assert pool.account_breaker(mock_account.id).to_dict()["failures"] == 1
+    assert pool.breaker.to_dict()["failures"] == 0
+
+
+def test_client_pool_call_deadline(mock_client_cls, mock_account):
+    pool = InstagramClientPool()
+    release = threading.Event()
+
+    with patch("app.story_post.login_user", return_value=True), patch.object(Config, "INSTAGRAM_CALL_TIMEOUT", 0.01):
+        with pytest.raises(TimeoutError):
+            pool.run(mock_account, lambda cl: release.wait(5))
+    release.set()
+
+    # The client may still be in use by the abandoned call, so it's not reused
+    assert mock_account.id not in pool._clients
+    assert pool.account_breaker(mock_account.id).to_dict()["failures"] == 1
+
+
+def test_client_pool_cancels_queued_call_after_deadline(mock_client_cls, mock_account):
+    pool = InstagramClientPool()
+    release = threading.Event()
+    for _ in range(CALL_THREADS):  # Keep all threads busy
+        pool._executor.submit(release.wait, 5)
+    action = MagicMock()
+
+    with patch.object(Config, "INSTAGRAM_CALL_TIMEOUT", 0.01), pytest.raises(TimeoutError):
+        pool._call(action, mock_client_cls.return_value)
+    release.set()
+    pool._executor.shutdown(wait=True)
+
+    action.assert_not_called()
+
+
+def test_client_pool_rejects_calls_when_too_many_are_pending(mock_client_cls):
+    with patch("app.story_post.CALL_THREADS", MAX_PENDING_CALLS):  # Every pending call is running, none is cancelled
+        pool = InstagramClientPool()
+    release = threading.Event()
+
+    with patch.object(Config, "INSTAGRAM_CALL_TIMEOUT", 0.01):
+        for _ in range(MAX_PENDING_CALLS):
+            with pytest.raises(TimeoutError):
+                pool._call(release.wait, 5)
+
+        with pytest.raises(InstagramBusyError, match=f"{MAX_PENDING_CALLS} calls to Instagram are already pending"):
+            pool._call(MagicMock())
+    release.set()
+    pool._executor.shutdown(wait=True)
+
+    # Finished calls free their slots
+    assert all(pool._pending_calls.acquire(blocking=False) for _ in range(MAX_PENDING_CALLS))
+
+
+@patch("app.circuitbreaker.time.monotonic")
+def test_client_pool_open_global_breaker_abandons_account_trial_call(mock_monotonic, mock_account):
+    mock_monotonic.return_value = 100
+    pool = InstagramClientPool()
+    account_breaker = pool.account_breaker(mock_account.id)
+    for _ in range(account_breaker.threshold):
+        account_breaker.record_failure()
+
+    mock_monotonic.return_value = 100 + account_breaker.cooldown  # Only the account breaker is half open
+    with patch.object(pool.breaker, "allow", return_value=False):
+        assert pool.run(mock_account, MagicMock()) is None
+
+    assert account_breaker.allow() is True
+
+
+# -------------------------
+# post_story
+# -------------------------
+@patch("app.story_post.instagram_clients", new_callable=InstagramClientPool)
 @patch("app.story_post.logger")
-def test_post_story_successful(mock_logger, mock_client_cls):
-    # Create mock Client instance
-    mock_client = MagicMock()
-    mock_client_cls.return_value = mock_client
+def test_post_story_successful(mock_logger, mock_pool, mock_client_cls, mock_account):
+    mock_client = mock_client_cls.return_value
 
     # Simulate image upload success
     mock_client.photo_upload_to_story.return_value.pk = "media123"
 
     image_path = Path("/fake/image.jpg")
-    username = "user"
-    password = "pass"
 
     # Patch login_user and os.path.exists
     with patch("app.story_post.login_user", return_value=True) as mock_login_user, patch("os.path.exists", return_value=True):
-        assert post_story(image_path, username, password) == "media123"
+        assert post_story(image_path, mock_account) == "media123"
 
-    mock_login_user.assert_called_once_with(mock_client, username, password)
+    mock_login_user.assert_called_once_with(mock_client, "user", "pass", None)
     mock_client.photo_upload_to_story.assert_called_once_with(image_path)
     mock_logger.info.assert_called_with(f"Story {image_path} with ID: media123, posted successfully.")
 
 
-@patch("app.story_post.Client")
+@patch("app.story_post.instagram_clients", new_callable=InstagramClientPool)
 @patch("app.story_post.logger")
-def test_post_story_login_user_failed(mock_logger, mock_client_cls):
-    # Create mock Client instance
-    mock_client = MagicMock()
-    mock_client_cls.return_value = mock_client
-
+def test_post_story_login_user_failed(mock_logger, mock_pool, mock_client_cls, mock_account):
     image_path = Path("/fake/image.jpg")
-    username = "user"
-    password = "pass"
 
-    # Patch login_user and os.path.exists
-    with patch("app.story_post.login_user", return_value=False) as mock_login_user:
-        assert post_story(image_path, username, password) is None
+    with patch("app.story_post.login_user", return_value=False), patch("os.path.exists", return_value=True):
+        assert post_story(image_path, mock_account) is None
 
-    mock_login_user.assert_called_once_with(mock_client, username, password)
+    mock_client_cls.return_value.photo_upload_to_story.assert_not_called()
 
 
-@patch("app.story_post.Client")
 @patch("app.story_post.logger")
-def test_post_story_image_path_does_not_exist(mock_logger, mock_client_cls):
-    # Create mock Client instance
-    mock_client = MagicMock()
-    mock_client_cls.return_value = mock_client
-
+def test_post_story_image_path_does_not_exist(mock_logger, mock_account):
     image_path = Path("/non/existing/image.jpg")
-    username = "user"
-    password = "pass"
-
-    # Patch login_user and os.path.exists
-    with patch("app.story_post.login_user", return_value=True) as mock_login_user, patch("os.path.exists", return_value=False):
 
-        assert post_story(image_path, username, password) is None
+    with patch("app.story_post.login_user") as mock_login_user, patch("os.path.exists", return_value=False):
+        assert post_story(image_path, mock_account) is None
 
-    mock_login_user.assert_called_once_with(mock_client, username, password)
+    mock_login_user.assert_not_called()
     mock_logger.error.assert_called_with(f"Image not found: {image_path}")
 
 
-@patch("app.story_post.Client")
+@patch("app.story_post.instagram_clients", new_callable=InstagramClientPool)
 @patch("app.story_post.logger")
-def test_post_story_exception_on_upload(mock_logger, mock_client_cls):
-    mock_client = MagicMock()
-    mock_client_cls.return_value = mock_client
-
-    # Simulate image upload success
+def test_post_story_exception_on_upload(mock_logger, mock_pool, mock_client_cls, mock_account):
+    mock_client = mock_client_cls.return_value
     mock_client.photo_upload_to_story.side_effect = Exception("upload error")
 
     image_path = Path("/fake/image.jpg")
-    username = "user"
-    password = "pass"
 
-    # Patch login_user and os.path.exists
-    with patch("app.story_post.login_user", return_value=True) as mock_login_user, patch("os.path.exists", return_value=True):
-        assert post_story(image_path, username, password) is None
+    with patch("app.story_post.login_user", return_value=True), patch("os.path.exists", return_value=True):
+        assert post_story(image_path, mock_account) is None
 
-    mock_login_user.assert_called_once_with(mock_client, username, password)
     mock_client.photo_upload_to_story.assert_called_once_with(image_path)
     mock_logger.error.assert_called_with(f"Failed to post story: upload error")
 
@@ -184,46 +304,37 @@ def test_post_story_exception_on_upload(mock_logger, mock_client_cls):
 # -------------------------
 # delete_story
 # -------------------------
-@patch("app.story_post.Client")
+@patch("app.story_post.instagram_clients", new_callable=InstagramClientPool)
 @patch("app.story_post.logger")
-def test_delete_story_by_id_success(mock_logger, mock_client_cls):
-    mock_client = MagicMock()
-    mock_client_cls.return_value = mock_client
+def test_delete_story_by_id_success(mock_logger, mock_pool, mock_client_cls, mock_account):
+    mock_client = mock_client_cls.return_value
     mock_client.media_delete.return_value = None  # success
 
-    with patch("app.story_post.login_user", return_value=True) as mock_login_user:
-        assert delete_story_by_id("12345", "user", "pass") is True
+    with patch("app.story_post.login_user", return_value=True):
+        assert delete_story_by_id("12345", mock_account) is True
 
-    mock_login_user.assert_called_once_with(mock_client, "user", "pass")
     mock_client.media_delete.assert_called_once_with("12345")
     mock_logger.info.assert_called_once_with("Story with ID 12345 deleted successfully.")
 
 
-@patch("app.story_post.Client")
+@patch("app.story_post.instagram_clients", new_callable=InstagramClientPool)
 @patch("app.story_post.logger")
-def test_delete_story_by_id_login_fails(mock_logger, mock_client_cls):
-    mock_client = MagicMock()
-    mock_client_cls.return_value = mock_client
+def test_delete_story_by_id_login_fails(mock_logger, mock_pool, mock_client_cls, mock_account):
+    with patch("app.story_post.login_user", return_value=False):
+        assert delete_story_by_id("12345", mock_account) is False
 
-    with patch("app.story_post.login_user", return_value=False) as mock_login_user:
-        assert delete_story_by_id("12345", "user", "pass") is False
-
-    mock_login_user.assert_called_once_with(mock_client, "user", "pass")
-    mock_client.media_delete.assert_not_called()
-    mock_logger.info.assert_not_called()
+    mock_client_cls.return_value.media_delete.assert_not_called()
     mock_logger.error.assert_not_called()
 
 
-@patch("app.story_post.Client")
+@patch("app.story_post.instagram_clients", new_callable=InstagramClientPool)
 @patch("app.story_post.logger")
-def test_delete_story_by_id_exception(mock_logger, mock_client_cls):
-    mock_client = MagicMock()
-    mock_client_cls.return_value = mock_client
+def test_delete_story_by_id_exception(mock_logger, mock_pool, mock_client_cls, mock_account):
+    mock_client = mock_client_cls.return_value
     mock_client.media_delete.side_effect = Exception("something went wrong")
 
-    with patch("app.story_post.login_user", return_value=True) as mock_login_user:
-        assert delete_story_by_id("12345", "user", "pass") is False
+    with patch("app.story_post.login_user", return_value=True):
+        assert delete_story_by_id("12345", mock_account) is False
 
-    mock_login_user.assert_called_once_with(mock_client, "user", "pass")
     mock_client.media_delete.assert_called_once_with("12345")
     mock_logger.error.assert_called_once_with("Failed to delete story with ID 12345: something went wrong")
@@ -1,15 +1,20 @@
+import hashlib
+import os
 import tempfile
 from io import BytesIO
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+from PIL import Image
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.datastructures import FileStorage
 
 from app.config import Config
 from app.models.nightline import Nightline
 from app.models.nightlinestatus import NightlineStatus
+from app.models.status import Status
 from app.models.storyslide import StorySlide
+from tests.helpers import add_nightline
 
 sample_jpg = FileStorage(stream=BytesIO(b"fake jpg content"), filename="example.jpg", content_type="image/jpg")
 sample_noextension = FileStorage(stream=BytesIO(b"missing extension"), filename="example", content_type="image/jpeg")
@@ -19,8 +24,8 @@ sample_noextension = FileStorage(stream=BytesIO(b"missing extension"), filename=
 # _save_story_slide_file
 # -------------------------
 def test__save_story_slide_file_validate_file_extension_fails():
-    nightline = Nightline.add_nightline("storyslide_line")
-    nightlinestatus = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline = add_nightline("storyslide_line")
+    nightlinestatus = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide._save_story_slide_file(sample_noextension, nightlinestatus) is None
 
@@ -30,7 +35,7 @@ def test__save_story_slide_file_validate_storage_path_fails(mock_ensure_storage_
     mock_ensure_storage_path_exists.return_value = False
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide._save_story_slide_file(sample_jpg, nightline_status) is None
 
@@ -43,7 +48,7 @@ def test__save_story_slide_file_story_slide_already_exists_overwrite_false(mock_
     mock_check_file_already_exists.return_value = "./fake/existing/path"
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide._save_story_slide_file(sample_jpg, nightline_status, overwrite=False) is None
 
@@ -55,9 +60,9 @@ def test__save_story_slide_file_story_slide_already_exists_overwrite_false(mock_
 @patch("app.models.storyslide.logger")
 @patch("app.models.storyslide.ensure_storage_path_exists")
 @patch("app.models.storyslide.check_file_already_exists")
-@patch("app.models.storyslide.save_file")
+@patch("app.models.storyslide.ingest_file")
 def test__save_story_slide_file_story_slide_already_exists_overwrite_true_save_fails(
-    mock_save_file, mock_check_file_already_exists, mock_ensure_storage_path_exists, mock_logger
+    mock_ingest_file, mock_check_file_already_exists, mock_ensure_storage_path_exists, mock_logger
 ):
     with tempfile.NamedTemporaryFile(suffix=".jpg", delete=True) as tmp:
         tmp.write(b"\xff\xd8\xff\xe0" + b"JPEG TEST")
@@ -65,10 +70,10 @@ def test__save_story_slide_file_story_slide_already_exists_overwrite_true_save_f
 
         mock_ensure_storage_path_exists.return_value = True
         mock_check_file_already_exists.return_value = tmp_path
-        mock_save_file.return_value = False
+        mock_ingest_file.return_value = None
 
         nightline = Nightline.get_nightline("storyslide_line")
-        nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+        nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
         assert StorySlide._save_story_slide_file(sample_jpg, nightline_status, overwrite=True) is None
 
@@ -76,47 +81,100 @@ def test__save_story_slide_file_story_slide_already_exists_overwrite_true_save_f
 
 
 @patch("app.models.storyslide.logger")
-@patch("app.models.storyslide.ensure_storage_path_exists")
-@patch("app.models.storyslide.check_file_already_exists")
-@patch("app.models.storyslide.save_file")
-def test__save_story_slide_file_story_slide_already_exists_overwrite_true_successfully(
-    mock_save_file, mock_check_file_already_exists, mock_ensure_storage_path_exists, mock_logger
+@patch("app.models.storyslide.story_slide_renderer")
+def test__save_story_slide_file_story_slide_already_exists_overwrite_true_successfully(mock_renderer, mock_logger, tmp_path):
+    nightline = Nightline.get_nightline("storyslide_line")
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
+    status_name = nightline_status.status.name
+    existing_file_path = tmp_path / nightline.name / f"{status_name}.png"
+    existing_file_path.parent.mkdir()
+    existing_file_path.write_bytes(b"\x89PNG\r\n\x1a\n" + b"PNG TEST")
+
+    with patch.object(Config, "UPLOAD_FOLDER", str(tmp_path)):
+        upload = FileStorage(stream=BytesIO(b"fake jpg content"), filename="example.jpg", content_type="image/jpg")
+        saved_file = StorySlide._save_story_slide_file(upload, nightline_status, overwrite=True)
+
+    return_path = tmp_path / nightline.name / f"{status_name}.jpg"
+    assert saved_file == (return_path, hashlib.sha256(b"fake jpg content").hexdigest())
+    mock_logger.debug.assert_called_once_with(f"Replacing the already existing story slide: '{existing_file_path}' for status: '{status_name}'")
+    assert not existing_file_path.exists()  # The replaced slide of another file type is removed
+    assert os.listdir(return_path.parent) == [return_path.name]  # The upload was moved into place
+
+
+@patch("app.models.storyslide.ensure_storage_path_exists", return_value=True)
+@patch("app.models.storyslide.check_file_already_exists", return_value=None)
+@patch("app.models.storyslide.ingest_file", return_value="hash")
+@patch("app.models.storyslide.replace_file", return_value=True)
+@patch("app.models.storyslide.story_slide_renderer")
+def test__save_story_slide_file_successfully(
+    mock_renderer, mock_replace_file, mock_ingest_file, mock_check_file_already_exists, mock_ensure_storage_path_exists
 ):
-    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=True) as tmp:
-        tmp.write(b"\xff\xd8\xff\xe0" + b"JPEG TEST")
-        tmp_path = Path(tmp.name)
+    nightline = Nightline.get_nightline("storyslide_line")
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
-        mock_ensure_storage_path_exists.return_value = True
-        mock_check_file_already_exists.return_value = tmp_path
-        mock_save_file.return_value = True
+    return_path = Path(Config.UPLOAD_FOLDER, nightline_status.nightline.name, nightline.status.name + ".jpg")
 
-        nightline = Nightline.get_nightline("storyslide_line")
-        nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    assert StorySlide._save_story_slide_file(sample_jpg, nightline_status, overwrite=True) == (return_path, "hash")
 
-        return_path = Path(Config.UPLOAD_FOLDER, nightline_status.nightline.name, nightline.status.name + ".jpg")
+    # The upload is prepared for instagram before it replaces the story slide
+    upload_path = mock_ingest_file.call_args.args[1]
+    assert upload_path.parent == return_path.parent and upload_path != return_path
+    mock_renderer.render.assert_called_once_with(upload_path, return_path.with_suffix(".story.jpg"))
+    mock_replace_file.assert_called_once_with(upload_path, return_path)
 
-        assert StorySlide._save_story_slide_file(sample_jpg, nightline_status, overwrite=True) == return_path
 
-        mock_logger.debug.assert_called_once_with(f"Replacing the already existing story slide: '{tmp_path}' for status: '{nightline_status.status.name}'")
+@patch("app.models.storyslide.story_slide_renderer")
+def test__save_story_slide_file_unchanged_slide_not_prepared_again(mock_renderer, tmp_path):
+    content = b"\xff\xd8\xff\xe0" + b"JPEG TEST"
+    nightline_status = MagicMock()
+    nightline_status.nightline.name = "storyslide_line"
+    nightline_status.status.name = "english"
+    nightline_status.instagram_story_slide.content_hash = hashlib.sha256(content).hexdigest()
+    (tmp_path / "storyslide_line").mkdir()
+    (tmp_path / "storyslide_line" / "english.story.jpg").write_bytes(b"prepared")
 
-        StorySlide.remove_story_slide(nightline_status)
+    with patch.object(Config, "UPLOAD_FOLDER", str(tmp_path)):
+        upload = FileStorage(stream=BytesIO(content), filename="english.jpg", content_type="image/jpeg")
+        file_path, content_hash = StorySlide._save_story_slide_file(upload, nightline_status, overwrite=True)
 
+    assert (file_path.read_bytes(), content_hash) == (content, nightline_status.instagram_story_slide.content_hash)
+    mock_renderer.render.assert_not_called()
 
-@patch("app.models.storyslide.logger")
-@patch("app.models.storyslide.ensure_storage_path_exists")
-@patch("app.models.storyslide.check_file_already_exists")
-@patch("app.models.storyslide.save_file")
-def test__save_story_slide_file_successfully(mock_save_file, mock_check_file_already_exists, mock_ensure_storage_path_exists, mock_logger):
-    mock_ensure_storage_path_exists.return_value = True
-    mock_check_file_already_exists.return_value = None
-    mock_save_file.return_value = True
 
+def test__save_story_slide_file_rendering_fails_keeps_current_slide(tmp_path):
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, Status.get_status_info("german").id)
+    image = BytesIO()
+    Image.new("RGB", (200, 100), "red").save(image, "PNG")
+
+    with patch.object(Config, "UPLOAD_FOLDER", str(tmp_path)):
+        upload = FileStorage(stream=BytesIO(image.getvalue()), filename="german.png", content_type="image/png")
+        story_slide = StorySlide.update_story_slide(upload, nightline_status)
+        slide_path = Path(story_slide.path)
+        prepared_slide = story_slide.story_path.read_bytes()
+
+        # A truncated image passes the header check but can't be rendered
+        for filename in ("german.png", "german.jpg"):
+            upload = FileStorage(stream=BytesIO(image.getvalue()[:40]), filename=filename, content_type="image/png")
+            assert StorySlide.update_story_slide(upload, nightline_status) is None
+
+    assert story_slide.path == str(slide_path)
+    assert slide_path.read_bytes() == image.getvalue()
+    assert story_slide.story_path.read_bytes() == prepared_slide
+    assert sorted(os.listdir(slide_path.parent)) == ["german.png", "german.story.jpg"]
 
-    return_path = Path(Config.UPLOAD_FOLDER, nightline_status.nightline.name, nightline.status.name + ".jpg")
+    assert StorySlide.remove_story_slide(nightline_status) is True
 
-    assert StorySlide._save_story_slide_file(sample_jpg, nightline_status, overwrite=True) == return_path
+
+# -------------------------
+# story_path
+# -------------------------
+def test_story_path(tmp_path):
+    story_slide = StorySlide(filename="english.png", path=str(tmp_path / "english.png"))
+    assert story_slide.story_path == tmp_path / "english.png"  # Uploaded before slides were prepared for instagram
+
+    (tmp_path / "english.story.jpg").write_bytes(b"story")
+    assert story_slide.story_path == tmp_path / "english.story.jpg"
 
 
 # -------------------------
@@ -125,7 +183,7 @@ def test__save_story_slide_file_successfully(mock_save_file, mock_check_file_alr
 @patch("app.models.storyslide.logger")
 def test_get_story_slide_by_nightline_status_no_story_slide(mock_logger):
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide.get_story_slide_by_nightline_status(nightline_status) is None
 
@@ -138,10 +196,10 @@ def test_get_story_slide_by_nightline_status_no_story_slide(mock_logger):
 @patch("app.models.storyslide.logger")
 @patch("app.models.storyslide.StorySlide._save_story_slide_file")
 def test_get_story_slide_by_nightline_status_successfully(mock__save_story_slide_file, mock_logger):
-    mock__save_story_slide_file.return_value = Path("./fake/path")
+    mock__save_story_slide_file.return_value = (Path("./fake/path"), "hash")
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     story_slide = StorySlide.update_story_slide(sample_jpg, nightline_status)
 
@@ -159,7 +217,7 @@ def test_update_story_slide_saving_fails(mock__save_story_slide_file):
     mock__save_story_slide_file.return_value = None
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide.update_story_slide(sample_jpg, nightline_status) is None
 
@@ -167,10 +225,10 @@ def test_update_story_slide_saving_fails(mock__save_story_slide_file):
 @patch("app.models.storyslide.logger")
 @patch("app.models.storyslide.StorySlide._save_story_slide_file")
 def test_update_story_slide_update_existing_successfully(mock__save_story_slide_file, mock_logger):
-    mock__save_story_slide_file.return_value = "./fake/path"
+    mock__save_story_slide_file.return_value = (Path("./fake/path"), "hash")
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert isinstance(StorySlide.update_story_slide(sample_jpg, nightline_status), StorySlide)
 
@@ -183,11 +241,11 @@ def test_update_story_slide_update_existing_successfully(mock__save_story_slide_
 @patch("app.models.storyslide.StorySlide._save_story_slide_file")
 @patch("app.models.storyslide.db.session.commit")
 def test_update_story_slide_database_error(mock_commit, mock__save_story_slide_file, mock_logger):
-    mock__save_story_slide_file.return_value = "./fake/path"
+    mock__save_story_slide_file.return_value = (Path("./fake/path"), "hash")
     mock_commit.side_effect = SQLAlchemyError("Database error")
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide.update_story_slide(sample_jpg, nightline_status) is None
 
@@ -199,13 +257,15 @@ def test_update_story_slide_database_error(mock_commit, mock__save_story_slide_f
 @patch("app.models.storyslide.logger")
 @patch("app.models.storyslide.StorySlide._save_story_slide_file")
 def test_update_story_slide_create_new_successfully(mock__save_story_slide_file, mock_logger):
-    mock__save_story_slide_file.return_value = "./fake/path"
+    mock__save_story_slide_file.return_value = (Path("./fake/path"), "hash")
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
     StorySlide.remove_story_slide(nightline_status)
 
-    assert isinstance(StorySlide.update_story_slide(sample_jpg, nightline_status), StorySlide)
+    story_slide = StorySlide.update_story_slide(sample_jpg, nightline_status)
+    assert isinstance(story_slide, StorySlide)
+    assert (story_slide.path, story_slide.content_hash) == ("fake/path", "hash")
 
     mock_logger.info.assert_called_once_with(
         f"StorySlide for status: '{nightline_status.status.name}' of nightline: '{nightline_status.nightline.name}' updated successfully"
@@ -218,7 +278,7 @@ def test_update_story_slide_create_new_successfully(mock__save_story_slide_file,
 @patch("app.models.storyslide.logger")
 def test_remove_story_slide_failed_to_remove_file(mock_logger):
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide.remove_story_slide(nightline_status) is False
 
@@ -235,7 +295,7 @@ def test_remove_story_slide_database_error(mock_remove_file, mock_commit, mock_l
     mock_commit.side_effect = SQLAlchemyError("Database error")
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide.remove_story_slide(nightline_status) is False
 
@@ -250,7 +310,7 @@ def test_remove_story_slide_successfully(mock_remove_file, mock_logger):
     mock_remove_file.return_value = True
 
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide.remove_story_slide(nightline_status) is True
 
@@ -260,7 +320,7 @@ def test_remove_story_slide_successfully(mock_remove_file, mock_logger):
 @patch("app.models.storyslide.logger")
 def test_remove_story_slide_no_story_slide_found(mock_logger):
     nightline = Nightline.get_nightline("storyslide_line")
-    nightline_status = NightlineStatus.get_nightline_status(nightline.id, nightline.status.id)
+    nightline_status = NightlineStatus.store_nightline_status(nightline.id, nightline.status.id)
 
     assert StorySlide.remove_story_slide(nightline_status) is False
 
@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.config import Config
+from app.models.apikey import ApiKey
+from app.models.nightline import Nightline
+from app.tokens import NightlineTokens
+from tests.helpers import add_nightline
+
+
+@pytest.fixture
+def token_secret():
+    with patch.object(Config, "API_TOKEN_SECRET", "testsecret"):
+        yield
+
+
+@pytest.fixture
+def tokenline(app, token_secret):
+    nightline = add_nightline("tokenline")
+    yield nightline
+    Nightline.remove_nightline("tokenline")
+
+
+def issue(tokens, nightline):
+    api_key = nightline.get_api_key()
+    return tokens.issue(nightline.id, nightline.name, api_key.generation, api_key.key_hash)
+
+
+# -------------------------
+# enabled / is_token
+# -------------------------
+def test_tokens_disabled_without_secret():
+    with patch.object(Config, "API_TOKEN_SECRET", ""):
+        assert NightlineTokens().enabled is False
+        assert NightlineTokens().verify("nlt1.1.testline.0.signature", "testline") is None
+
+
+def test_is_token():
+    assert NightlineTokens.is_token("nlt1.1.testline.0.signature") is True
+    assert NightlineTokens.is_token("some-api-key") is False
+
+
+# -------------------------
+# issue / verify
+# -------------------------
+def test_verify_valid_token_without_query(tokenline):
+    tokens = NightlineTokens()
+    token = issue(tokens, tokenline)
+
+    with patch("app.models.ApiKey.query") as mock_query:
+        assert tokens.verify(token, "tokenline") == tokenline.id
+    mock_query.assert_not_called()
+
+
+def test_verify_loads_unknown_generation(tokenline):
+    token = issue(NightlineTokens(), tokenline)
+
+    assert NightlineTokens().verify(token, "tokenline") == tokenline.id
+
+
+@pytest.mark.parametrize(
+    "mangle",
+    [
+        lambda token: token[:-1] + ("A" if token[-1] != "A" else "B"),  # Signature
+        lambda token: token.replace(".tokenline.", ".otherline."),  # Nightline name
+        lambda token: token.replace("nlt1.", "nlt2."),  # Prefix
+        lambda token: token.rpartition(".")[0],  # Missing part
+    ],
+)
+def test_verify_rejects_tampered_token(tokenline, mangle):
+    tokens = NightlineTokens()
+    token = mangle(issue(tokens, tokenline))
+
+    assert tokens.verify(token, "tokenline") is None
+
+
+def test_verify_rejects_token_for_other_nightline(tokenline):
+    tokens = NightlineTokens()
+
+    assert tokens.verify(issue(tokens, tokenline), "otherline") is None
+
+
+def test_verify_rejects_token_after_renewal(tokenline):
+    tokens = NightlineTokens()
+    token = issue(tokens, tokenline)
+
+    api_key = tokenline.get_api_key()
+    api_key.set_key()
+    tokens.update(tokenline.id, api_key.generation, api_key.key_hash)
+
+    assert tokens.verify(token, "tokenline") is None
+    assert tokens.verify(issue(tokens, tokenline), "tokenline") == tokenline.id
+
+
+def test_verify_rejects_token_after_renewal_in_other_worker(tokenline):
+    tokens = NightlineTokens()
+    token = issue(tokens, tokenline)
+    tokenline.renew_api_key()  # Only updates the cache of the global instance
+
+    assert tokens.verify(token, "tokenline") == tokenline.id
+    with patch.object(Config, "API_TOKEN_CACHE_SECONDS", 0):
+        tokens.update(tokenline.id, 0, "")  # Expire the cached generation
+        assert tokens.verify(token, "tokenline") is None
+
+
+def test_verify_rejects_token_of_removed_nightline(tokenline):
+    tokens = NightlineTokens()
+    token = issue(tokens, tokenline)
+    nightline_id = tokenline.id
+    Nightline.remove_nightline("tokenline")
+
+    with patch.object(Config, "API_TOKEN_CACHE_SECONDS", 0):
+        tokens.update(nightline_id, 0, "")
+        assert tokens.verify(token, "tokenline") is None
+
+    add_nightline("tokenline")  # For the fixture teardown
@@ -3,12 +3,16 @@ from unittest.mock import patch
 
 import pytest
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import BadRequest
 
 from app.validation import (
+    validate_change_version,
     validate_filters,
     validate_image,
     validate_instagram_credentials,
+    validate_languages,
     validate_request_body,
+    validate_status_updates,
     validate_status_value,
 )
 
@@ -85,6 +89,37 @@ def test_validate_status_value_invalid(status):
         mock_abort.assert_called_once()
 
 
+# -------------------------
+# validate_status_updates
+# -------------------------
+def test_validate_status_updates_valid():
+    updates = [{"nightline": "Line1", "status": "canceled"}, {"nightline": "line2", "now": False}, {"nightline": "line3", "status": "default", "now": True}]
+
+    assert validate_status_updates(updates) is None
+
+
+@pytest.mark.parametrize(
+    "updates, message",
+    [
+        ([], "'updates' must be a list of 1 to 2 status updates"),
+        ({"nightline": "line1"}, "'updates' must be a list of 1 to 2 status updates"),
+        ([{"nightline": "line1", "now": True}] * 3, "'updates' must be a list of 1 to 2 status updates"),
+        (["line1"], "Every update must be an object with a 'nightline' name"),
+        ([{"status": "canceled"}], "Every update must be an object with a 'nightline' name"),
+        ([{"nightline": "line-1", "now": True}], "Invalid name format: 'line-1'"),
+        ([{"nightline": "line1", "now": True}, {"nightline": "LINE1 ", "now": False}], "Nightline 'line1' is updated more than once"),
+        ([{"nightline": "line1"}], "Missing 'status' or 'now' in update of nightline 'line1'"),
+        ([{"nightline": "line1", "status": ""}], "'status' must be a non-empty valid status name"),
+        ([{"nightline": "line1", "now": "true"}], "'now' must be a boolean"),
+    ],
+)
+def test_validate_status_updates_invalid(updates, message):
+    with pytest.raises(BadRequest) as error:
+        validate_status_updates(updates, limit=2)
+
+    assert error.value.data["message"] == message
+
+
 # -------------------------
 # validate_instagram_credentials
 # -------------------------
@@ -115,6 +150,17 @@ def test_validate_image_valid():
     assert validate_image(file) is None
 
 
+def test_validate_image_reads_only_the_header():
+    img_data = BytesIO()
+    Image = pytest.importorskip("PIL.Image")
+    Image.new("RGB", (100, 100)).save(img_data, format="PNG")
+    img_data = BytesIO(img_data.getvalue()[:100])  # Truncated, it fails once it's decoded
+    file = FileStorage(stream=img_data, filename="test.png", content_type="image/png")
+
+    assert validate_image(file) is None
+    assert img_data.tell() == 0  # The file is stored from the start
+
+
 def test_validate_image_unsupported_type():
     file = FileStorage(
         stream=BytesIO(b"not really an image"),
@@ -136,3 +182,33 @@ def test_validate_image_invalid_content():
     with patch("app.validation.abort") as mock_abort:
         validate_image(file)
         mock_abort.assert_called_once_with(400, "Invalid image content")
+
+
+# -------------------------
+# validate_change_version
+# -------------------------
+@pytest.mark.parametrize("since", ["0", "42"])
+def test_validate_change_version_valid(since):
+    assert validate_change_version(since) is None
+
+
+@pytest.mark.parametrize("since", [None, "", "-1", "abc", "1" * 19])
+def test_validate_change_version_invalid(since):
+    with patch("app.validation.abort") as mock_abort:
+        validate_change_version(since)
+        mock_abort.assert_called_once()
+
+
+# -------------------------
+# validate_languages
+# -------------------------
+@pytest.mark.parametrize("languages", [[], ["de"], ["de", "en"]])
+def test_validate_languages_valid(languages):
+    assert validate_languages(languages) is None
+
+
+@pytest.mark.parametrize("languages", [None, "de", ["fr"], [["de"]], [{"de": 1}]])
+def test_validate_languages_invalid(languages):
+    with patch("app.validation.abort") as mock_abort:
+        validate_languages(languages)
+        mock_abort.assert_called_once_with(400, message="Invalid value for 'languages'. Use a list of 'de' and 'en'")
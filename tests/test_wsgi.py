@@ -1,4 +1,8 @@
-def test_wsgi_import():
+from unittest.mock import patch
+
+
+@patch("app.snapshot.public_snapshot.attach")  # The app must not attach the public snapshot of the test session to its database
+def test_wsgi_import(mock_attach):
     import app.wsgi
 
     assert app.wsgi.app is not None